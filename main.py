@@ -2,9 +2,12 @@
 Professional Video Enhancer with Color Correction
 A modular video enhancement tool supporting FFmpeg and HandBrake processing
 """
+import argparse
+import json
 import os
+import re
 import sys
-from playsound import playsound
+import time
 
 # Fix Windows console encoding for Unicode characters
 if sys.platform == "win32":
@@ -17,9 +20,10 @@ if sys.platform == "win32":
 
 # Import our custom modules
 from modules.system_checker import check_system_requirements
-from modules.preset_manager import choose_color_preset
-from modules.handbrake_processor import ask_handbrake_preprocessing, apply_handbrake_preprocessing
-from modules.ffmpeg_processor import apply_itsscale_with_encode, apply_filters_only, apply_itsscale_only
+from modules.preset_manager import choose_color_preset, load_color_presets, parse_preset_groups
+from modules.artifact_cache import cached_stage, lookup_artifact, input_fingerprint
+from modules.scratch_space import ScratchSpace
+from modules.progress_monitor import JobMetrics, print_job_metrics, append_metrics_record
 from modules.user_interface import (
     drag_and_drop_prompt, 
     ask_itsscale, 
@@ -27,8 +31,24 @@ from modules.user_interface import (
     show_file_size_comparison
 )
 
-def main():
+def main(args=None):
     """Main application workflow"""
+    # Encoding modules pull in NumPy for LUT baking; imported here so headless commands start fast
+    from modules.handbrake_processor import (
+        ask_handbrake_preprocessing,
+        apply_handbrake_preprocessing,
+        handbrake_stage_key
+    )
+    from modules.ffmpeg_processor import (
+        apply_itsscale_with_encode,
+        apply_filters_only,
+        apply_itsscale_only,
+        filter_stage_key
+    )
+    from modules.planner import plan_job, print_plan
+
+    if args is None:
+        args = build_arg_parser().parse_args([])
     print("Professional Video Enhancer with Color Correction")
     print("=" * 55)
     
@@ -47,58 +67,662 @@ def main():
     use_handbrake = ask_handbrake_preprocessing()
     scale = ask_itsscale()
     color_presets = choose_color_preset()  # Returns a list of preset keys
+    if args.auto_presets:
+        # Measure exposure on sampled keyframes and offer the matching brightness/sharpness presets
+        from modules.exposure_analyzer import analyze_exposure, apply_recommendation, print_analysis
+        analysis = analyze_exposure(original_video_path)
+        print_analysis(analysis)
+        recommended = apply_recommendation(color_presets, analysis)
+        if recommended != color_presets and input(
+                f"Use {' + '.join(recommended)}? (y/n): ").lower().strip() in ['y', 'yes']:
+            color_presets = recommended
+    while args.preview:
+        # Short sampled clips of the selection next to the original, before committing to a full encode
+        from modules.preview import render_preview
+        candidates = [["none"], color_presets] if color_presets != ["none"] else [["none"]]
+        render_preview(original_video_path, candidates)
+        if input("Use this selection? (y/n): ").lower().strip() in ['y', 'yes']:
+            break
+        color_presets = choose_color_preset()
     
     base = os.path.splitext(os.path.basename(original_video_path))[0]
+    metrics = JobMetrics(original_video_path)
     
-    if use_handbrake:
-        # New workflow: 1) Apply filters, 2) HandBrake, 3) itsscale
-        print(f"\n🎬 Step 1/3: Applying Color Filters...")
-        
-        # Apply filters first without itsscale
-        filtered_output = f"{base}_filtered.mp4"
-        apply_filters_only(original_video_path, color_presets, filtered_output)
-        
-        print(f"\n🛠️  Step 2/3: HandBrake Compression...")
-        handbrake_output = f"{base}_compressed.mp4"
-        
-        if apply_handbrake_preprocessing(filtered_output, handbrake_output):
-            print(f"📦 Compressed file: {handbrake_output}")
-            
-            print(f"\n⚡ Step 3/3: Applying itsscale trick...")
+    # Probe the source and drop every stage the chosen options do not actually need
+    strategy = None
+    if not args.no_plan:
+        plan = plan_job(original_video_path, color_presets, use_handbrake, stream=args.stream)
+        print_plan(plan)
+        strategy = plan["strategy"]
+        use_handbrake = plan["use_handbrake"]
+    
+    # Search the rate factor on sampled segments instead of using the fixed default
+    quality = {}
+    if args.target_quality is not None and strategy != "remux":
+        from modules.quality_search import search_quality
+        search = search_quality(original_video_path, color_presets, args.target_quality,
+                                metric=args.quality_metric, encoder="handbrake" if use_handbrake else None,
+                                samples=args.quality_samples)
+        quality = {"quality": search["value"]}
+
+    if strategy == "remux":
+        # No pixel change and no compression: itsscale alone
+        print(f"\n⚡ Step 1/1: Applying itsscale trick (no re-encode needed)...")
+        final_output = generate_output_filename(base, color_presets, False)
+        apply_itsscale_only(original_video_path, scale, final_output, metrics=metrics)
+    elif strategy == "compress":
+        # No color filters: HandBrake compresses the source directly
+        print(f"\n🛠️  Step 1/2: HandBrake Compression...")
+        run_compression = lambda path: apply_handbrake_preprocessing(original_video_path, path, metrics=metrics,
+                                                                     **quality)
+        # An uncached compressed file is removed again if HandBrake or the itsscale step fails
+        with ScratchSpace(base, root=args.scratch_dir) as scratch:
+            if args.no_cache:
+                compressed_output = scratch.track(f"{base}_compressed.mp4")
+                if not run_compression(compressed_output):
+                    compressed_output = None
+            else:
+                handbrake_key, handbrake_params = handbrake_stage_key(input_fingerprint(original_video_path),
+                                                                      **quality)
+                compressed_output = cached_stage(handbrake_key, "handbrake", run_compression, handbrake_params,
+                                                 original_video_path)
+            print(f"\n⚡ Step 2/2: Applying itsscale trick...")
+            if compressed_output:
+                final_output = generate_output_filename(base, color_presets, use_handbrake)
+                apply_itsscale_only(compressed_output, scale, final_output, metrics=metrics,
+                                    consume_input=args.no_cache)
+            else:
+                print("⚠️  HandBrake failed, applying itsscale to the source...")
+                final_output = generate_output_filename(base, color_presets, False)
+                apply_itsscale_only(original_video_path, scale, final_output, metrics=metrics)
+    elif use_handbrake and args.stream:
+        # Streaming workflow: filters, compression and itsscale in one pass
+        from modules.stream_processor import apply_streaming_pipeline
+        print(f"\n🎬 Step 1/1: Streaming Filters + Compression + itsscale...")
+        final_output = generate_output_filename(base, color_presets, use_handbrake)
+        apply_streaming_pipeline(original_video_path, color_presets, scale, final_output, metrics=metrics, **quality)
+    elif use_handbrake and not args.no_cache:
+        # Cached workflow: filtered and compressed files are reused when input and settings match
+        filter_key, filter_params = filter_stage_key(original_video_path, color_presets)
+        handbrake_key, handbrake_params = handbrake_stage_key(filter_key, **quality)
+
+        def run_filters(path):
+            apply_filters_only(original_video_path, color_presets, path, metrics=metrics)
+
+        def run_compression(path):
+            print(f"\n🎬 Step 1/3: Applying Color Filters...")
+            filtered = cached_stage(filter_key, "filters", run_filters, filter_params, original_video_path)
+            print(f"\n🛠️  Step 2/3: HandBrake Compression...")
+            return apply_handbrake_preprocessing(filtered, path, metrics=metrics, **quality)
+
+        compressed_output = cached_stage(handbrake_key, "handbrake", run_compression, handbrake_params, filter_key)
+        print(f"\n⚡ Step 3/3: Applying itsscale trick...")
+        if compressed_output:
             final_output = generate_output_filename(base, color_presets, use_handbrake)
-            apply_itsscale_only(handbrake_output, scale, final_output)
-            
-            # Cleanup intermediate files
-            try:
-                os.remove(filtered_output)
-                os.remove(handbrake_output)
-                print(f"🗑️  Cleaned up intermediate files")
-            except:
-                print(f"⚠️  Could not remove some intermediate files")
+            apply_itsscale_only(compressed_output, scale, final_output, metrics=metrics)
         else:
             print("⚠️  HandBrake failed, proceeding with filtered file and itsscale...")
             final_output = generate_output_filename(base, color_presets, False)
-            apply_itsscale_only(filtered_output, scale, final_output)
+            apply_itsscale_only(lookup_artifact(filter_key), scale, final_output, metrics=metrics)
+    elif use_handbrake:
+        # New workflow: 1) Apply filters, 2) HandBrake, 3) itsscale
+        # Intermediates live in a scratch directory that is removed however this block exits
+        with ScratchSpace(base, root=args.scratch_dir) as scratch:
+            print(f"\n🎬 Step 1/3: Applying Color Filters...")
             
-            # Cleanup
-            try:
-                os.remove(filtered_output)
-            except:
-                pass
+            # Apply filters first without itsscale, to a cheap intermediate that only HandBrake reads
+            filtered_output, intermediate = scratch.intermediate_path(original_video_path, f"{base}_filtered",
+                                                                      args.intermediate_codec)
+            apply_filters_only(original_video_path, color_presets, filtered_output, metrics=metrics,
+                               intermediate=intermediate)
+            
+            print(f"\n🛠️  Step 2/3: HandBrake Compression...")
+            # Next to the output, so the itsscale step can rename it into place
+            handbrake_output = scratch.track(f"{base}_compressed.mp4")
+            
+            if apply_handbrake_preprocessing(filtered_output, handbrake_output, metrics=metrics, **quality):
+                print(f"📦 Compressed file: {handbrake_output}")
+                
+                print(f"\n⚡ Step 3/3: Applying itsscale trick...")
+                final_output = generate_output_filename(base, color_presets, use_handbrake)
+                apply_itsscale_only(handbrake_output, scale, final_output, metrics=metrics, consume_input=True)
+            else:
+                # The intermediate is not meant for delivery, so encode filters + itsscale directly
+                print("⚠️  HandBrake failed, encoding filters and itsscale without compression...")
+                final_output = generate_output_filename(base, color_presets, False)
+                apply_itsscale_with_encode(original_video_path, scale, color_presets, final_output,
+                                           metrics=metrics, **quality)
+        print(f"🗑️  Cleaned up intermediate files")
     else:
         # Original workflow: Apply filters and itsscale together
         print(f"\n🎬 Step 1/1: Video Enhancement...")
         final_output = generate_output_filename(base, color_presets, use_handbrake)
-        apply_itsscale_with_encode(original_video_path, scale, color_presets, final_output)
+        if args.parallel_segments or args.segments or args.workers or args.resume:
+            from modules.segment_encoder import apply_segmented_encode
+            apply_segmented_encode(original_video_path, scale, color_presets, final_output,
+                                   segments=args.segments, workers=args.workers, metrics=metrics,
+                                   resume=args.resume, **quality)
+        elif args.frame_engine:
+            from modules.frame_engine import apply_itsscale_with_engine
+            from modules.lut_baker import UnsupportedFilterError
+            try:
+                apply_itsscale_with_engine(original_video_path, scale, color_presets, final_output,
+                                           metrics=metrics, workers=args.engine_workers, **quality)
+            except UnsupportedFilterError as e:
+                print(f"⚠️  Frame engine unavailable ({e}), using the FFmpeg filter path")
+                apply_itsscale_with_encode(original_video_path, scale, color_presets, final_output, metrics=metrics,
+                                           **quality)
+        else:
+            apply_itsscale_with_encode(original_video_path, scale, color_presets, final_output, metrics=metrics,
+                                       **quality)
     
     print(f"✅ Done! Final output saved to: {final_output}")
     
+    # Per-stage timings, and a JSON record for capacity planning if requested
+    record = metrics.to_record(final_output)
+    print_job_metrics(record)
+    if args.metrics_json:
+        append_metrics_record(args.metrics_json, record)
+        print(f"📝 Metrics appended to: {args.metrics_json}")
+    
     # Show file size comparison if HandBrake was used
     if use_handbrake:
         show_file_size_comparison(original_video_path, final_output)
     
-    # Play completion sound
+    # Play completion sound (imported only here, so headless commands never load the audio backend)
+    from playsound import playsound
     playsound("sound/bell.mp3")
 
+def run_batch(args):
+    """Headless batch workflow for many input files"""
+    from modules.batch_processor import (
+        collect_inputs,
+        build_jobs,
+        default_resource_limits,
+        run_batch as run_batch_jobs,
+        print_batch_report,
+        write_batch_report
+    )
+
+    preset_keys = [key.strip() for key in args.presets.split(",") if key.strip()] or ["none"]
+    color_presets = load_color_presets()
+    unknown = [key for key in preset_keys if key not in color_presets]
+    if unknown:
+        print(f"❌ Unknown preset(s): {', '.join(unknown)}")
+        print(f"   Available: {', '.join(color_presets.keys())}")
+        return 1
+
+    entries = collect_inputs(args.inputs, recursive=args.recursive)
+    if not entries:
+        print("❌ No input videos found.")
+        return 1
+
+    jobs = build_jobs(entries, preset_keys, args.itsscale, args.handbrake, args.output_dir,
+                      stream=args.stream, cache=not args.no_cache, plan=not args.no_plan,
+                      auto_presets=args.auto_presets, target_quality=args.target_quality,
+                      quality_metric=args.quality_metric, quality_samples=args.quality_samples,
+                      scratch_dir=args.scratch_dir, intermediate=args.intermediate_codec)
+
+    limits = default_resource_limits()
+    if args.nvenc_sessions is not None:
+        limits["nvenc"] = args.nvenc_sessions
+    if args.cpu_slots is not None:
+        limits["cpu"] = args.cpu_slots
+    if args.handbrake_slots is not None:
+        limits["handbrake"] = args.handbrake_slots
+
+    results, summary = run_batch_jobs(jobs, limits, pipeline=args.pipeline, fail_fast=args.fail_fast,
+                                      cpu_budget=not args.no_cpu_budget, pin_cpus=args.pin_cpus)
+    print_batch_report(results, summary)
+    if args.metrics_json:
+        for result in results:
+            append_metrics_record(args.metrics_json, result["metrics"])
+        print(f"📝 Metrics appended to: {args.metrics_json}")
+    if args.report:
+        write_batch_report(args.report, results, summary)
+        print(f"📝 Report written to: {args.report}")
+    return 0 if summary["failed"] == 0 else 1
+
+def run_farm(args):
+    """Coordinate a shared-directory job queue, or serve it as a worker"""
+    from modules.work_queue import init_queue, queue_status, print_queue_status, run_worker
+
+    init_queue(args.queue)
+    if args.action == "status":
+        print_queue_status(queue_status(args.queue))
+        return 0
+    if args.action == "worker":
+        stats = run_worker(args.queue, worker_id=args.worker_id, lease_seconds=args.lease_seconds,
+                           poll=args.poll, exit_when_idle=args.exit_when_idle)
+        return 0 if stats["failed"] == 0 else 1
+
+    from modules.batch_processor import collect_inputs, build_jobs
+    from modules.ffmpeg_processor import FINAL_QUALITY
+    from modules.work_queue import submit_file_task, submit_segment_group, coordinate
+
+    preset_keys = [key.strip() for key in args.presets.split(",") if key.strip()] or ["none"]
+    color_presets = load_color_presets()
+    unknown = [key for key in preset_keys if key not in color_presets]
+    if unknown:
+        print(f"❌ Unknown preset(s): {', '.join(unknown)}")
+        print(f"   Available: {', '.join(color_presets.keys())}")
+        return 1
+
+    entries = collect_inputs(args.inputs, recursive=args.recursive)
+    if not entries:
+        print("❌ No input videos found.")
+        return 1
+
+    # Paths go into the queue as absolute paths so every worker resolves them the same way
+    for entry in entries:
+        entry["input"] = os.path.abspath(entry["input"])
+    jobs = build_jobs(entries, preset_keys, args.itsscale, args.handbrake, os.path.abspath(args.output_dir),
+                      cache=not args.no_cache, plan=not args.no_plan)
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    file_tasks, groups = [], []
+    for index, job in enumerate(jobs):
+        base = re.sub(r"[^A-Za-z0-9_-]+", "_", os.path.splitext(os.path.basename(job["input"]))[0])
+        task_id = f"{run_id}-{index:03d}-{base}"
+        # HandBrake jobs need the whole file, so they are never split
+        if args.segments and not job["handbrake"]:
+            groups.append(submit_segment_group(args.queue, task_id, job, args.segments,
+                                               encoder=args.segment_encoder, quality=FINAL_QUALITY,
+                                               max_attempts=args.max_attempts))
+        else:
+            submit_file_task(args.queue, task_id, job, max_attempts=args.max_attempts)
+            file_tasks.append(task_id)
+
+    print(f"🛰️  Queued {len(file_tasks)} file task(s) and {sum(len(group['tasks']) for group in groups)} "
+          f"segment task(s) from {len(groups)} split file(s) in {args.queue}")
+    results = coordinate(args.queue, file_tasks, groups, poll=args.poll, stop_workers=args.stop_workers)
+
+    failed = [result for result in results if result["status"] != "ok"]
+    for result in results:
+        if result["status"] == "ok":
+            print(f"✅ {os.path.basename(result['input'])} → {result['output']} ({result.get('worker')})")
+        else:
+            print(f"❌ {os.path.basename(result['input'])}: {result['error']}")
+    print(f"🛰️  Farm run: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    return 0 if not failed else 1
+
+def run_variants(args):
+    """Encode several preset combinations of one input in a single ffmpeg process"""
+    from modules.ffmpeg_processor import apply_multi_variant_encode
+    from modules.user_interface import generate_variant_filenames
+
+    try:
+        variants = parse_preset_groups(args.variants, load_color_presets())
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if not variants:
+        print("❌ No variants given.")
+        return 1
+
+    base = os.path.splitext(os.path.basename(args.input))[0]
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_paths = [os.path.join(args.output_dir, name) for name in generate_variant_filenames(base, variants)]
+    metrics = JobMetrics(args.input)
+    apply_multi_variant_encode(args.input, args.itsscale, variants, output_paths,
+                               use_gpu=False if args.cpu else None, metrics=metrics)
+    for output_path in output_paths:
+        print(f"✅ {output_path}")
+    if args.metrics_json:
+        append_metrics_record(args.metrics_json, metrics.to_record(output_paths[0]))
+        print(f"📝 Metrics appended to: {args.metrics_json}")
+    return 0
+
+def run_preview(args):
+    """Render a sampled comparison of candidate presets for one input"""
+    from modules.preview import render_preview
+
+    color_presets = load_color_presets()
+    if args.candidates:
+        try:
+            candidates = parse_preset_groups(args.candidates, color_presets)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+    else:
+        candidates = [[key] for key in color_presets]
+    render_preview(args.input, candidates, output_path=args.output, samples=args.samples,
+                   sample_seconds=args.seconds, tile_width=args.tile_width)
+    return 0
+
+def run_analyze(args):
+    """Exposure analysis and preset recommendation for each input"""
+    from modules.exposure_analyzer import analyze_exposure, print_analysis
+
+    analyses = []
+    for input_path in args.inputs:
+        analysis = analyze_exposure(input_path, samples=args.samples)
+        analyses.append(analysis)
+        if not args.json:
+            print_analysis(analysis)
+    if args.json:
+        for analysis in analyses:
+            analysis["stats"].pop("histogram")
+        print(json.dumps(analyses, indent=2))
+    return 0
+
+def run_profile(args):
+    """Per-filter cost of a preset combination on a file or a synthetic clip"""
+    from modules.benchmark import generate_clip, save_report
+    from modules.filter_profiler import profile_filters, print_profile_report
+
+    preset_keys = [key.strip() for key in args.presets.split(",") if key.strip()]
+    color_presets = load_color_presets()
+    unknown = [key for key in preset_keys if key not in color_presets]
+    if unknown:
+        print(f"❌ Unknown preset(s): {', '.join(unknown)}")
+        print(f"   Available: {', '.join(color_presets.keys())}")
+        return 1
+
+    input_path = args.input or generate_clip(args.source, args.resolution, args.seconds)
+    report = profile_filters(input_path, preset_keys, encoder=args.encoder, frames=args.frames, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_profile_report(report)
+    if args.output:
+        save_report(args.output, report)
+        print(f"📝 Profile written to: {args.output}")
+    return 0
+
+def run_cache_command(args):
+    """List, prune or clear cached intermediate artifacts"""
+    from modules.artifact_cache import list_artifacts, print_artifacts, prune_artifacts, clear_artifacts, format_size
+
+    if args.action == "list":
+        print_artifacts(list_artifacts())
+        return 0
+    if args.action == "prune":
+        budget = int(args.budget_gb * 1024 ** 3) if args.budget_gb is not None else None
+        removed, freed = prune_artifacts(budget)
+    else:
+        removed, freed = clear_artifacts()
+    print(f"🗑️  Removed {removed} artifact(s), freed {format_size(freed)}")
+    return 0
+
+def run_catalog_command(args):
+    """Scan a library into the metadata catalog, query it, or show one entry"""
+    from modules.media_catalog import scan_library, query_catalog, print_rows, print_entry
+    from modules.ffmpeg_processor import format_elapsed_time
+
+    if args.action == "scan":
+        summary = scan_library(args.paths, db_path=args.db, jobs=args.jobs, keyframes=args.keyframes)
+        print(f"✅ Probed {summary['probed']} of {summary['found']} file(s) in "
+              f"{format_elapsed_time(summary['seconds'])} ({summary['failed']} failed, "
+              f"{summary['removed']} removed)")
+        return 1 if summary["failed"] else 0
+    if args.action == "show":
+        return 0 if all([print_entry(path, db_path=args.db) for path in args.paths]) else 1
+
+    rows = query_catalog(db_path=args.db, codec=args.codec, min_height=args.min_height, max_height=args.max_height,
+                         min_duration=args.min_duration, max_duration=args.max_duration,
+                         path_contains=args.path_contains, errors=args.errors)
+    if args.json:
+        print(json.dumps([{key: value for key, value in row.items() if key != "info"} for row in rows], indent=2))
+    else:
+        print_rows(rows)
+    return 0
+
+def run_bench(args):
+    """Benchmark presets and encoders on synthetic clips, optionally against a baseline"""
+    from modules.benchmark import (
+        COMMON_COMBINATIONS,
+        generate_clip,
+        measure_startup,
+        print_startup_report,
+        run_concurrency_benchmark,
+        print_concurrency_report,
+        run_benchmarks,
+        compare_to_baseline,
+        print_benchmark_report,
+        save_report,
+        load_report
+    )
+
+    if args.startup:
+        report = measure_startup(repeat=max(args.repeat, 5), budget=args.startup_budget)
+        within_budget = print_startup_report(report)
+        if args.output:
+            save_report(args.output, report)
+            print(f"📝 Startup results written to: {args.output}")
+        return 0 if within_budget else 1
+
+    split = lambda text: [item.strip() for item in text.split(",") if item.strip()] if text else None
+    if args.concurrency:
+        clip_path = generate_clip(split(args.sources)[0], split(args.resolutions)[0], args.seconds)
+        report = run_concurrency_benchmark(clip_path, split(args.presets) or COMMON_COMBINATIONS[0], args.concurrency,
+                                           encoder=(split(args.encoders) or ["libx264"])[0], repeat=args.repeat)
+        print_concurrency_report(report)
+        if args.output:
+            save_report(args.output, report)
+            print(f"📝 Concurrency results written to: {args.output}")
+        return 0
+
+    report = run_benchmarks(resolutions=split(args.resolutions), sources=split(args.sources),
+                            seconds=args.seconds, preset_filter=split(args.presets),
+                            encoders=split(args.encoders), repeat=args.repeat,
+                            include_combinations=not args.no_combinations)
+
+    regressions = None
+    if args.baseline:
+        regressions = compare_to_baseline(report, load_report(args.baseline), args.threshold)
+    print_benchmark_report(report, regressions)
+    if args.output:
+        save_report(args.output, report)
+        print(f"📝 Benchmark results written to: {args.output}")
+    return 1 if regressions else 0
+
+def build_arg_parser():
+    """Command line interface; no arguments starts the interactive workflow"""
+    parser = argparse.ArgumentParser(description="Professional Video Enhancer with Color Correction")
+    parser.add_argument("--stream", action="store_true",
+                        help="With HandBrake compression, stream filters → compression → itsscale through a pipe")
+    parser.add_argument("--metrics-json", help="Append a JSON metrics record per job to this file")
+    parser.add_argument("--parallel-segments", action="store_true",
+                        help="Without HandBrake, encode keyframe-aligned segments in parallel")
+    parser.add_argument("--segments", type=int, help="Number of segments (default: 2 per worker)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Without HandBrake, checkpoint each encoded segment so a rerun after a crash continues where it stopped")
+    parser.add_argument("--workers", type=int, help="Parallel segment encodes (default: sized to cores/NVENC)")
+    parser.add_argument("--frame-engine", action="store_true",
+                        help="Without HandBrake, apply the color presets to raw frames with NumPy instead of FFmpeg filters")
+    parser.add_argument("--engine-workers", type=int,
+                        help="Frame engine worker processes (default: half the cores, 0 = in the main process)")
+    parser.add_argument("--auto-presets", action="store_true",
+                        help="Analyze exposure on sampled keyframes and suggest brightness/sharpness presets")
+    parser.add_argument("--target-quality", type=float,
+                        help="Pick the CRF/CQ/RF that meets this score on sampled segments (e.g. VMAF 93)")
+    parser.add_argument("--quality-metric", choices=["vmaf", "ssim", "psnr"], default="vmaf",
+                        help="Metric for --target-quality (default: vmaf, ssim without libvmaf)")
+    parser.add_argument("--quality-samples", type=int, default=4,
+                        help="Sampled segments per --target-quality search (default: 4)")
+    parser.add_argument("--preview", action="store_true",
+                        help="Render a short sampled comparison of the chosen presets before the full encode")
+    parser.add_argument("--scratch-dir",
+                        help="Fast disk or tmpfs for uncached intermediates (default: $VIDEO_ENHANCER_SCRATCH or temp dir)")
+    parser.add_argument("--intermediate-codec", choices=["x264_lossless", "ffv1", "x264_crf18"],
+                        help="Codec for uncached filtered intermediates (default: lossless x264, crf18 if space is short)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not reuse or keep filtered/compressed intermediates in the artifact cache")
+    parser.add_argument("--no-plan", action="store_true",
+                        help="Always run every selected stage instead of skipping the ones the source does not need")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch = subparsers.add_parser("batch", help="Process many files headlessly")
+    batch.add_argument("inputs", nargs="+", help="Video files, directories, glob patterns or manifests (.json/.txt)")
+    batch.add_argument("--presets", default="none", help="Comma-separated preset keys (default: none)")
+    batch.add_argument("--itsscale", type=float, default=2.0, help="itsscale value (default: 2)")
+    batch.add_argument("--handbrake", action="store_true", help="Run HandBrake compression between filters and itsscale")
+    batch.add_argument("--stream", action="store_true", help="Stream the HandBrake workflow through a pipe")
+    batch.add_argument("--output-dir", default=".", help="Directory for output files")
+    batch.add_argument("--recursive", action="store_true", help="Search input directories recursively")
+    batch.add_argument("--nvenc-sessions", type=int, help="Maximum concurrent NVENC encodes")
+    batch.add_argument("--cpu-slots", type=int, help="Maximum concurrent CPU encodes")
+    batch.add_argument("--handbrake-slots", type=int, help="Maximum concurrent HandBrakeCLI runs")
+    batch.add_argument("--report", help="Write per-job results and totals to this JSON file")
+    batch.add_argument("--metrics-json", help="Append a JSON metrics record per job to this file")
+    batch.add_argument("--no-cache", action="store_true", help="Do not use the artifact cache for intermediates")
+    batch.add_argument("--scratch-dir", help="Directory (fast disk or tmpfs) for uncached intermediates")
+    batch.add_argument("--intermediate-codec", choices=["x264_lossless", "ffv1", "x264_crf18"],
+                       help="Codec for uncached filtered intermediates (default: chosen by free space)")
+    batch.add_argument("--no-plan", action="store_true", help="Run every selected stage even when not needed")
+    batch.add_argument("--auto-presets", action="store_true",
+                       help="Pick brightness/sharpness presets per file from a sampled exposure analysis")
+    batch.add_argument("--target-quality", type=float,
+                       help="Pick the CRF/CQ/RF per file that meets this score on sampled segments")
+    batch.add_argument("--quality-metric", choices=["vmaf", "ssim", "psnr"], default="vmaf",
+                       help="Metric for --target-quality (default: vmaf)")
+    batch.add_argument("--quality-samples", type=int, default=4,
+                       help="Sampled segments per --target-quality search (default: 4)")
+    batch.add_argument("--no-cpu-budget", action="store_true",
+                       help="Let every concurrent ffmpeg/HandBrakeCLI use all cores instead of its own share")
+    batch.add_argument("--pin-cpus", action="store_true",
+                       help="Also pin each concurrent process to its CPU set (whole cores, one NUMA node where possible)")
+    batch.add_argument("--pipeline", action="store_true",
+                       help="Overlap files across the encode, HandBrake and remux stages with bounded queues")
+    batch.add_argument("--fail-fast", action="store_true", help="With --pipeline, cancel remaining files on the first failure")
+
+    variants = subparsers.add_parser("variants", help="Render several preset combinations from one decode")
+    variants.add_argument("input", help="Source video")
+    variants.add_argument("--variants", required=True,
+                          help="Comma-separated combinations, '+' combines presets (e.g. '2+8+6,3,hdr_vivid_direct')")
+    variants.add_argument("--itsscale", type=float, default=2.0, help="itsscale value (default: 2)")
+    variants.add_argument("--output-dir", default=".", help="Directory for output files")
+    variants.add_argument("--cpu", action="store_true", help="Encode with libx264 even if NVENC is available")
+    variants.add_argument("--metrics-json", help="Append a JSON metrics record to this file")
+
+    preview = subparsers.add_parser("preview", help="Render sampled side-by-side clips of candidate presets")
+    preview.add_argument("input", help="Source video")
+    preview.add_argument("--candidates", help="Comma-separated candidates, '+' combines presets "
+                         "(keys or menu numbers, e.g. '2+8+6,3,none'); default: every preset")
+    preview.add_argument("--samples", type=int, default=4, help="Number of sampled timestamps (default: 4)")
+    preview.add_argument("--seconds", type=float, default=3.0, help="Length of each sample (default: 3)")
+    preview.add_argument("--tile-width", type=int, default=640, help="Width of each candidate tile (default: 640)")
+    preview.add_argument("--output", help="Comparison clip path (default: <input>_preview.mp4)")
+
+    analyze = subparsers.add_parser("analyze", help="Recommend brightness/sharpness presets from sampled keyframes")
+    analyze.add_argument("inputs", nargs="+", help="Video files")
+    analyze.add_argument("--samples", type=int, default=24, help="Keyframes to sample per file (default: 24)")
+    analyze.add_argument("--json", action="store_true", help="Print the analysis as JSON")
+
+    profile = subparsers.add_parser("profile", help="Time each filter of a preset combination and the encoder")
+    profile.add_argument("--presets", required=True, help="Comma-separated preset keys, e.g. hdr_vivid_direct,sharpness_clarity_high")
+    profile.add_argument("--input", help="Video file to profile (default: a synthetic clip)")
+    profile.add_argument("--source", choices=["testsrc2", "mandelbrot"], default="testsrc2",
+                         help="Synthetic clip source without --input (default: testsrc2)")
+    profile.add_argument("--resolution", choices=["720p", "1080p", "4k"], default="1080p",
+                         help="Synthetic clip resolution without --input (default: 1080p)")
+    profile.add_argument("--seconds", type=int, default=5, help="Synthetic clip length (default: 5)")
+    profile.add_argument("--frames", type=int, help="Only profile the first N frames")
+    profile.add_argument("--encoder", choices=["libx264", "h264_nvenc"], help="Encoder for the full pass (default: auto)")
+    profile.add_argument("--repeat", type=int, default=1, help="Runs per pass; the fastest is kept (default: 1)")
+    profile.add_argument("--json", action="store_true", help="Print the profile as JSON instead of a table")
+    profile.add_argument("--output", help="Also write the profile to this JSON file")
+
+    cache = subparsers.add_parser("cache", help="Inspect or prune the intermediate artifact cache")
+    cache.add_argument("action", choices=["list", "prune", "clear"], help="list, prune to the budget, or clear")
+    cache.add_argument("--budget-gb", type=float, help="Budget for prune (default: $VIDEO_ENHANCER_CACHE_BUDGET_GB or 20)")
+
+    catalog = subparsers.add_parser("catalog", help="Index library metadata in SQLite and query it")
+    catalog.add_argument("action", choices=["scan", "query", "show"],
+                         help="scan files/directories, query the index, or show entries")
+    catalog.add_argument("paths", nargs="*", help="Files or directories (scan/show)")
+    catalog.add_argument("--db", help="Catalog database (default: $VIDEO_ENHANCER_CATALOG or .cache/catalog)")
+    catalog.add_argument("--jobs", type=int, help="Concurrent ffprobe processes (default: 2 × CPUs, max 32)")
+    catalog.add_argument("--keyframes", action="store_true", help="Also index keyframe positions (reads packets)")
+    catalog.add_argument("--codec", help="query: video codec (e.g. h264)")
+    catalog.add_argument("--min-height", type=int, help="query: minimum video height")
+    catalog.add_argument("--max-height", type=int, help="query: maximum video height")
+    catalog.add_argument("--min-duration", type=float, help="query: minimum duration in seconds")
+    catalog.add_argument("--max-duration", type=float, help="query: maximum duration in seconds")
+    catalog.add_argument("--path-contains", help="query: substring of the path")
+    catalog.add_argument("--errors", action="store_true", help="query: list files that failed to probe")
+    catalog.add_argument("--json", action="store_true", help="query: print JSON instead of a table")
+
+    farm = subparsers.add_parser("farm", help="Spread jobs over worker processes/hosts sharing a queue directory")
+    farm.add_argument("action", choices=["run", "worker", "status"],
+                      help="run: queue inputs and coordinate; worker: claim and encode tasks; status: show the queue")
+    farm.add_argument("inputs", nargs="*", help="run: video files, directories, glob patterns or manifests")
+    farm.add_argument("--queue", required=True, help="Queue directory on storage every worker can reach")
+    farm.add_argument("--presets", default="none", help="run: comma-separated preset keys (default: none)")
+    farm.add_argument("--itsscale", type=float, default=2.0, help="run: itsscale value (default: 2)")
+    farm.add_argument("--handbrake", action="store_true", help="run: HandBrake compression (whole-file tasks only)")
+    farm.add_argument("--output-dir", default=".", help="run: directory for output files, shared with the workers")
+    farm.add_argument("--recursive", action="store_true", help="run: search input directories recursively")
+    farm.add_argument("--segments", type=int, default=0,
+                      help="run: split each file into this many keyframe-aligned segment tasks (default: whole files)")
+    farm.add_argument("--segment-encoder", choices=["libx264", "h264_nvenc"], default="libx264",
+                      help="run: encoder for every segment of a split file (default: libx264)")
+    farm.add_argument("--max-attempts", type=int, default=3,
+                      help="run: tries per task, counting failures and expired leases (default: 3)")
+    farm.add_argument("--stop-workers", action="store_true", help="run: tell workers to exit once everything is done")
+    farm.add_argument("--no-cache", action="store_true", help="run: do not use the artifact cache for intermediates")
+    farm.add_argument("--no-plan", action="store_true", help="run: run every selected stage even when not needed")
+    farm.add_argument("--worker-id", help="worker: name shown in status (default: host-pid)")
+    farm.add_argument("--lease-seconds", type=float, default=60,
+                      help="worker: lease length; a worker silent this long loses its task (default: 60)")
+    farm.add_argument("--exit-when-idle", action="store_true", help="worker: exit when nothing is queued or running")
+    farm.add_argument("--poll", type=float, default=2.0, help="Seconds between queue scans (default: 2)")
+
+    capabilities = subparsers.add_parser("capabilities", help="Show detected ffmpeg/HandBrake/GPU capabilities")
+    capabilities.add_argument("--refresh", action="store_true", help="Re-probe instead of using the cached registry")
+
+    bench = subparsers.add_parser("bench", help="Benchmark presets, combinations and encoders on synthetic clips")
+    bench.add_argument("--resolutions", default="720p", help="Comma-separated: 720p,1080p,4k (default: 720p)")
+    bench.add_argument("--sources", default="testsrc2", help="Comma-separated lavfi sources: testsrc2,mandelbrot")
+    bench.add_argument("--seconds", type=int, default=5, help="Length of each synthetic clip (default: 5)")
+    bench.add_argument("--presets", help="Comma-separated preset keys to benchmark (default: all)")
+    bench.add_argument("--no-combinations", action="store_true", help="Skip the common preset combinations")
+    bench.add_argument("--encoders", help="Comma-separated encoders, plus numpy+libx264 for the frame engine "
+                       "(default: every available encoder)")
+    bench.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is kept (default: 1)")
+    bench.add_argument("--output", help="Write results to this JSON file")
+    bench.add_argument("--baseline", help="Compare against a saved results file; exit 1 on regression")
+    bench.add_argument("--threshold", type=float, default=0.10,
+                       help="Allowed slowdown before a case counts as a regression (default: 0.10)")
+    bench.add_argument("--concurrency", type=int,
+                       help="Run N encodes of one clip at once (--presets as one combination) with and without per-job CPU sets")
+    bench.add_argument("--startup", action="store_true",
+                       help="Measure how fast headless commands start instead; exit 1 over --startup-budget")
+    bench.add_argument("--startup-budget", type=float, default=0.5,
+                       help="Seconds a headless command may take to start (default: 0.5)")
+
+    return parser
+
+def cli():
+    """Dispatch to the interactive or headless workflow"""
+    args = build_arg_parser().parse_args()
+    if args.command == "batch":
+        sys.exit(run_batch(args))
+    if args.command == "bench":
+        sys.exit(run_bench(args))
+    if args.command == "variants":
+        sys.exit(run_variants(args))
+    if args.command == "preview":
+        sys.exit(run_preview(args))
+    if args.command == "profile":
+        sys.exit(run_profile(args))
+    if args.command == "analyze":
+        sys.exit(run_analyze(args))
+    if args.command == "cache":
+        sys.exit(run_cache_command(args))
+    if args.command == "catalog":
+        if args.action != "query" and not args.paths:
+            build_arg_parser().error(f"catalog {args.action} needs at least one path")
+        sys.exit(run_catalog_command(args))
+    if args.command == "farm":
+        if args.action == "run" and not args.inputs:
+            build_arg_parser().error("farm run needs at least one input")
+        sys.exit(run_farm(args))
+    if args.command == "capabilities":
+        from modules.capabilities import get_capabilities, print_capabilities
+        print_capabilities(get_capabilities(refresh=args.refresh))
+        return
+    main(args)
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,259 @@
+"""
+Artifact Cache
+Content-addressed store for intermediate stage outputs, with LRU eviction under a disk budget
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .cache_utils import get_cache_dir
+from .scratch_space import _pid_alive
+
+BUDGET_ENV = "VIDEO_ENHANCER_CACHE_BUDGET_GB"
+DEFAULT_BUDGET_GB = 20
+SAMPLE_SIZE = 4 * 1024 * 1024
+SAMPLE_COUNT = 8
+ARTIFACT_EXTENSION = ".mp4"
+STALE_TEMP_SECONDS = 24 * 3600
+
+_fingerprint_cache = {}
+_store_lock = threading.Lock()
+# Reference counts of artifacts a running job still has to read; pruning never evicts them
+_pins = {}
+
+
+def _artifact_dir():
+    return get_cache_dir("artifacts")
+
+
+def default_budget_bytes():
+    """Disk budget for cached artifacts, from the environment or the default"""
+    try:
+        budget_gb = float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_GB))
+    except ValueError:
+        budget_gb = DEFAULT_BUDGET_GB
+    return int(budget_gb * 1024 ** 3)
+
+
+def input_fingerprint(path):
+    """Content hash of a media file from its size and evenly spaced samples, memoized per mtime"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _fingerprint_cache:
+        return _fingerprint_cache[key]
+
+    digest = hashlib.sha256(str(stat.st_size).encode())
+    with open(path, "rb") as f:
+        if stat.st_size <= SAMPLE_SIZE * SAMPLE_COUNT:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        else:
+            # Head and tail hold the container headers; the samples in between catch re-encodes
+            step = (stat.st_size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+            for i in range(SAMPLE_COUNT):
+                f.seek(i * step)
+                digest.update(f.read(SAMPLE_SIZE))
+    fingerprint = digest.hexdigest()
+    _fingerprint_cache[key] = fingerprint
+    return fingerprint
+
+
+def stage_key(source, stage, params):
+    """Cache key for one stage: its source (input fingerprint or upstream key), type and parameters"""
+    payload = json.dumps({"source": source, "stage": stage, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _paths(key):
+    base = os.path.join(_artifact_dir(), key)
+    return base + ARTIFACT_EXTENSION, base + ".json"
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    temp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temp_path, meta_path)
+
+
+def pin_artifact(key):
+    """Protect an artifact from eviction until release_artifact(key)"""
+    with _store_lock:
+        _pins[key] = _pins.get(key, 0) + 1
+
+
+def release_artifact(key):
+    """Drop one pin taken by pin_artifact or a pin=True lookup/store"""
+    with _store_lock:
+        if _pins.get(key, 0) > 1:
+            _pins[key] -= 1
+        else:
+            _pins.pop(key, None)
+
+
+def lookup_artifact(key, pin=False):
+    """Path of a cached artifact (marking it recently used), or None
+
+    With pin, a hit stays pinned until the caller releases it.
+    """
+    if pin:
+        # Pin before checking so a concurrent prune cannot evict it in between
+        pin_artifact(key)
+    artifact_path, meta_path = _paths(key)
+    meta = _read_meta(meta_path)
+    if not meta or not os.path.exists(artifact_path) or os.path.getsize(artifact_path) != meta.get("size"):
+        if pin:
+            release_artifact(key)
+        return None
+    meta["last_used"] = time.time()
+    meta["hits"] = meta.get("hits", 0) + 1
+    try:
+        _write_meta(meta_path, meta)
+    except OSError:
+        pass
+    return artifact_path
+
+
+def store_artifact(key, produced_path, stage, params=None, source=None, pin=False):
+    """Move a finished stage output into the cache and return its cached path (pinned with pin)"""
+    artifact_path, meta_path = _paths(key)
+    os.replace(produced_path, artifact_path)
+    now = time.time()
+    _write_meta(meta_path, {
+        "key": key,
+        "stage": stage,
+        "params": params,
+        "source": source,
+        "size": os.path.getsize(artifact_path),
+        "created": now,
+        "last_used": now,
+        "hits": 0
+    })
+    if pin:
+        pin_artifact(key)
+    prune_artifacts(keep={key})
+    return artifact_path
+
+
+def cached_stage(key, stage, produce, params=None, source=None, pin=False):
+    """Return the cached artifact for key, or run produce(path) and cache its output
+
+    produce returning False means the stage failed; None is returned and nothing is cached.
+    With pin, a returned artifact stays pinned until the caller releases it.
+    """
+    artifact_path = lookup_artifact(key, pin=pin)
+    if artifact_path:
+        print(f"♻️  Reusing cached {stage} output ({key[:12]})")
+        return artifact_path
+
+    temp_path = os.path.join(_artifact_dir(), f"{key}.{os.getpid()}.{threading.get_ident()}.tmp{ARTIFACT_EXTENSION}")
+    try:
+        if produce(temp_path) is False or not os.path.exists(temp_path):
+            return None
+        return store_artifact(key, temp_path, stage, params, source, pin=pin)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def list_artifacts():
+    """Metadata of every cached artifact, most recently used first"""
+    artifacts = []
+    for name in os.listdir(_artifact_dir()):
+        if not name.endswith(".json") or ".tmp" in name:
+            continue
+        meta = _read_meta(os.path.join(_artifact_dir(), name))
+        if meta and os.path.exists(_paths(meta["key"])[0]):
+            artifacts.append(meta)
+    artifacts.sort(key=lambda meta: meta.get("last_used", 0), reverse=True)
+    return artifacts
+
+
+def _remove_artifact(key):
+    for path in _paths(key):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def prune_artifacts(budget_bytes=None, keep=()):
+    """Evict least recently used artifacts until the cache fits the budget; returns (removed, freed bytes)
+
+    Pinned artifacts and those in keep are never evicted.
+    """
+    budget_bytes = default_budget_bytes() if budget_bytes is None else budget_bytes
+    with _store_lock:
+        artifacts = list_artifacts()
+        total = sum(meta["size"] for meta in artifacts)
+        removed = freed = 0
+        for meta in reversed(artifacts):
+            if total <= budget_bytes:
+                break
+            if meta["key"] in keep or meta["key"] in _pins:
+                continue
+            _remove_artifact(meta["key"])
+            total -= meta["size"]
+            freed += meta["size"]
+            removed += 1
+    return removed, freed
+
+
+def _writer_running(name):
+    """Whether the process that is writing a temp file (named key[.json].pid.thread.tmp...) still runs"""
+    parts = name.split(".")
+    pid = next((part for part in parts[1:] if part.isdigit()), None)
+    if pid is None:
+        # Unknown writer: only a day-old leftover is considered abandoned
+        try:
+            return time.time() - os.path.getmtime(os.path.join(_artifact_dir(), name)) < STALE_TEMP_SECONDS
+        except OSError:
+            return False
+    return int(pid) == os.getpid() or _pid_alive(int(pid))
+
+
+def clear_artifacts():
+    """Remove every cached artifact and the temp files of writers that are no longer running"""
+    removed = freed = 0
+    for name in os.listdir(_artifact_dir()):
+        path = os.path.join(_artifact_dir(), name)
+        if ".tmp" in name and _writer_running(name):
+            # Another process is still producing it and will rename it into place
+            continue
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            continue
+        if name.endswith(ARTIFACT_EXTENSION) and ".tmp" not in name:
+            freed += size
+            removed += 1
+    return removed, freed
+
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
+
+
+def print_artifacts(artifacts):
+    """Table of cached artifacts and the total against the budget"""
+    total = sum(meta["size"] for meta in artifacts)
+    print(f"🗄️  Artifact cache: {len(artifacts)} item(s), {format_size(total)} "
+          f"of {format_size(default_budget_bytes())} budget ({_artifact_dir()})")
+    for meta in artifacts:
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta.get("last_used", 0)))
+        print(f"   {meta['key'][:12]}  {meta['stage']:<10} {format_size(meta['size']):>10}  "
+              f"used {last_used}  hits {meta.get('hits', 0)}")
@@ -0,0 +1,589 @@
+"""
+Batch Processor
+Runs many enhancement jobs headlessly through a resource-aware scheduler
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .artifact_cache import cached_stage, lookup_artifact, input_fingerprint, release_artifact
+from .cpu_topology import CpuAllocator
+from .ffmpeg_processor import (
+    MAX_NVENC_SESSIONS,
+    select_encoder,
+    apply_itsscale_with_encode,
+    apply_filters_only,
+    apply_itsscale_only,
+    filter_stage_key,
+    format_elapsed_time
+)
+from .exposure_analyzer import analyze_exposure, apply_recommendation
+from .handbrake_processor import apply_handbrake_preprocessing, handbrake_stage_key
+from .media_probe import VIDEO_EXTENSIONS
+from .planner import plan_job
+from .progress_monitor import JobMetrics, set_live_progress
+from .quality_search import DEFAULT_METRIC, DEFAULT_SAMPLES as DEFAULT_QUALITY_SAMPLES, search_quality
+from .scratch_space import ScratchSpace
+from .stage_pipeline import Stage, run_pipeline
+from .stream_processor import apply_streaming_pipeline
+from .user_interface import generate_output_filename
+
+MANIFEST_EXTENSIONS = (".json", ".txt", ".lst")
+
+# One libx264 "medium" encode keeps roughly eight cores busy
+CORES_PER_CPU_ENCODE = 8
+# Resources whose processes decode, filter or encode on the CPU and so get a CPU set
+CPU_HEAVY_RESOURCES = ("nvenc", "cpu", "handbrake")
+
+
+def default_resource_limits():
+    """Default concurrency caps per resource type, sized to this machine"""
+    cores = os.cpu_count() or 1
+    return {
+        "nvenc": MAX_NVENC_SESSIONS if select_encoder() == "h264_nvenc" else 0,
+        "cpu": max(1, cores // CORES_PER_CPU_ENCODE),
+        "handbrake": 1,
+        "remux": 4
+    }
+
+
+class ResourceScheduler:
+    """Hands out slots per resource type and blocks when every slot is taken"""
+
+    def __init__(self, limits, cpu_allocator=None):
+        self.limits = dict(limits)
+        self.in_use = {name: 0 for name in self.limits}
+        self.busy_seconds = {name: 0.0 for name in self.limits}
+        self.cpu_allocator = cpu_allocator
+        self._cond = threading.Condition()
+
+    def acquire(self, candidates):
+        """Block until one of the candidate resources has a free slot, return its name"""
+        candidates = [name for name in candidates if self.limits.get(name, 0) > 0]
+        if not candidates:
+            raise ValueError("No resource with free capacity configured for this stage")
+        with self._cond:
+            while True:
+                for name in candidates:
+                    if self.in_use[name] < self.limits[name]:
+                        self.in_use[name] += 1
+                        return name
+                self._cond.wait()
+
+    def release(self, name, busy_seconds=0.0):
+        """Return a slot to the pool"""
+        with self._cond:
+            self.in_use[name] -= 1
+            self.busy_seconds[name] += busy_seconds
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, *candidates):
+        """Context manager holding one slot of the first available candidate resource"""
+        name = self.acquire(candidates)
+        start_time = time.time()
+        try:
+            yield name
+        finally:
+            self.release(name, time.time() - start_time)
+
+    @contextmanager
+    def cpu_slot(self, *candidates):
+        """Like slot(), also holding a CPU set; yields (resource, allocation or None)"""
+        with self.slot(*candidates) as name:
+            if self.cpu_allocator is None or name not in CPU_HEAVY_RESOURCES:
+                yield name, None
+                return
+            with self.cpu_allocator.allocation() as cpu:
+                yield name, cpu
+
+    def encoder_candidates(self):
+        """Resources that can run an encode, in order of preference"""
+        return [name for name in ("nvenc", "cpu") if self.limits.get(name, 0) > 0]
+
+
+def _read_manifest(path):
+    """Read job entries from a JSON or plain-text manifest"""
+    if path.lower().endswith(".json"):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("jobs", [])
+        entries = []
+        for item in data:
+            entries.append({"input": item} if isinstance(item, str) else dict(item))
+    else:
+        entries = []
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    entries.append({"input": line.strip('"')})
+
+    # Relative paths in a manifest are relative to the manifest itself
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    for entry in entries:
+        if not os.path.isabs(entry["input"]):
+            entry["input"] = os.path.join(manifest_dir, entry["input"])
+    return entries
+
+
+def collect_inputs(sources, recursive=False):
+    """Expand directories, glob patterns and manifests into a list of job entries"""
+    entries = []
+    for source in sources:
+        if os.path.isdir(source):
+            if recursive:
+                for root, _, files in os.walk(source):
+                    for name in sorted(files):
+                        if name.lower().endswith(VIDEO_EXTENSIONS):
+                            entries.append({"input": os.path.join(root, name)})
+            else:
+                for name in sorted(os.listdir(source)):
+                    path = os.path.join(source, name)
+                    if os.path.isfile(path) and name.lower().endswith(VIDEO_EXTENSIONS):
+                        entries.append({"input": path})
+        elif os.path.isfile(source) and source.lower().endswith(MANIFEST_EXTENSIONS):
+            entries.extend(_read_manifest(source))
+        elif os.path.isfile(source):
+            entries.append({"input": source})
+        elif glob.has_magic(source):
+            for path in sorted(glob.glob(source, recursive=True)):
+                if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS):
+                    entries.append({"input": path})
+        else:
+            print(f"⚠️  Skipping {source}: not a file, directory or glob pattern")
+
+    # Drop duplicates while keeping the original order
+    seen = set()
+    unique = []
+    for entry in entries:
+        key = os.path.abspath(entry["input"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(entry)
+    return unique
+
+
+def build_jobs(entries, preset_keys, itsscale_value, use_handbrake, output_dir, stream=False, cache=True,
+               plan=True, auto_presets=False, target_quality=None, quality_metric=DEFAULT_METRIC,
+               quality_samples=DEFAULT_QUALITY_SAMPLES, scratch_dir=None, intermediate=None):
+    """Fill in per-job defaults for every manifest or directory entry"""
+    jobs = []
+    for entry in entries:
+        job = {
+            "input": entry["input"],
+            "presets": entry.get("presets", preset_keys),
+            "itsscale": float(entry.get("itsscale", itsscale_value)),
+            "handbrake": bool(entry.get("handbrake", use_handbrake)),
+            "stream": bool(entry.get("stream", stream)),
+            "cache": bool(entry.get("cache", cache)),
+            "plan": bool(entry.get("plan", plan)),
+            "auto_presets": bool(entry.get("auto_presets", auto_presets)),
+            "target_quality": entry.get("target_quality", target_quality),
+            "quality_metric": entry.get("quality_metric", quality_metric),
+            "quality_samples": int(entry.get("quality_samples", quality_samples)),
+            "scratch_dir": entry.get("scratch_dir", scratch_dir),
+            "intermediate": entry.get("intermediate", intermediate),
+            "output_dir": entry.get("output_dir", output_dir)
+        }
+        if isinstance(job["presets"], str):
+            job["presets"] = [key.strip() for key in job["presets"].split(",") if key.strip()]
+        if "output" in entry:
+            job["output"] = entry["output"]
+        jobs.append(job)
+
+    # Outputs and intermediates are named after the input; same-named inputs from different
+    # directories would overwrite each other in a shared output directory, so they get a path hash
+    names = {}
+    for job in jobs:
+        job["base"] = os.path.splitext(os.path.basename(job["input"]))[0]
+        key = (os.path.normcase(os.path.abspath(job["output_dir"])), job["base"].lower())
+        names[key] = names.get(key, 0) + 1
+    for job in jobs:
+        if names[(os.path.normcase(os.path.abspath(job["output_dir"])), job["base"].lower())] > 1:
+            digest = hashlib.sha1(os.path.abspath(job["input"]).encode("utf-8")).hexdigest()[:8]
+            job["base"] = f"{job['base']}_{digest}"
+    return jobs
+
+
+def _new_job_context(job):
+    """Per-job state threaded through the encode, compress and remux stages"""
+    input_path = job["input"]
+    os.makedirs(job["output_dir"], exist_ok=True)
+    return {
+        "name": os.path.basename(input_path),
+        "job": job,
+        "base": job.get("base") or os.path.splitext(os.path.basename(input_path))[0],
+        "strategy": None,
+        # File the next stage works on, whether it is an intermediate and whether it went through HandBrake
+        "current": input_path,
+        "consume": False,
+        "compressed": False,
+        "filter_key": None,
+        # Cached artifacts this job still reads, protected from eviction until it finishes
+        "pins": [],
+        # Rate factor keyword arguments for the HandBrake/streaming compression (empty: fixed default)
+        "quality": {},
+        "final_output": None,
+        "done": False,
+        "intermediates": [],
+        # Scratch directory for the uncached filtered intermediate, removed when the job finishes
+        "scratch": None,
+        "metrics": JobMetrics(input_path),
+        "start_time": time.time(),
+        "result": {
+            "input": input_path,
+            "output": None,
+            "status": "failed",
+            "encoder": None,
+            "bytes_in": os.path.getsize(input_path) if os.path.exists(input_path) else 0,
+            "bytes_out": 0,
+            "elapsed": 0.0,
+            "error": None
+        }
+    }
+
+
+def _final_output_path(ctx, compressed):
+    job = ctx["job"]
+    return job.get("output") or os.path.join(
+        job["output_dir"], generate_output_filename(ctx["base"], job["presets"], compressed))
+
+
+def _cached_filter_stage(ctx, scheduler):
+    """Filtered artifact from the cache or produced under an encoder slot; skips ahead on a compressed hit"""
+    job, input_path, metrics = ctx["job"], ctx["job"]["input"], ctx["metrics"]
+    # The filter stage's output depends on the encoder, so each candidate resource has its own key
+    filter_keys = {resource: filter_stage_key(input_path, job["presets"], use_gpu=(resource == "nvenc"))
+                   for resource in scheduler.encoder_candidates()}
+    for filter_key, _ in filter_keys.values():
+        handbrake_key = handbrake_stage_key(filter_key, **ctx["quality"])[0]
+        compressed_output = lookup_artifact(handbrake_key, pin=True)
+        if compressed_output:
+            print(f"♻️  {ctx['name']}: reusing cached compressed file")
+            ctx["pins"].append(handbrake_key)
+            ctx.update(current=compressed_output, compressed=True)
+            return
+
+    filter_key = filtered_output = None
+    for key, _ in filter_keys.values():
+        filtered_output = lookup_artifact(key, pin=True)
+        if filtered_output:
+            filter_key = key
+            break
+    if not filtered_output:
+        with scheduler.cpu_slot(*scheduler.encoder_candidates()) as (resource, cpu):
+            ctx["result"]["encoder"] = resource
+            filter_key, filter_params = filter_keys[resource]
+            filtered_output = cached_stage(
+                filter_key, "filters",
+                lambda path: apply_filters_only(input_path, job["presets"], path,
+                                                use_gpu=(resource == "nvenc"), metrics=metrics, cpu=cpu),
+                filter_params, input_path, pin=True)
+    if not filtered_output:
+        raise RuntimeError("Filter stage failed")
+    ctx["pins"].append(filter_key)
+    ctx.update(current=filtered_output, filter_key=filter_key)
+
+
+def _source_compression(ctx, scheduler):
+    """HandBrake-compress the source itself (no filters); returns the compressed path or None"""
+    job, input_path, metrics = ctx["job"], ctx["job"]["input"], ctx["metrics"]
+    with scheduler.cpu_slot("handbrake") as (_, cpu):
+        compress = lambda path: apply_handbrake_preprocessing(input_path, path, metrics=metrics, cpu=cpu,
+                                                              **ctx["quality"])
+        if job.get("cache"):
+            handbrake_key, handbrake_params = handbrake_stage_key(input_fingerprint(input_path), **ctx["quality"])
+            compressed_output = cached_stage(handbrake_key, "handbrake", compress, handbrake_params, input_path,
+                                             pin=True)
+            if compressed_output:
+                ctx["pins"].append(handbrake_key)
+            return compressed_output
+        compressed_output = os.path.join(job["output_dir"], f"{ctx['base']}_compressed.mp4")
+        ctx["intermediates"].append(compressed_output)
+        return compressed_output if compress(compressed_output) else None
+
+
+def _search_quality(ctx, encoder):
+    """Rate factor meeting the job's quality target for encoder, as keyword arguments (empty without a target)"""
+    job = ctx["job"]
+    if job.get("target_quality") is None:
+        return {}
+    # The caller holds a single scheduler slot, so the trial encodes run one at a time inside it
+    search = search_quality(job["input"], job["presets"], float(job["target_quality"]),
+                            metric=job.get("quality_metric", DEFAULT_METRIC), encoder=encoder,
+                            samples=job.get("quality_samples", DEFAULT_QUALITY_SAMPLES), max_parallel=1)
+    ctx["result"]["quality"] = f"{search['label']} {search['value']}"
+    print(f"🎯 {ctx['name']}: {search['label']} {search['value']} "
+          f"({search['metric'].upper()} {search['score']:.2f}, {format_elapsed_time(search['seconds'])})")
+    return {"quality": search["value"]}
+
+
+def encode_stage(ctx, scheduler):
+    """Plan the job, then run its filter encode (or its only encode) under an encoder slot"""
+    job, input_path, metrics = ctx["job"], ctx["job"]["input"], ctx["metrics"]
+    if job.get("auto_presets"):
+        analysis = analyze_exposure(input_path)
+        job = ctx["job"] = dict(job, presets=apply_recommendation(job["presets"], analysis))
+        print(f"🔆 {ctx['name']}: {'+'.join(job['presets'])} (analysis {format_elapsed_time(analysis['seconds'])})")
+    if job.get("plan"):
+        plan = plan_job(input_path, job["presets"], job["handbrake"], stream=job.get("stream"))
+        ctx["strategy"] = ctx["result"]["strategy"] = plan["strategy"]
+        job = ctx["job"] = dict(job, handbrake=plan["use_handbrake"])
+        print(f"🧭 {ctx['name']}: {ctx['strategy']} (~{format_elapsed_time(plan['estimated_seconds'])})")
+
+    if ctx["strategy"] != "remux" and job["handbrake"]:
+        # The x264 trial encodes stand in for HandBrake, so the search takes the HandBrake slot
+        with scheduler.slot("handbrake"):
+            ctx["quality"] = _search_quality(ctx, "handbrake")
+
+    if ctx["strategy"] in ("remux", "compress") or (job["handbrake"] and job.get("stream")):
+        return
+    if job["handbrake"] and job.get("cache"):
+        _cached_filter_stage(ctx, scheduler)
+    elif job["handbrake"]:
+        scratch = ctx["scratch"] = ScratchSpace(ctx["base"], root=job.get("scratch_dir")).open()
+        filtered_output, intermediate = scratch.intermediate_path(input_path, f"{ctx['base']}_filtered",
+                                                                  job.get("intermediate"))
+        # Scratch intermediates are CPU encodes (x264/FFV1), so they count against the CPU slots only
+        with scheduler.cpu_slot("cpu") as (resource, cpu):
+            ctx["result"]["encoder"] = resource
+            apply_filters_only(input_path, job["presets"], filtered_output, metrics=metrics,
+                               intermediate=intermediate, cpu=cpu)
+        ctx.update(current=filtered_output)
+    else:
+        final_output = _final_output_path(ctx, False)
+        with scheduler.cpu_slot(*scheduler.encoder_candidates()) as (resource, cpu):
+            ctx["result"]["encoder"] = resource
+            quality = _search_quality(ctx, "h264_nvenc" if resource == "nvenc" else "libx264")
+            apply_itsscale_with_encode(input_path, job["itsscale"], job["presets"],
+                                       final_output, use_gpu=(resource == "nvenc"), metrics=metrics, cpu=cpu,
+                                       **quality)
+        ctx.update(final_output=final_output, done=True)
+
+
+def compress_stage(ctx, scheduler):
+    """HandBrake compression (or the whole streaming pipeline) under the HandBrake slot"""
+    job, metrics = ctx["job"], ctx["metrics"]
+    if ctx["done"] or ctx["compressed"] or ctx["strategy"] == "remux":
+        return
+    if ctx["strategy"] == "compress":
+        compressed_output = _source_compression(ctx, scheduler)
+        if compressed_output:
+            ctx.update(current=compressed_output, compressed=True, consume=bool(ctx["intermediates"]))
+    elif job["handbrake"] and job.get("stream"):
+        final_output = _final_output_path(ctx, True)
+        # The x264 "slower" compression stage dominates, so it takes the HandBrake slot
+        with scheduler.slot("handbrake"):
+            ctx["result"]["encoder"] = "libx264"
+            apply_streaming_pipeline(job["input"], job["presets"], job["itsscale"], final_output, metrics=metrics,
+                                     **ctx["quality"])
+        ctx.update(final_output=final_output, done=True)
+    elif job["handbrake"] and job.get("cache"):
+        filtered_output = ctx["current"]
+        handbrake_key, handbrake_params = handbrake_stage_key(ctx["filter_key"], **ctx["quality"])
+        with scheduler.cpu_slot("handbrake") as (_, cpu):
+            compressed_output = cached_stage(
+                handbrake_key, "handbrake",
+                lambda path: apply_handbrake_preprocessing(filtered_output, path, metrics=metrics, cpu=cpu,
+                                                           **ctx["quality"]),
+                handbrake_params, ctx["filter_key"], pin=True)
+        if compressed_output:
+            ctx["pins"].append(handbrake_key)
+            ctx.update(current=compressed_output, compressed=True)
+    elif job["handbrake"]:
+        handbrake_output = os.path.join(job["output_dir"], f"{ctx['base']}_compressed.mp4")
+        ctx["intermediates"].append(handbrake_output)
+        with scheduler.cpu_slot("handbrake") as (_, cpu):
+            compressed = apply_handbrake_preprocessing(ctx["current"], handbrake_output, metrics=metrics, cpu=cpu,
+                                                       **ctx["quality"])
+        if compressed:
+            ctx.update(current=handbrake_output, compressed=True, consume=True)
+        else:
+            # The scratch intermediate is not meant for delivery: encode filters + itsscale directly
+            final_output = _final_output_path(ctx, False)
+            with scheduler.cpu_slot(*scheduler.encoder_candidates()) as (resource, cpu):
+                apply_itsscale_with_encode(job["input"], job["itsscale"], job["presets"], final_output,
+                                           use_gpu=(resource == "nvenc"), metrics=metrics, cpu=cpu)
+            ctx.update(final_output=final_output, done=True)
+
+
+def remux_stage(ctx, scheduler):
+    """itsscale on whatever the earlier stages produced, under a remux slot"""
+    if ctx["done"]:
+        return
+    final_output = _final_output_path(ctx, ctx["compressed"])
+    with scheduler.slot("remux"):
+        apply_itsscale_only(ctx["current"], ctx["job"]["itsscale"], final_output,
+                            metrics=ctx["metrics"], consume_input=ctx["consume"])
+    ctx.update(final_output=final_output, done=True)
+
+
+JOB_STAGES = (("encode", encode_stage), ("compress", compress_stage), ("remux", remux_stage))
+
+
+def _finish_job(ctx, error=None):
+    """Remove intermediates, release cached artifacts and fill in the job's result record"""
+    result = ctx["result"]
+    if error is None:
+        try:
+            result["bytes_out"] = os.path.getsize(ctx["final_output"])
+            result["output"] = ctx["final_output"]
+            result["status"] = "ok"
+        except (OSError, TypeError) as e:
+            error = str(e)
+    result["error"] = error
+    for path in ctx["intermediates"]:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    if ctx["scratch"]:
+        ctx["scratch"].cleanup()
+    for key in ctx["pins"]:
+        release_artifact(key)
+    result["elapsed"] = time.time() - ctx["start_time"]
+    result["metrics"] = ctx["metrics"].to_record(result["output"], result["status"], result["error"])
+    return result
+
+
+def run_job(job, scheduler):
+    """Run one job's stages in sequence, holding a scheduler slot for each stage"""
+    ctx = _new_job_context(job)
+    error = None
+    try:
+        for _, stage in JOB_STAGES:
+            stage(ctx, scheduler)
+    except Exception as e:
+        error = str(e)
+    return _finish_job(ctx, error)
+
+
+def run_pipelined_jobs(jobs, scheduler, fail_fast=False):
+    """Run jobs through an encode → compress → remux stage pipeline; results in job order
+
+    Each stage has as many workers as its resource has slots and a one-item queue in front,
+    so while one file is in HandBrake the next is already encoding and a third is remuxing.
+    """
+    limits = scheduler.limits
+    workers = {
+        "encode": sum(limits.get(name, 0) for name in scheduler.encoder_candidates()),
+        "compress": limits.get("handbrake", 0),
+        "remux": limits.get("remux", 0)
+    }
+    stages = [Stage(name, lambda ctx, stage=stage: stage(ctx, scheduler), workers=workers[name])
+              for name, stage in JOB_STAGES]
+    contexts = [_new_job_context(job) for job in jobs]
+
+    def finish(ctx):
+        error = {"ok": None, "cancelled": "Cancelled"}.get(ctx["status"], ctx["error"])
+        result = _finish_job(ctx, error)
+        if ctx["status"] == "cancelled":
+            result["status"] = "cancelled"
+
+    run_pipeline(contexts, stages, finish=finish, fail_fast=fail_fast)
+    return [ctx["result"] for ctx in contexts]
+
+
+def batch_cpu_allocator(jobs, limits, pin=False):
+    """One CPU set per process that can run at once, or None when only one can"""
+    parts = min(len(jobs), sum(limits.get(name, 0) for name in CPU_HEAVY_RESOURCES))
+    return CpuAllocator(parts, pin=pin) if parts > 1 else None
+
+
+def run_batch(jobs, limits=None, pipeline=False, fail_fast=False, cpu_budget=True, pin_cpus=False):
+    """Run all jobs through the scheduler and return (results, summary)
+
+    With cpu_budget, concurrent ffmpeg/HandBrakeCLI processes split the cores instead of each
+    starting a thread per core; pin_cpus also binds each one to its CPU set.
+    """
+    limits = limits or default_resource_limits()
+    cpu_allocator = batch_cpu_allocator(jobs, limits, pin=pin_cpus) if cpu_budget else None
+    scheduler = ResourceScheduler(limits, cpu_allocator)
+
+    # Enough workers to keep every resource busy; stages block on their own slot
+    max_workers = max(1, min(len(jobs), sum(limits.values())))
+
+    print(f"📦 Batch: {len(jobs)} job(s) | slots: " +
+          ", ".join(f"{name}={count}" for name, count in limits.items()) +
+          (" | pipelined" if pipeline else ""))
+    if cpu_allocator:
+        # With more processes than cores, several slots hand out the same set
+        sets = list({id(allocation): allocation for allocation in cpu_allocator.free}.values())
+        threads = sorted(allocation["threads"] for allocation in sets)
+        sizes = f"{threads[0]}" if threads[0] == threads[-1] else f"{threads[0]}-{threads[-1]}"
+        shared = (f", shared by {len(cpu_allocator.free)} processes (more than cores)"
+                  if len(cpu_allocator.free) > len(sets) else "")
+        print(f"🧮 CPU budget: {len(threads)} set(s) of {sizes} thread(s) across "
+              f"{len(cpu_allocator.topology['nodes'])} NUMA node(s)" + shared +
+              (", pinned" if cpu_allocator.pin else ""))
+
+    # Concurrent jobs would overwrite each other's live progress line
+    set_live_progress(False)
+    start_time = time.time()
+    if pipeline:
+        results = run_pipelined_jobs(jobs, scheduler, fail_fast=fail_fast)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(lambda job: run_job(job, scheduler), jobs))
+    wall_time = time.time() - start_time
+
+    summary = summarize_batch(results, wall_time, scheduler)
+    return results, summary
+
+
+def summarize_batch(results, wall_time, scheduler):
+    """Aggregate throughput figures for a finished batch"""
+    succeeded = [r for r in results if r["status"] == "ok"]
+    bytes_in = sum(r["bytes_in"] for r in succeeded)
+    bytes_out = sum(r["bytes_out"] for r in succeeded)
+    return {
+        "jobs": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "wall_time": wall_time,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "throughput_mb_s": (bytes_in / (1024 * 1024)) / wall_time if wall_time > 0 else 0.0,
+        "jobs_per_hour": len(succeeded) * 3600 / wall_time if wall_time > 0 else 0.0,
+        "resource_busy_seconds": dict(scheduler.busy_seconds),
+        "resource_limits": dict(scheduler.limits)
+    }
+
+
+def print_batch_report(results, summary):
+    """Print per-job results followed by aggregate throughput"""
+    print("\n📋 Batch Results")
+    print("=" * 55)
+    for r in results:
+        name = os.path.basename(r["input"])
+        if r["status"] == "ok":
+            size_mb = r["bytes_out"] / (1024 * 1024)
+            print(f"✅ {name} → {r['output']} ({size_mb:.1f}MB, "
+                  f"{format_elapsed_time(r['elapsed'])}, {r['encoder']})")
+        else:
+            print(f"❌ {name}: {r['error']}")
+
+    print("=" * 55)
+    print(f"📊 {summary['succeeded']}/{summary['jobs']} succeeded in "
+          f"{format_elapsed_time(summary['wall_time'])}")
+    print(f"🚀 Throughput: {summary['throughput_mb_s']:.1f}MB/s input | "
+          f"{summary['jobs_per_hour']:.1f} jobs/hour")
+    for name, seconds in summary["resource_busy_seconds"].items():
+        limit = summary["resource_limits"][name]
+        if limit and summary["wall_time"] > 0:
+            utilization = seconds / (limit * summary["wall_time"]) * 100
+            print(f"   {name}: {limit} slot(s), {utilization:.0f}% utilized")
+
+
+def write_batch_report(path, results, summary):
+    """Write per-job results and the summary as JSON"""
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "jobs": results}, f, indent=2)
@@ -0,0 +1,320 @@
+"""
+Benchmark
+Reproducible speed measurements for presets, preset combinations and encoders
+"""
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache_utils import get_cache_dir
+from .capabilities import get_capabilities
+from .cpu_topology import CpuAllocator, detect_topology
+from .ffmpeg_processor import ENCODER_PROFILES, select_encoder, apply_itsscale_with_encode
+from .frame_engine import apply_itsscale_with_engine
+from .lut_baker import UnsupportedFilterError
+from .preset_manager import load_color_presets
+from .progress_monitor import JobMetrics, set_live_progress
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160)
+}
+SOURCES = ("testsrc2", "mandelbrot")
+
+# Combinations operators actually use, benchmarked alongside the single presets
+COMMON_COMBINATIONS = [
+    ["colors_lut_medium", "sharpness_clarity_high", "high_brightness"],
+    ["hdr_vivid_direct", "sharpness_clarity_high"],
+    ["colors_lut_medium", "hdr_vivid_direct"],
+    ["low_brightness", "colors_lut_low", "sharpness_clarity_low"]
+]
+
+# Pseudo-encoder: the NumPy frame engine in front of libx264, compared against the libx264 filter path
+FRAME_ENGINE = "numpy+libx264"
+
+DEFAULT_THRESHOLD = 0.10
+# Headless invocations that must start (imports, argument parsing, cached capabilities) within the budget
+STARTUP_COMMANDS = (["--help"], ["batch", "--help"], ["capabilities"], ["cache", "list"])
+DEFAULT_STARTUP_BUDGET = 0.5
+# Concurrent encodes with every process using all cores, with split thread budgets, and also pinned
+CONCURRENCY_MODES = ("default", "budget", "pinned")
+BENCH_FORMAT = 1
+
+
+def generate_clip(source, resolution, seconds=5, fps=30):
+    """Create (or reuse) a synthetic lavfi clip with a sine audio track"""
+    width, height = RESOLUTIONS[resolution]
+    path = os.path.join(get_cache_dir("bench"), f"{source}_{resolution}_{seconds}s_{fps}fps.mp4")
+    if os.path.exists(path):
+        return path
+
+    temp_path = f"{path}.{os.getpid()}.tmp.mp4"
+    subprocess.run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"{source}=size={width}x{height}:rate={fps}",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "16", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k",
+        temp_path
+    ], check=True)
+    os.replace(temp_path, path)
+    return path
+
+
+def build_cases(color_presets, preset_filter=None, include_combinations=True):
+    """Preset lists to benchmark: 'none', every single preset, then the common combinations"""
+    keys = [key for key in color_presets if preset_filter is None or key in preset_filter]
+    cases = [[key] for key in keys]
+    if include_combinations:
+        for combination in COMMON_COMBINATIONS:
+            if all(key in color_presets for key in combination):
+                cases.append(combination)
+    return cases
+
+
+def available_encoders():
+    """Encoder profiles this machine can actually run"""
+    encoders = ["libx264"]
+    if select_encoder(use_gpu=True) == "h264_nvenc":
+        encoders.insert(0, "h264_nvenc")
+    return encoders
+
+
+def run_case(clip_path, preset_keys, encoder, work_dir, repeat=1):
+    """Encode one clip through the real processing path and return the best of N runs"""
+    runs = []
+    for attempt in range(repeat):
+        output_path = os.path.join(work_dir, f"bench_{attempt}.mp4")
+        metrics = JobMetrics(clip_path)
+        if encoder == FRAME_ENGINE:
+            apply_itsscale_with_engine(clip_path, 1, preset_keys, output_path, use_gpu=False, metrics=metrics)
+        else:
+            apply_itsscale_with_encode(clip_path, 1, preset_keys, output_path,
+                                       use_gpu=(encoder == "h264_nvenc"), metrics=metrics)
+        stage = metrics.stages[-1]
+        runs.append(stage)
+        os.remove(output_path)
+
+    best = min(runs, key=lambda stage: stage["seconds"])
+    return {
+        "wall_seconds": best["seconds"],
+        "wall_seconds_median": statistics.median(stage["seconds"] for stage in runs),
+        "frames": best["frames"],
+        "fps": best["avg_fps"],
+        "cpu_seconds": best["cpu_seconds"],
+        "peak_rss_mb": best["peak_rss_kb"] / 1024 if best["peak_rss_kb"] else None,
+        "runs": len(runs)
+    }
+
+
+def case_name(source, resolution, preset_keys, encoder):
+    """Stable identifier used to match results against a baseline"""
+    return f"{source}/{resolution}/{'+'.join(preset_keys)}/{encoder}"
+
+
+def run_benchmarks(resolutions=("720p",), sources=("testsrc2",), seconds=5, preset_filter=None,
+                   encoders=None, repeat=1, include_combinations=True):
+    """Run every case and return a JSON-serializable result document"""
+    color_presets = load_color_presets()
+    cases = build_cases(color_presets, preset_filter, include_combinations)
+    encoders = [e for e in (encoders or available_encoders()) if e in ENCODER_PROFILES or e == FRAME_ENGINE]
+    capabilities = get_capabilities()
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        for source in sources:
+            for resolution in resolutions:
+                clip_path = generate_clip(source, resolution, seconds)
+                for encoder in encoders:
+                    for preset_keys in cases:
+                        name = case_name(source, resolution, preset_keys, encoder)
+                        print(f"\n⏱️  {name}")
+                        try:
+                            result = run_case(clip_path, preset_keys, encoder, work_dir, repeat)
+                            result["status"] = "ok"
+                        except (subprocess.CalledProcessError, OSError, UnsupportedFilterError) as e:
+                            result = {"status": "failed", "error": str(e)}
+                        result.update({"name": name, "source": source, "resolution": resolution,
+                                       "presets": preset_keys, "encoder": encoder})
+                        results.append(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "format": BENCH_FORMAT,
+        "created": time.time(),
+        "environment": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": capabilities["ffmpeg"]["version"],
+            "gpus": capabilities["nvidia"]["gpus"]
+        },
+        "settings": {"seconds": seconds, "repeat": repeat},
+        "results": results
+    }
+
+
+def measure_startup(commands=STARTUP_COMMANDS, repeat=5, budget=DEFAULT_STARTUP_BUDGET):
+    """Wall time of fresh `python main.py ...` processes, fastest of repeat runs, against a budget in seconds"""
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for args in commands:
+        cmd = [sys.executable, os.path.join(app_dir, "main.py"), *args]
+        times = []
+        returncode = 0
+        # The first run may fill the capability cache; keeping the fastest run ignores it
+        for _ in range(max(1, repeat)):
+            start_time = time.perf_counter()
+            returncode = subprocess.run(cmd, cwd=app_dir, capture_output=True).returncode
+            times.append(time.perf_counter() - start_time)
+        results.append({"command": " ".join(args), "seconds": min(times), "median": statistics.median(times),
+                        "returncode": returncode, "over_budget": min(times) > budget or returncode != 0})
+    return {"budget": budget, "python": platform.python_version(), "results": results}
+
+
+def print_startup_report(report):
+    """Startup time per command; returns True when every command started within budget"""
+    print(f"\n⏱️  Startup time (budget {report['budget'] * 1000:.0f} ms)")
+    print("=" * 60)
+    for r in report["results"]:
+        status = "❌" if r["over_budget"] else "✅"
+        failed = f" (exit {r['returncode']})" if r["returncode"] else ""
+        print(f"{status} main.py {r['command']:<24} {r['seconds'] * 1000:>7.0f} ms "
+              f"(median {r['median'] * 1000:.0f} ms){failed}")
+    return not any(r["over_budget"] for r in report["results"])
+
+
+def run_concurrency_benchmark(clip_path, preset_keys, jobs, encoder="libx264", repeat=1, modes=CONCURRENCY_MODES):
+    """Aggregate fps of jobs simultaneous encodes of one clip, per CPU allocation mode"""
+    topology = detect_topology()
+    set_live_progress(False)
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        for mode in modes:
+            allocator = None if mode == "default" else CpuAllocator(jobs, topology, pin=(mode == "pinned"))
+            runs = []
+            for attempt in range(repeat):
+                metrics = [JobMetrics(clip_path) for _ in range(jobs)]
+
+                def encode(index):
+                    output_path = os.path.join(work_dir, f"concurrent_{mode}_{attempt}_{index}.mp4")
+                    if allocator is None:
+                        apply_itsscale_with_encode(clip_path, 1, preset_keys, output_path,
+                                                   use_gpu=(encoder == "h264_nvenc"), metrics=metrics[index])
+                    else:
+                        with allocator.allocation() as cpu:
+                            apply_itsscale_with_encode(clip_path, 1, preset_keys, output_path,
+                                                       use_gpu=(encoder == "h264_nvenc"), metrics=metrics[index],
+                                                       cpu=cpu)
+                    os.remove(output_path)
+
+                print(f"\n⏱️  {jobs} concurrent encode(s), {mode}")
+                start_time = time.time()
+                with ThreadPoolExecutor(max_workers=jobs) as pool:
+                    list(pool.map(encode, range(jobs)))
+                wall_seconds = time.time() - start_time
+                frames = sum(m.stages[-1]["frames"] or 0 for m in metrics)
+                cpu_seconds = [m.stages[-1]["cpu_seconds"] for m in metrics]
+                runs.append({"wall_seconds": wall_seconds, "frames": frames,
+                             "cpu_seconds": sum(cpu_seconds) if None not in cpu_seconds else None})
+            best = min(runs, key=lambda run: run["wall_seconds"])
+            results.append(dict(best, mode=mode, aggregate_fps=best["frames"] / best["wall_seconds"]
+                                if best["wall_seconds"] else None))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "format": BENCH_FORMAT,
+        "created": time.time(),
+        "clip": os.path.basename(clip_path),
+        "presets": list(preset_keys),
+        "encoder": encoder,
+        "jobs": jobs,
+        "topology": {"cpus": topology["cpus"], "nodes": len(topology["nodes"]),
+                     "cores": sum(len(cores) for cores in topology["nodes"])},
+        "results": results
+    }
+
+
+def print_concurrency_report(report):
+    """Aggregate fps per allocation mode, relative to every process using all cores"""
+    topology = report["topology"]
+    print(f"\n📊 {report['jobs']} concurrent {report['encoder']} encode(s) of {report['clip']} "
+          f"({'+'.join(report['presets'])}) | {topology['cpus']} CPUs, {topology['cores']} cores, "
+          f"{topology['nodes']} NUMA node(s)")
+    print("=" * 72)
+    print(f"{'mode':<10} {'wall':>9} {'aggregate fps':>14} {'cpu':>9} {'vs default':>11}")
+    baseline = next((r["aggregate_fps"] for r in report["results"] if r["mode"] == "default"), None)
+    for r in report["results"]:
+        fps = f"{r['aggregate_fps']:.1f}" if r["aggregate_fps"] else "--"
+        cpu = f"{r['cpu_seconds']:.1f}s" if r["cpu_seconds"] is not None else "--"
+        change = f"{(r['aggregate_fps'] / baseline - 1) * 100:+.1f}%" if baseline and r["aggregate_fps"] else "--"
+        print(f"{r['mode']:<10} {r['wall_seconds']:>8.2f}s {fps:>14} {cpu:>9} {change:>11}")
+
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """Cases whose best wall time grew by more than threshold versus the baseline"""
+    baseline_results = {r["name"]: r for r in baseline.get("results", []) if r.get("status") == "ok"}
+    regressions = []
+    for result in report["results"]:
+        previous = baseline_results.get(result["name"])
+        if result.get("status") != "ok" or not previous:
+            continue
+        slowdown = result["wall_seconds"] / previous["wall_seconds"] - 1 if previous["wall_seconds"] else 0
+        if slowdown > threshold:
+            regressions.append({
+                "name": result["name"],
+                "baseline_seconds": previous["wall_seconds"],
+                "current_seconds": result["wall_seconds"],
+                "baseline_fps": previous.get("fps"),
+                "current_fps": result.get("fps"),
+                "slowdown": slowdown
+            })
+    return regressions
+
+
+def print_benchmark_report(report, regressions=None):
+    """Table of results, then regressions if a baseline was given"""
+    print("\n📊 Benchmark Results")
+    print("=" * 100)
+    print(f"{'case':<60} {'fps':>8} {'wall':>8} {'cpu':>8} {'rss MB':>8}")
+    for r in report["results"]:
+        if r["status"] != "ok":
+            print(f"{r['name']:<60} {'FAILED':>8}  {r.get('error', '')}")
+            continue
+        fps = f"{r['fps']:.1f}" if r.get("fps") else "--"
+        cpu = f"{r['cpu_seconds']:.1f}s" if r.get("cpu_seconds") is not None else "--"
+        rss = f"{r['peak_rss_mb']:.0f}" if r.get("peak_rss_mb") else "--"
+        print(f"{r['name']:<60} {fps:>8} {r['wall_seconds']:>7.2f}s {cpu:>8} {rss:>8}")
+
+    if regressions is None:
+        return
+    print("=" * 100)
+    if not regressions:
+        print("✅ No regressions against baseline")
+        return
+    print(f"❌ {len(regressions)} regression(s) against baseline:")
+    for r in regressions:
+        print(f"   {r['name']}: {r['baseline_seconds']:.2f}s → {r['current_seconds']:.2f}s "
+              f"(+{r['slowdown'] * 100:.0f}%)")
+
+
+def save_report(path, report):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,15 @@
+"""
+Cache Utilities
+Shared on-disk cache locations
+"""
+import os
+
+CACHE_ROOT_ENV = "VIDEO_ENHANCER_CACHE"
+DEFAULT_CACHE_ROOT = ".cache"
+
+def get_cache_dir(name):
+    """Return (and create) a named cache directory under the cache root"""
+    root = os.environ.get(CACHE_ROOT_ENV, DEFAULT_CACHE_ROOT)
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path
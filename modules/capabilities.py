@@ -0,0 +1,217 @@
+"""
+Capability Registry
+Detects what the local ffmpeg, HandBrakeCLI and GPU support, cached on disk
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .cache_utils import get_cache_dir
+
+# Re-probe at least once a day even when no binary changed (drivers, GPUs)
+CAPABILITY_TTL = 24 * 3600
+CAPABILITY_FORMAT = 1
+PROBED_BINARIES = ("ffmpeg", "HandBrakeCLI", "nvidia-smi")
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def _binary_signature(name):
+    """Path, mtime and size of a binary on PATH, or None if it is missing"""
+    path = shutil.which(name)
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _run_probe(cmd, timeout=10):
+    """Run a probe command and return its stdout, or None if it failed"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def _parse_encoders_listing(output):
+    """Encoder names from 'ffmpeg -encoders'; the table starts after the '------' legend"""
+    names = []
+    in_table = False
+    for line in (output or "").splitlines():
+        if not in_table:
+            in_table = line.strip().startswith("------")
+            continue
+        parts = line.split()
+        if len(parts) >= 2:
+            names.append(parts[1])
+    return names
+
+
+def _parse_filters_listing(output):
+    """Filter names from 'ffmpeg -filters'; table rows have a flags column then the name"""
+    names = []
+    for line in (output or "").splitlines():
+        parts = line.split()
+        # Rows look like " TSC lut3d  V->V  Adjust colors using a 3D LUT."
+        if len(parts) >= 3 and "->" in parts[2]:
+            names.append(parts[1])
+    return names
+
+
+def probe_ffmpeg():
+    """Version, encoders, filters and hwaccels of the ffmpeg on PATH"""
+    # The four listings are independent ffmpeg runs, so they start together
+    commands = {
+        "version": ["ffmpeg", "-version"],
+        "hwaccels": ["ffmpeg", "-hide_banner", "-hwaccels"],
+        "encoders": ["ffmpeg", "-hide_banner", "-encoders"],
+        "filters": ["ffmpeg", "-hide_banner", "-filters"]
+    }
+    with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+        outputs = dict(zip(commands, pool.map(_run_probe, commands.values())))
+    version_output = outputs["version"]
+    if version_output is None:
+        return {"available": False, "version": None, "encoders": [], "filters": [], "hwaccels": []}
+
+    version_line = version_output.split("\n")[0]
+    version_parts = version_line.split()
+    hwaccels = [line.strip() for line in (outputs["hwaccels"] or "").splitlines()[1:] if line.strip()]
+    return {
+        "available": True,
+        "version": version_parts[2] if len(version_parts) > 2 else version_line,
+        "encoders": _parse_encoders_listing(outputs["encoders"]),
+        "filters": _parse_filters_listing(outputs["filters"]),
+        "hwaccels": hwaccels
+    }
+
+
+def probe_handbrake():
+    """Version of the HandBrakeCLI on PATH"""
+    output = _run_probe(["HandBrakeCLI", "--version"])
+    if output is None:
+        return {"available": False, "version": None}
+    version_parts = output.split("\n")[0].split()
+    return {"available": True, "version": " ".join(version_parts[:2])}
+
+
+def probe_nvidia_gpu():
+    """Names of NVIDIA GPUs reported by nvidia-smi"""
+    output = _run_probe(["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"], timeout=5)
+    if output is None:
+        return {"available": False, "gpus": []}
+    gpus = [line.strip() for line in output.splitlines() if line.strip()]
+    return {"available": bool(gpus), "gpus": gpus}
+
+
+def _cache_path():
+    return os.path.join(get_cache_dir("capabilities"), "capabilities.json")
+
+
+def _load_cached(signatures):
+    """Cached capabilities if the probed binaries are unchanged and the TTL has not expired"""
+    try:
+        with open(_cache_path(), "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("format") != CAPABILITY_FORMAT or cached.get("signatures") != signatures:
+        return None
+    if time.time() - cached.get("created", 0) > CAPABILITY_TTL:
+        return None
+    return cached
+
+
+def _save_cached(registry):
+    path = _cache_path()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(registry, f, indent=2)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def build_capabilities(signatures):
+    """Probe every binary concurrently and return a fresh registry"""
+    # Missing binaries fail at once; the slowest probe (often nvidia-smi) bounds the total
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        ffmpeg = pool.submit(probe_ffmpeg)
+        handbrake = pool.submit(probe_handbrake)
+        nvidia = pool.submit(probe_nvidia_gpu)
+        return {
+            "format": CAPABILITY_FORMAT,
+            "created": time.time(),
+            "signatures": signatures,
+            "ffmpeg": ffmpeg.result(),
+            "handbrake": handbrake.result(),
+            "nvidia": nvidia.result()
+        }
+
+
+def get_capabilities(refresh=False):
+    """Capability registry, probed at most once per process and persisted with a TTL"""
+    global _registry
+    with _registry_lock:
+        if _registry is not None and not refresh:
+            return _registry
+
+        signatures = {name: _binary_signature(name) for name in PROBED_BINARIES}
+        registry = None if refresh else _load_cached(signatures)
+        if registry is None:
+            registry = build_capabilities(signatures)
+            _save_cached(registry)
+        _registry = registry
+        return registry
+
+
+def has_encoder(name):
+    """Whether the local ffmpeg build lists an encoder"""
+    return name in get_capabilities()["ffmpeg"]["encoders"]
+
+
+def has_filter(name):
+    """Whether the local ffmpeg build lists a filter"""
+    return name in get_capabilities()["ffmpeg"]["filters"]
+
+
+def nvidia_gpu_available():
+    """Whether nvidia-smi reported at least one GPU"""
+    return get_capabilities()["nvidia"]["available"]
+
+
+def handbrake_available():
+    """Whether HandBrakeCLI ran successfully"""
+    return get_capabilities()["handbrake"]["available"]
+
+
+def print_capabilities(registry):
+    """Human-readable capability summary"""
+    ffmpeg = registry["ffmpeg"]
+    print("🧰 Capability Registry")
+    print("=" * 40)
+    if ffmpeg["available"]:
+        print(f"FFmpeg {ffmpeg['version']}: {len(ffmpeg['encoders'])} encoders, "
+              f"{len(ffmpeg['filters'])} filters")
+        for name in ("h264_nvenc", "libx264", "lut3d", "unsharp", "eq", "colorbalance", "curves"):
+            found = name in ffmpeg["encoders"] or name in ffmpeg["filters"]
+            print(f"   {'✅' if found else '❌'} {name}")
+        print(f"   hwaccels: {', '.join(ffmpeg['hwaccels']) or 'none'}")
+    else:
+        print("❌ FFmpeg: NOT FOUND")
+    handbrake = registry["handbrake"]
+    print(f"{'✅' if handbrake['available'] else '⚠️ '} HandBrake CLI: {handbrake['version'] or 'NOT FOUND'}")
+    nvidia = registry["nvidia"]
+    print(f"{'✅' if nvidia['available'] else 'ℹ️ '} NVIDIA GPU: {', '.join(nvidia['gpus']) or 'not detected'}")
+    age = time.time() - registry["created"]
+    print(f"🕒 Probed {int(age)}s ago (refreshed after {CAPABILITY_TTL // 3600}h or when a binary changes)")
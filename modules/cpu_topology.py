@@ -0,0 +1,182 @@
+"""
+CPU Topology
+Splits this machine's cores into per-job CPU sets (whole cores, one NUMA node where possible) with a thread budget
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+SYSFS_ROOT = "/sys/devices/system"
+
+
+def parse_cpu_list(text):
+    """CPU ids from a sysfs list such as '0-3,8-11'"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def usable_cpus():
+    """CPUs this process may run on (its affinity mask, e.g. inside a container)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def detect_topology(root=SYSFS_ROOT, cpus=None):
+    """NUMA nodes → physical cores → hardware threads, restricted to usable CPUs
+
+    Returns {"nodes": [[[cpu, sibling], ...], ...], "cpus": count, "source": "sysfs" | "flat"};
+    without sysfs every CPU counts as its own core on a single node.
+    """
+    cpus = cpus if cpus is not None else usable_cpus()
+    usable = set(cpus)
+    node_of = {}
+    for name in sorted(os.listdir(os.path.join(root, "node"))) if os.path.isdir(os.path.join(root, "node")) else []:
+        if name.startswith("node") and name[4:].isdigit():
+            for cpu in parse_cpu_list(_read(os.path.join(root, "node", name, "cpulist")) or ""):
+                node_of[cpu] = int(name[4:])
+
+    cores = {}
+    source = "sysfs"
+    for cpu in cpus:
+        topology = os.path.join(root, "cpu", f"cpu{cpu}", "topology")
+        package, core = _read(os.path.join(topology, "physical_package_id")), _read(os.path.join(topology, "core_id"))
+        if package is None or core is None:
+            source = "flat"
+            package, core = 0, cpu
+        cores.setdefault((node_of.get(cpu, 0), int(package), int(core)), []).append(cpu)
+
+    nodes = {}
+    for (node, _, _), siblings in sorted(cores.items(), key=lambda item: (item[0][0], min(item[1]))):
+        nodes.setdefault(node, []).append(sorted(cpu for cpu in siblings if cpu in usable))
+    return {"nodes": [nodes[node] for node in sorted(nodes)], "cpus": len(usable), "source": source}
+
+
+def _chunk(cores, count, node_ids):
+    sets = []
+    for index in range(count):
+        chunk = cores[len(cores) * index // count:len(cores) * (index + 1) // count]
+        cpus = sorted(cpu for core in chunk for cpu in core)
+        sets.append({"cpus": cpus, "threads": len(cpus), "nodes": sorted(node_ids)})
+    return sets
+
+
+def partition_cpus(topology, parts):
+    """Split the cores into parts CPU sets of similar size
+
+    SMT siblings always stay together. With at least one set per NUMA node, the sets are spread
+    over the nodes by core count so none straddles two; with fewer, cores are taken in node order.
+    With more parts than cores there is nothing left to split: the sets are handed out round-robin,
+    so processes share whole cores (each still capped at its set's thread count) instead of waiting.
+    """
+    nodes = [(node, cores) for node, cores in enumerate(topology["nodes"]) if cores]
+    total = sum(len(cores) for _, cores in nodes)
+    parts = max(1, parts)
+    if not total:
+        return [{"cpus": None, "threads": 1, "nodes": []} for _ in range(parts)]
+    count = min(parts, total)
+    if count >= len(nodes):
+        shares = {node: 1 for node, _ in nodes}
+        for _ in range(count - len(nodes)):
+            # Next set goes to the node with the most cores per set so far
+            node, _ = max(((node, cores) for node, cores in nodes if shares[node] < len(cores)),
+                          key=lambda item: len(item[1]) / shares[item[0]])
+            shares[node] += 1
+        sets = [allocation for node, cores in nodes for allocation in _chunk(cores, shares[node], [node])]
+    else:
+        flat = [(node, core) for node, cores in nodes for core in cores]
+        sets = []
+        for index in range(count):
+            chunk = flat[total * index // count:total * (index + 1) // count]
+            sets.extend(_chunk([core for _, core in chunk], 1, {node for node, _ in chunk}))
+    return [sets[index % count] for index in range(parts)]
+
+
+class CpuAllocator:
+    """Hands each concurrent process its own CPU set; pin=False only budgets threads"""
+
+    def __init__(self, parts, topology=None, pin=False):
+        self.topology = topology or detect_topology()
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        self.free = partition_cpus(self.topology, parts)
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a CPU set is free and return {"threads": n, "cpus": [...] or None}"""
+        with self._cond:
+            while not self.free:
+                self._cond.wait()
+            allocation = self.free.pop(0)
+        return {"threads": allocation["threads"], "cpus": allocation["cpus"] if self.pin else None,
+                "nodes": allocation["nodes"], "_set": allocation}
+
+    def release(self, allocation):
+        """Return a CPU set to the pool"""
+        with self._cond:
+            self.free.append(allocation["_set"])
+            self._cond.notify_all()
+
+    @contextmanager
+    def allocation(self):
+        """Context manager holding one CPU set"""
+        allocation = self.acquire()
+        try:
+            yield allocation
+        finally:
+            self.release(allocation)
+
+
+def ffmpeg_thread_args(cmd, threads):
+    """ffmpeg command with decoder, filter graph and encoder (x264) threads capped at threads"""
+    cmd = list(cmd)
+    budget = str(max(1, threads))
+    first_input = cmd.index("-i")
+    cmd[first_input:first_input] = ["-threads", budget]
+    # Output options go right before the output path; the last -threads wins over profile defaults
+    cmd[-1:-1] = ["-filter_threads", budget, "-threads", budget]
+    return cmd
+
+
+def handbrake_thread_args(cmd, threads):
+    """HandBrakeCLI command with its x264 encoder limited to threads"""
+    return list(cmd) + ["--encopts", f"threads={max(1, threads)}"]
+
+
+def pin_process(pid, cpus):
+    """Restrict a started process (and the threads it creates from now on) to cpus; False if unsupported"""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(pid, cpus)
+        return True
+    except OSError:
+        return False
+
+
+def describe_allocation(allocation):
+    """Short text like '4 threads on CPUs 0-3 (node 0)'"""
+    text = f"{allocation['threads']} thread(s)"
+    cpus = allocation.get("cpus")
+    if cpus:
+        ranges = []
+        for cpu in cpus:
+            if ranges and cpu == ranges[-1][1] + 1:
+                ranges[-1][1] = cpu
+            else:
+                ranges.append([cpu, cpu])
+        text += " on CPUs " + ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+        text += f" (node {','.join(str(node) for node in allocation['nodes'])})"
+    return text
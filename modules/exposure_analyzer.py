@@ -0,0 +1,210 @@
+"""
+Exposure Analyzer
+Recommends brightness and sharpness presets from a sparse, downscaled sample of keyframes
+"""
+import hashlib
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cache_utils import get_cache_dir
+from .ffmpeg_processor import format_elapsed_time
+from .filter_graph import parse_filter_chain
+from .lut_baker import UnsupportedFilterError, evaluate_color_filters
+from .media_probe import probe_media
+from .preset_manager import load_color_presets
+
+DEFAULT_SAMPLES = 24
+ANALYSIS_WIDTH = 320
+MAX_PARALLEL_DECODES = 4
+ANALYSIS_VERSION = 1
+
+BRIGHTNESS_PRESETS = ("none", "low_brightness", "medium_brightness", "high_brightness")
+SHARPNESS_PRESETS = ("sharpness_clarity_low", "sharpness_clarity_medium", "sharpness_clarity_high")
+
+# Exposure scoring on full-range luma: distance of the mean from mid-grey plus
+# penalties for highlights pushed into clipping and shadows crushed to black
+TARGET_MEAN_LUMA = 0.46
+CLIP_LEVEL = 250 / 255
+CRUSH_LEVEL = 5 / 255
+SHADOW_LEVEL = 0.15
+CLIP_PENALTY = 4.0
+CRUSH_PENALTY = 2.0
+
+# Mean absolute Laplacian (0-255 luma at ANALYSIS_WIDTH) below which footage counts as soft,
+# softest first; anything sharper than the last threshold gets no sharpening
+SHARPNESS_THRESHOLDS = [(2.0, "sharpness_clarity_high"), (3.5, "sharpness_clarity_medium"),
+                        (5.0, "sharpness_clarity_low")]
+
+
+def _require_numpy():
+    if np is None:
+        raise UnsupportedFilterError("NumPy is required for exposure analysis (pip install numpy)")
+
+
+def analysis_size(width, height):
+    """Downscaled (even) frame size used for analysis"""
+    scaled_width = min(ANALYSIS_WIDTH, width) // 2 * 2
+    return scaled_width, max(2, round(height * scaled_width / width / 2) * 2)
+
+
+def sample_times(duration, count):
+    """Evenly spaced seek points, skipping the first and last few percent (fades, slates)"""
+    if not duration:
+        return [0.0]
+    start, end = duration * 0.03, duration * 0.97
+    count = max(1, count)
+    return [start + (end - start) * (i + 0.5) / count for i in range(count)]
+
+
+def build_sample_command(input_path, timestamp, width, height):
+    """Decode the keyframe at (or just before) timestamp only, as small full-range grey luma"""
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        # Input seek without accurate seeking lands on a keyframe; non-keyframes are never decoded
+        "-noaccurate_seek", "-ss", f"{timestamp:.3f}", "-skip_frame", "nokey",
+        "-i", input_path, "-map", "0:v:0", "-frames:v", "1",
+        "-vf", f"scale={width}:{height}:flags=area:out_range=full,format=gray",
+        "-f", "rawvideo", "pipe:1"
+    ]
+
+
+def _decode_sample(input_path, timestamp, width, height):
+    result = subprocess.run(build_sample_command(input_path, timestamp, width, height),
+                            capture_output=True, check=True)
+    if len(result.stdout) < width * height:
+        return None
+    return np.frombuffer(result.stdout[:width * height], dtype=np.uint8).reshape(height, width)
+
+
+def luma_statistics(frames):
+    """Histogram, percentiles, clipping/shadow ratios and detail of a list of grey uint8 frames"""
+    histogram = np.zeros(256, dtype=np.int64)
+    detail = []
+    for frame in frames:
+        histogram += np.bincount(frame.reshape(-1), minlength=256)
+        # Mean absolute 4-neighbour Laplacian: how much fine detail survives the downscale
+        luma = frame.astype(np.float32)
+        laplacian = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1]
+                     - luma[1:-1, :-2] - luma[1:-1, 2:])
+        detail.append(float(np.abs(laplacian).mean()))
+
+    total = histogram.sum()
+    levels = np.arange(256) / 255
+    cumulative = np.cumsum(histogram) / total
+    percentile = lambda p: float(levels[np.searchsorted(cumulative, p)])
+    return {
+        "histogram": histogram.tolist(),
+        "mean": float((histogram * levels).sum() / total),
+        "p05": percentile(0.05),
+        "median": percentile(0.5),
+        "p95": percentile(0.95),
+        "clipped": float(histogram[levels >= CLIP_LEVEL].sum() / total),
+        "crushed": float(histogram[levels <= CRUSH_LEVEL].sum() / total),
+        "shadows": float(histogram[levels < SHADOW_LEVEL].sum() / total),
+        "detail": float(np.median(detail))
+    }
+
+
+def exposure_score(histogram, filter_string):
+    """Cost of the luma distribution after a preset's filters (lower is better)"""
+    weights = np.asarray(histogram, dtype=np.float64)
+    weights /= weights.sum()
+    levels = np.arange(256) / 255
+    grey = np.repeat(levels[:, None], 3, axis=1)
+    # Neutral greys stay (nearly) neutral through these presets, so one channel tracks the new luma
+    mapped = evaluate_color_filters(grey, parse_filter_chain(filter_string))[:, 1] if filter_string else levels
+    mean = float((weights * mapped).sum())
+    clipped = float(weights[mapped >= CLIP_LEVEL].sum())
+    crushed = float(weights[mapped <= CRUSH_LEVEL].sum())
+    return abs(mean - TARGET_MEAN_LUMA) + CLIP_PENALTY * clipped + CRUSH_PENALTY * crushed
+
+
+def recommend_presets(stats, color_presets):
+    """Best brightness preset by simulated exposure and a sharpness preset by measured detail"""
+    scores = {key: exposure_score(stats["histogram"], color_presets[key]["filter"])
+              for key in BRIGHTNESS_PRESETS if key in color_presets}
+    brightness = min(scores, key=scores.get)
+    sharpness = next((key for limit, key in SHARPNESS_THRESHOLDS
+                      if stats["detail"] < limit and key in color_presets), None)
+    return {"brightness": brightness, "sharpness": sharpness, "scores": scores}
+
+
+def _cache_path(input_path, samples):
+    stat = os.stat(input_path)
+    key = json.dumps([os.path.abspath(input_path), stat.st_size, stat.st_mtime_ns, samples, ANALYSIS_WIDTH,
+                      ANALYSIS_VERSION])
+    return os.path.join(get_cache_dir("analysis"), hashlib.sha256(key.encode("utf-8")).hexdigest()[:24] + ".json")
+
+
+def analyze_exposure(input_path, samples=DEFAULT_SAMPLES, use_cache=True):
+    """Sample keyframes, measure exposure and detail, and recommend presets (cached per file)"""
+    _require_numpy()
+    cache_path = _cache_path(input_path, samples)
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            return json.load(f)
+
+    info = probe_media(input_path)
+    video = info["video"]
+    if not video or not video["width"]:
+        raise UnsupportedFilterError("exposure analysis: no video stream")
+    width, height = analysis_size(video["width"], video["height"])
+    times = sample_times(info["duration"], samples)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DECODES) as pool:
+        frames = [frame for frame in pool.map(lambda t: _decode_sample(input_path, t, width, height), times)
+                  if frame is not None]
+    if not frames:
+        raise subprocess.CalledProcessError(1, build_sample_command(input_path, times[0], width, height))
+
+    stats = luma_statistics(frames)
+    analysis = {
+        "input": input_path,
+        "samples": len(frames),
+        "seconds": time.time() - start_time,
+        "duration": info["duration"],
+        "stats": stats,
+        "recommendation": recommend_presets(stats, load_color_presets())
+    }
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(analysis, f)
+    os.replace(temp_path, cache_path)
+    return analysis
+
+
+def apply_recommendation(preset_keys, analysis):
+    """Replace any brightness/sharpness presets in preset_keys with the recommended ones"""
+    recommendation = analysis["recommendation"]
+    kept = [key for key in preset_keys
+            if key not in BRIGHTNESS_PRESETS and key not in SHARPNESS_PRESETS]
+    brightness = [recommendation["brightness"]] if recommendation["brightness"] != "none" else []
+    sharpness = [recommendation["sharpness"]] if recommendation["sharpness"] else []
+    return brightness + kept + sharpness or ["none"]
+
+
+def print_analysis(analysis):
+    """Exposure figures and the recommended presets"""
+    stats = analysis["stats"]
+    recommendation = analysis["recommendation"]
+    share = f", {analysis['seconds'] / analysis['duration'] * 100:.2f}% of real time" if analysis["duration"] else ""
+    print(f"\n🔆 Exposure analysis: {analysis['input']}")
+    print(f"   {analysis['samples']} keyframe(s) in {format_elapsed_time(analysis['seconds'])}{share}")
+    print(f"   Luma mean {stats['mean']:.2f} | p5 {stats['p05']:.2f} | median {stats['median']:.2f} | "
+          f"p95 {stats['p95']:.2f}")
+    print(f"   Clipped {stats['clipped'] * 100:.1f}% | crushed {stats['crushed'] * 100:.1f}% | "
+          f"shadows {stats['shadows'] * 100:.1f}% | detail {stats['detail']:.2f}")
+    print("   Brightness scores: " + ", ".join(f"{key} {score:.3f}"
+                                               for key, score in sorted(recommendation["scores"].items(),
+                                                                        key=lambda item: item[1])))
+    print(f"   💡 Recommended: {recommendation['brightness']}"
+          + (f" + {recommendation['sharpness']}" if recommendation["sharpness"] else " (no sharpening)"))
@@ -4,8 +4,39 @@ Handles video enhancement using FFmpeg with itsscale and color correction filter
 """
 import subprocess
 import time
-from .system_checker import has_nvidia_gpu
-from .preset_manager import load_color_presets, combine_preset_filters
+from .capabilities import get_capabilities
+from .cpu_topology import ffmpeg_thread_args, describe_allocation
+from .media_probe import probe_media
+from .progress_monitor import run_ffmpeg, record_stage
+from .preset_manager import load_color_presets
+from .lut_baker import resolve_preset_filters
+from .mp4_timing import UnsupportedLayoutError, rewrite_itsscale
+from .artifact_cache import input_fingerprint, stage_key
+from .scratch_space import build_intermediate_command
+
+# Encoder command templates, tried in ENCODER_PREFERENCE order against the capability registry
+ENCODER_PROFILES = {
+    "h264_nvenc": {
+        "message": "🟢 NVIDIA GPU detected — using h264_nvenc for encoding (CPU decoding).",
+        "args": ["-c:v", "h264_nvenc", "-preset", "fast", "-profile:v", "main"],
+        "quality_flag": "-cq",
+        "output_args": [],
+        "requires_gpu": True
+    },
+    "libx264": {
+        "message": "🔵 Using CPU (libx264) for encoding.",
+        "args": ["-c:v", "libx264", "-preset", "medium", "-profile:v", "main"],
+        "quality_flag": "-crf",
+        "output_args": ["-movflags", "+faststart"],
+        "requires_gpu": False
+    }
+}
+ENCODER_PREFERENCE = ["h264_nvenc", "libx264"]
+# Consumer NVIDIA drivers cap concurrent NVENC sessions: batches, segment encodes and quality trials
+# run at most this many at once, and extra variant outputs of one pass fall back to libx264
+MAX_NVENC_SESSIONS = 3
+FINAL_QUALITY = 20
+INTERMEDIATE_QUALITY = 18  # Slightly higher quality for intermediate files
 
 def format_elapsed_time(seconds):
     """Format elapsed time in a nice readable format"""
@@ -20,63 +51,65 @@ def format_elapsed_time(seconds):
         minutes = int((seconds % 3600) // 60)
         return f"{hours}h {minutes}m"
 
-def apply_itsscale_with_encode(input_path, itsscale_value, preset_keys, output_path):
-    """Apply itsscale and color correction using FFmpeg with optimal encoder selection"""
-    use_gpu = has_nvidia_gpu()
-    color_presets = load_color_presets()
+def select_encoder(use_gpu=None):
+    """Pick the first encoder profile the local ffmpeg build and hardware support"""
+    capabilities = get_capabilities()
+    encoders = capabilities["ffmpeg"]["encoders"]
+    for name in ENCODER_PREFERENCE:
+        profile = ENCODER_PROFILES[name]
+        if profile["requires_gpu"] and (use_gpu is False or not capabilities["nvidia"]["available"]):
+            continue
+        if name in encoders:
+            return name
+    # Nothing matched (e.g. ffmpeg missing): let ffmpeg report the problem for libx264
+    return "libx264"
+
+def build_encode_command(input_path, output_path, encoder, quality, filter_string=None, itsscale_value=None):
+    """FFmpeg command for one encode with the given encoder profile"""
+    profile = ENCODER_PROFILES[encoder]
+    cmd = ["ffmpeg", "-y"]
+    if itsscale_value is not None:
+        cmd.extend(["-itsscale", str(itsscale_value)])
+    cmd.extend(["-i", input_path])
+    cmd.extend(profile["args"])
+    cmd.extend([profile["quality_flag"], str(quality), "-pix_fmt", "yuv420p"])
+    cmd.extend(profile["output_args"])
+    cmd.extend(["-c:a", "copy"])
     
-    # Combine multiple presets into one filter
-    combined_filter = combine_preset_filters(color_presets, preset_keys)
+    # Add video filter if we have any
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
     
-    # Build video filter chain
-    video_filters = []
+    cmd.append(output_path)
+    return cmd
+
+def get_output_duration(input_path, itsscale_value=1.0):
+    """Expected output duration in seconds for ETA display, or None if it cannot be probed"""
+    try:
+        duration = probe_media(input_path)["duration"]
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+    return duration * float(itsscale_value) if duration else None
+
+def apply_itsscale_with_encode(input_path, itsscale_value, preset_keys, output_path, use_gpu=None, metrics=None,
+                               quality=FINAL_QUALITY, cpu=None):
+    """Apply itsscale and color correction using FFmpeg with optimal encoder selection
+
+    cpu is a cpu_topology allocation: its thread budget caps decode, filter and x264 threads
+    and its CPU set (if any) pins the process.
+    """
+    encoder = select_encoder(use_gpu)
+    color_presets = load_color_presets()
     
-    # Add combined color correction filter if specified
-    if combined_filter:
-        video_filters.append(combined_filter)
-    
-    # Combine all filters
-    filter_string = ",".join(video_filters) if video_filters else None
-
-    if use_gpu:
-        print("🟢 NVIDIA GPU detected — using h264_nvenc for encoding (CPU decoding).")
-        cmd = [
-            "ffmpeg", "-y",
-            "-itsscale", str(itsscale_value),
-            "-i", input_path,
-            "-c:v", "h264_nvenc",
-            "-preset", "fast",
-            "-profile:v", "main",
-            "-cq", "20",
-            "-pix_fmt", "yuv420p",
-            "-c:a", "copy"
-        ]
-        
-        # Add video filter if we have any
-        if filter_string:
-            cmd.extend(["-vf", filter_string])
-            
-        cmd.append(output_path)
-    else:
-        print("🔵 No NVIDIA GPU found — using CPU for encoding.")
-        cmd = [
-            "ffmpeg", "-y",
-            "-itsscale", str(itsscale_value),
-            "-i", input_path,
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-profile:v", "main",
-            "-crf", "20",
-            "-pix_fmt", "yuv420p",
-            "-movflags", "+faststart",
-            "-c:a", "copy"
-        ]
-        
-        # Add video filter if we have any
-        if filter_string:
-            cmd.extend(["-vf", filter_string])
-            
-        cmd.append(output_path)
+    # Combine multiple presets into one filter (color part baked into one LUT where possible)
+    combined_filter = resolve_preset_filters(color_presets, preset_keys)
+    
+    print(ENCODER_PROFILES[encoder]["message"])
+    cmd = build_encode_command(input_path, output_path, encoder, quality,
+                               combined_filter or None, itsscale_value)
+    if cpu:
+        cmd = ffmpeg_thread_args(cmd, cpu["threads"])
+        print(f"🧮 CPU budget: {describe_allocation(cpu)}")
 
     # Display what's being applied
     if len(preset_keys) > 1 and preset_keys != ["none"]:
@@ -92,7 +125,9 @@ def apply_itsscale_with_encode(input_path, itsscale_value, preset_keys, output_p
     start_time = time.time()
     print("🚀 Processing started...")
     
-    subprocess.run(cmd, check=True)
+    run_ffmpeg(cmd, "encode", duration=get_output_duration(input_path, itsscale_value),
+               metrics=metrics, encoder=encoder, input_path=input_path, output_path=output_path,
+               cpus=cpu and cpu["cpus"])
     
     # Calculate and display actual time
     elapsed_time = time.time() - start_time
@@ -100,49 +135,90 @@ def apply_itsscale_with_encode(input_path, itsscale_value, preset_keys, output_p
     print(f"✅ Processing completed in {actual_time}")
 
 
-def apply_filters_only(input_path, preset_keys, output_path):
-    """Apply only color correction filters without itsscale"""
-    use_gpu = has_nvidia_gpu()
+def filter_stage_key(input_path, preset_keys, use_gpu=None):
+    """Artifact cache key and parameters for apply_filters_only on this input"""
+    encoder = select_encoder(use_gpu)
+    combined_filter = resolve_preset_filters(load_color_presets(), preset_keys)
+    params = {
+        "command": build_encode_command("<input>", "<output>", encoder, INTERMEDIATE_QUALITY,
+                                        combined_filter or None),
+        "ffmpeg": get_capabilities()["ffmpeg"]["version"]
+    }
+    return stage_key(input_fingerprint(input_path), "filters", params), params
+
+
+def build_multi_variant_command(input_path, filter_strings, output_paths, encoders, quality, itsscale_value=None):
+    """One decode split into a filtered branch per variant, each with its own encoder and output"""
+    count = len(filter_strings)
+    graph = [f"[0:v]split={count}" + "".join(f"[v{i}]" for i in range(count))]
+    for i, filter_string in enumerate(filter_strings):
+        graph.append(f"[v{i}]{filter_string or 'null'}[out{i}]")
+
+    cmd = ["ffmpeg", "-y"]
+    if itsscale_value is not None:
+        cmd.extend(["-itsscale", str(itsscale_value)])
+    cmd.extend(["-i", input_path, "-filter_complex", ";".join(graph)])
+    for i, output_path in enumerate(output_paths):
+        profile = ENCODER_PROFILES[encoders[i]]
+        cmd.extend(["-map", f"[out{i}]", "-map", "0:a?"])
+        cmd.extend(profile["args"])
+        cmd.extend([profile["quality_flag"], str(quality), "-pix_fmt", "yuv420p"])
+        cmd.extend(profile["output_args"])
+        cmd.extend(["-c:a", "copy", output_path])
+    return cmd
+
+def apply_multi_variant_encode(input_path, itsscale_value, variants, output_paths, use_gpu=None, metrics=None):
+    """Encode several preset combinations from a single decode of the source"""
+    encoder = select_encoder(use_gpu)
+    color_presets = load_color_presets()
+    encoders = [encoder if encoder != "h264_nvenc" or i < MAX_NVENC_SESSIONS else "libx264"
+                for i in range(len(variants))]
+    filter_strings = [resolve_preset_filters(color_presets, preset_keys) for preset_keys in variants]
+
+    print(ENCODER_PROFILES[encoder]["message"])
+    print(f"🎬 Rendering {len(variants)} variant(s) from one decode:")
+    for preset_keys, filter_string, output_path, variant_encoder in zip(variants, filter_strings, output_paths, encoders):
+        names = [color_presets[key]['name'] for key in preset_keys if key != "none"] or ["No Color Correction"]
+        print(f"   • {' + '.join(names)} → {output_path} ({variant_encoder})")
+        if filter_string:
+            print(f"     🔧 {filter_string}")
+
+    cmd = build_multi_variant_command(input_path, filter_strings, output_paths, encoders,
+                                      FINAL_QUALITY, itsscale_value)
+    start_time = time.time()
+    print("🚀 Processing started...")
+
+    run_ffmpeg(cmd, "variants", duration=get_output_duration(input_path, itsscale_value),
+               metrics=metrics, encoder="+".join(sorted(set(encoders))), input_path=input_path,
+               output_path=output_paths[0])
+
+    elapsed_time = time.time() - start_time
+    print(f"✅ {len(variants)} variant(s) completed in {format_elapsed_time(elapsed_time)}")
+
+
+def apply_filters_only(input_path, preset_keys, output_path, use_gpu=None, metrics=None, intermediate=None,
+                       cpu=None):
+    """Apply only color correction filters without itsscale
+
+    intermediate names a scratch_space.INTERMEDIATE_FORMATS codec for throwaway output;
+    without it the encoder profile at INTERMEDIATE_QUALITY is used (cached artifacts).
+    cpu is a cpu_topology allocation, as for apply_itsscale_with_encode.
+    """
     color_presets = load_color_presets()
     
-    # Combine multiple presets into one filter
-    combined_filter = combine_preset_filters(color_presets, preset_keys)
-    
-    if use_gpu:
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", input_path,
-            "-c:v", "h264_nvenc",
-            "-preset", "fast",
-            "-profile:v", "main",
-            "-cq", "18",  # Slightly higher quality for intermediate file
-            "-pix_fmt", "yuv420p",
-            "-c:a", "copy"
-        ]
-        
-        # Add video filter if we have any
-        if combined_filter:
-            cmd.extend(["-vf", combined_filter])
-            
-        cmd.append(output_path)
+    # Combine multiple presets into one filter (color part baked into one LUT where possible)
+    combined_filter = resolve_preset_filters(color_presets, preset_keys)
+    
+    if intermediate:
+        encoder = intermediate
+        cmd = build_intermediate_command(input_path, output_path, intermediate, combined_filter or None)
     else:
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", input_path,
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-profile:v", "main",
-            "-crf", "18",  # Slightly higher quality for intermediate file
-            "-pix_fmt", "yuv420p",
-            "-movflags", "+faststart",
-            "-c:a", "copy"
-        ]
-        
-        # Add video filter if we have any
-        if combined_filter:
-            cmd.extend(["-vf", combined_filter])
-            
-        cmd.append(output_path)
+        encoder = select_encoder(use_gpu)
+        cmd = build_encode_command(input_path, output_path, encoder, INTERMEDIATE_QUALITY,
+                                   combined_filter or None)
+    if cpu:
+        cmd = ffmpeg_thread_args(cmd, cpu["threads"])
+        print(f"🧮 CPU budget: {describe_allocation(cpu)}")
 
     # Display what's being applied
     if len(preset_keys) > 1 and preset_keys != ["none"]:
@@ -158,7 +234,9 @@ def apply_filters_only(input_path, preset_keys, output_path):
     start_time = time.time()
     print("🚀 Processing started...")
     
-    subprocess.run(cmd, check=True)
+    run_ffmpeg(cmd, "filters", duration=get_output_duration(input_path),
+               metrics=metrics, encoder=encoder, input_path=input_path, output_path=output_path,
+               cpus=cpu and cpu["cpus"])
     
     # Calculate and display actual time
     elapsed_time = time.time() - start_time
@@ -166,8 +244,21 @@ def apply_filters_only(input_path, preset_keys, output_path):
     print(f"✅ Filter processing completed in {actual_time}")
 
 
-def apply_itsscale_only(input_path, itsscale_value, output_path):
+def apply_itsscale_only(input_path, itsscale_value, output_path, metrics=None, consume_input=False):
     """Apply only itsscale trick without additional filters - simple copy"""
+    # MP4/MOV: rescale the moov timing fields and reuse mdat as-is; ffmpeg remux otherwise
+    start_time = time.time()
+    try:
+        method = rewrite_itsscale(input_path, output_path, itsscale_value, move_input=consume_input)
+    except (UnsupportedLayoutError, OSError) as e:
+        print(f"ℹ️  Zero-copy itsscale not possible ({e}), remuxing with FFmpeg")
+    else:
+        record_stage(metrics, "itsscale", "mp4_timing", input_path if not consume_input else output_path,
+                     output_path, start_time)
+        print(f"⚡ Applied itsscale {itsscale_value}x by rewriting MP4 timing ({method}) "
+              f"in {time.time() - start_time:.2f}s")
+        return
+
     cmd = [
         "ffmpeg", "-y",
         "-itsscale", str(itsscale_value),
@@ -183,7 +274,8 @@ def apply_itsscale_only(input_path, itsscale_value, output_path):
     start_time = time.time()
     print("🚀 Processing started...")
     
-    subprocess.run(cmd, check=True)
+    run_ffmpeg(cmd, "itsscale", duration=get_output_duration(input_path, itsscale_value),
+               metrics=metrics, encoder="copy", input_path=input_path, output_path=output_path)
     
     # Calculate and display actual time
     elapsed_time = time.time() - start_time
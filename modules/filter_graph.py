@@ -0,0 +1,463 @@
+"""
+Filter Graph
+Parses preset filter strings into typed filter nodes and optimizes the combined chain
+"""
+import threading
+
+from .capabilities import get_capabilities
+
+# Positional option order used by ffmpeg for each filter
+FILTER_OPTION_ORDER = {
+    "eq": ["contrast", "brightness", "saturation", "gamma", "gamma_r", "gamma_g", "gamma_b", "gamma_weight"],
+    "colorbalance": ["rs", "gs", "bs", "rm", "gm", "bm", "rh", "gh", "bh", "pl"],
+    "curves": ["preset", "master", "red", "green", "blue", "all", "psfile", "plot", "interp"],
+    "lut3d": ["file", "clut", "interp"],
+    "unsharp": ["lx", "ly", "la", "cx", "cy", "ca"]
+}
+OPTION_ALIASES = {
+    "curves": {"m": "master", "r": "red", "g": "green", "b": "blue"},
+    "unsharp": {"luma_msize_x": "lx", "luma_msize_y": "ly", "luma_amount": "la",
+                "chroma_msize_x": "cx", "chroma_msize_y": "cy", "chroma_amount": "ca"}
+}
+
+# Curves are composed by resampling the combined response at this many evenly spaced points
+CURVE_SAMPLES = 17
+IDENTITY_TOLERANCE = 1e-4
+
+_compiled_cache = {}
+_compiled_cache_lock = threading.Lock()
+
+
+class FilterNotAvailableError(RuntimeError):
+    """Raised when a preset needs a filter the local ffmpeg build does not have"""
+
+
+def split_unquoted(text, separator):
+    """Split on a separator that is not inside single quotes or escaped"""
+    parts = []
+    current = []
+    quoted = False
+    escaped = False
+    for ch in text:
+        if escaped:
+            current.append(ch)
+            escaped = False
+        elif ch == "\\":
+            current.append(ch)
+            escaped = True
+        elif ch == "'":
+            quoted = not quoted
+            current.append(ch)
+        elif ch == separator and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current))
+    return parts
+
+
+def _unquote(value):
+    """Remove filtergraph quoting and backslash escapes from an option value"""
+    result = []
+    escaped = False
+    for ch in value.strip():
+        if escaped:
+            result.append(ch)
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch != "'":
+            result.append(ch)
+    return "".join(result)
+
+
+def parse_filter_chain(filter_string):
+    """Split a filter chain into (name, options) pairs with positional options named"""
+    filters = []
+    for part in split_unquoted(filter_string or "", ","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg_text = part.partition("=")
+        name = name.strip()
+        order = FILTER_OPTION_ORDER.get(name, [])
+        aliases = OPTION_ALIASES.get(name, {})
+        options = {}
+        if arg_text:
+            for index, arg in enumerate(split_unquoted(arg_text, ":")):
+                key, sep, value = arg.partition("=")
+                if sep and key.strip().isidentifier():
+                    key = key.strip()
+                    options[aliases.get(key, key)] = _unquote(value)
+                elif index < len(order):
+                    options[order[index]] = _unquote(arg)
+                else:
+                    options[str(index)] = _unquote(arg)
+        filters.append((name, options))
+    return filters
+
+
+def escape_filter_path(path):
+    """Escape a file path for use as a filter option value"""
+    path = path.replace("\\", "/")
+    if ":" in path or "'" in path or " " in path:
+        return "'" + path.replace("'", "'\\''").replace(":", "\\:") + "'"
+    return path
+
+
+def _quote(value):
+    """Quote an option value that contains filtergraph special characters"""
+    if any(ch in value for ch in " :,;'[]=\\"):
+        return "'" + value.replace("\\", "\\\\").replace("'", "'\\''") + "'"
+    return value
+
+
+def _format_number(value):
+    return f"{value:.3f}"
+
+
+class FilterNode:
+    """One filter in a chain; subclasses know their own identity and merge rules"""
+
+    kind = "other"
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = dict(options)
+
+    def is_identity(self):
+        return False
+
+    def merge(self, other):
+        """Return a single node equivalent to self followed by other, or None if they cannot merge"""
+        return None
+
+    def render(self):
+        if not self.options:
+            return self.name
+        args = []
+        for key, value in self.options.items():
+            args.append(_quote(value) if key.isdigit() else f"{key}={_quote(value)}")
+        return f"{self.name}=" + ":".join(args)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.render()!r})"
+
+
+class EqFilter(FilterNode):
+    """eq: contrast/brightness/gamma on luma, saturation on chroma; merges only where exact"""
+
+    kind = "color"
+    DEFAULTS = {"contrast": 1.0, "brightness": 0.0, "saturation": 1.0, "gamma": 1.0}
+
+    def __init__(self, name, options):
+        unknown = set(options) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"eq: unmodeled option(s) {', '.join(sorted(unknown))}")
+        super().__init__(name, options)
+        self.params = {key: float(options.get(key, default)) for key, default in self.DEFAULTS.items()}
+
+    def is_identity(self):
+        return all(abs(self.params[key] - default) < IDENTITY_TOLERANCE for key, default in self.DEFAULTS.items())
+
+    def _luma_range(self):
+        """Luma after contrast/brightness for inputs 0 and 1 (before clipping)"""
+        contrast, brightness = self.params["contrast"], self.params["brightness"]
+        return 0.5 - contrast / 2 + brightness, 0.5 + contrast / 2 + brightness
+
+    def merge(self, other):
+        if not isinstance(other, EqFilter):
+            return None
+        first, second = self.params, other.params
+        # Gamma runs after contrast/brightness, so only a gamma-free first pass folds into the second
+        if abs(first["gamma"] - 1.0) >= IDENTITY_TOLERANCE:
+            return None
+        # The first pass clips luma; the affine terms compose only if it never clips or the second
+        # pass pushes the clipped ends past the limits again anyway
+        low, high = self._luma_range()
+        second_low, second_high = other._luma_range()
+        if not (0.0 <= min(low, high) and max(low, high) <= 1.0) and \
+                not (second["contrast"] > 0 and second_low <= 0.0 and second_high >= 1.0):
+            return None
+        # Chroma is clipped too: saturation only multiplies if the first pass cannot push it out of range
+        if abs(first["saturation"]) > 1.0 and abs(second["saturation"] - 1.0) >= IDENTITY_TOLERANCE:
+            return None
+        merged = EqFilter("eq", {})
+        # c2 * ((c1 * (y - 0.5) + 0.5 + b1) - 0.5) + 0.5 + b2 = c1 * c2 * (y - 0.5) + 0.5 + c2 * b1 + b2
+        merged.params["contrast"] = first["contrast"] * second["contrast"]
+        merged.params["brightness"] = second["contrast"] * first["brightness"] + second["brightness"]
+        merged.params["saturation"] = first["saturation"] * second["saturation"]
+        merged.params["gamma"] = second["gamma"]
+        return merged
+
+    def render(self):
+        args = [f"{key}={_format_number(self.params[key])}" for key, default in self.DEFAULTS.items()
+                if abs(self.params[key] - default) >= IDENTITY_TOLERANCE]
+        return "eq=" + ":".join(args) if args else "eq"
+
+
+class ColorBalanceFilter(FilterNode):
+    """colorbalance: shadow/midtone/highlight offsets weighted by the input's lightness, so passes never merge"""
+
+    kind = "color"
+    KEYS = FILTER_OPTION_ORDER["colorbalance"][:9]
+
+    def __init__(self, name, options):
+        unknown = set(options) - set(self.KEYS)
+        if unknown:
+            raise ValueError(f"colorbalance: unmodeled option(s) {', '.join(sorted(unknown))}")
+        super().__init__(name, options)
+        self.params = {key: float(options.get(key, 0.0)) for key in self.KEYS}
+
+    def is_identity(self):
+        return all(abs(value) < IDENTITY_TOLERANCE for value in self.params.values())
+
+    def render(self):
+        args = [f"{key}={_format_number(value)}" for key, value in self.params.items()
+                if abs(value) >= IDENTITY_TOLERANCE]
+        return "colorbalance=" + ":".join(args) if args else "colorbalance"
+
+
+def _parse_points(text):
+    points = []
+    for token in text.split():
+        x, y = token.split("/")
+        points.append((float(x), float(y)))
+    return sorted(points)
+
+
+def spline_function(points):
+    """Natural cubic spline through ffmpeg curves key points, as a scalar function"""
+    if not points:
+        return lambda x: x
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    n = len(points)
+    if n == 1:
+        return lambda x: ys[0]
+
+    # Second derivatives of a natural spline (zero at both ends), Thomas algorithm
+    h = [xs[i + 1] - xs[i] for i in range(n - 1)]
+    m = [0.0] * n
+    if n > 2:
+        diag = [2 * (h[i - 1] + h[i]) for i in range(1, n - 1)]
+        rhs = [6 * ((ys[i + 1] - ys[i]) / h[i] - (ys[i] - ys[i - 1]) / h[i - 1]) for i in range(1, n - 1)]
+        for i in range(1, n - 2):
+            factor = h[i] / diag[i - 1]
+            diag[i] -= factor * h[i]
+            rhs[i] -= factor * rhs[i - 1]
+        m[n - 2] = rhs[-1] / diag[-1]
+        for i in range(n - 3, 0, -1):
+            m[i] = (rhs[i - 1] - h[i] * m[i + 1]) / diag[i - 1]
+
+    def evaluate(x):
+        # ffmpeg holds the end values outside the key-point range
+        if x <= xs[0]:
+            return ys[0]
+        if x >= xs[-1]:
+            return ys[-1]
+        seg = max(i for i in range(n - 1) if xs[i] <= x)
+        x0, x1, hs = xs[seg], xs[seg + 1], h[seg]
+        y = (m[seg] * (x1 - x) ** 3 / (6 * hs) + m[seg + 1] * (x - x0) ** 3 / (6 * hs) +
+             (ys[seg] / hs - m[seg] * hs / 6) * (x1 - x) +
+             (ys[seg + 1] / hs - m[seg + 1] * hs / 6) * (x - x0))
+        return min(1.0, max(0.0, y))
+
+    return evaluate
+
+
+class CurvesFilter(FilterNode):
+    """curves with natural splines; consecutive curves compose into one resampled curve"""
+
+    kind = "color"
+    CHANNELS = ("red", "green", "blue")
+    SHORT_NAMES = {"master": "m", "red": "r", "green": "g", "blue": "b", "all": "all"}
+
+    def __init__(self, name, options):
+        unknown = set(options) - {"master", "red", "green", "blue", "all", "interp"}
+        if unknown or options.get("interp", "natural") != "natural":
+            raise ValueError("curves: only key-point curves with natural interpolation are modeled")
+        super().__init__(name, options)
+        self.points = {key: _parse_points(options[key])
+                       for key in ("master", "red", "green", "blue", "all") if options.get(key)}
+
+    def channel_function(self, channel):
+        """Full response of one channel: its own (or the 'all') curve, then the master curve"""
+        channel_curve = spline_function(self.points.get(channel, self.points.get("all", [])))
+        master_curve = spline_function(self.points.get("master", []))
+        return lambda x: master_curve(channel_curve(x))
+
+    def is_identity(self):
+        samples = [i / (CURVE_SAMPLES - 1) for i in range(CURVE_SAMPLES)]
+        return all(abs(self.channel_function(channel)(x) - x) < IDENTITY_TOLERANCE
+                   for channel in self.CHANNELS for x in samples)
+
+    def merge(self, other):
+        if not isinstance(other, CurvesFilter):
+            return None
+        merged = CurvesFilter("curves", {})
+        grid = {i / (CURVE_SAMPLES - 1) for i in range(CURVE_SAMPLES)}
+        for channel in self.CHANNELS:
+            first, second = self.channel_function(channel), other.channel_function(channel)
+            # The first curve's own key points keep its kinks (e.g. an early clip to white) exact
+            keys = {x for points in self.points.values() for x, _ in points if 0.0 <= x <= 1.0}
+            merged.points[channel] = [(x, second(first(x))) for x in sorted(grid | keys)]
+        return merged
+
+    def render(self):
+        points = dict(self.points)
+        if all(key in points for key in self.CHANNELS) and \
+                points["red"] == points["green"] == points["blue"] and "all" not in points:
+            points["all"] = points.pop("red")
+            del points["green"], points["blue"]
+        args = []
+        for key in ("master", "red", "green", "blue", "all"):
+            if key in points:
+                text = " ".join(f"{x:.4g}/{y:.4g}" for x, y in points[key])
+                args.append(f"{self.SHORT_NAMES[key]}='{text}'")
+        return "curves=" + ":".join(args) if args else "curves"
+
+
+class Lut3dFilter(FilterNode):
+    """lut3d: an arbitrary color transform; nothing is moved or merged across it"""
+
+    kind = "color"
+
+    def render(self):
+        args = [f"file={escape_filter_path(self.options['file'])}"] if "file" in self.options else []
+        args.extend(f"{key}={_quote(value)}" for key, value in self.options.items() if key != "file")
+        return "lut3d=" + ":".join(args)
+
+
+class UnsharpFilter(FilterNode):
+    """unsharp: the strongest luma amount wins when merged; matrix sizes are forced odd"""
+
+    kind = "spatial"
+
+    def __init__(self, name, options):
+        unknown = set(options) - set(FILTER_OPTION_ORDER["unsharp"])
+        if unknown:
+            raise ValueError(f"unsharp: unmodeled option(s) {', '.join(sorted(unknown))}")
+        super().__init__(name, options)
+        lx = int(options.get("lx", 5))
+        ly = int(options.get("ly", 5))
+        self.params = {
+            "lx": self._odd(lx),
+            "ly": self._odd(ly),
+            "la": float(options.get("la", 1.0)),
+            "cx": self._odd(int(options.get("cx", lx))),
+            "cy": self._odd(int(options.get("cy", ly))),
+            "ca": float(options.get("ca", 0.0))
+        }
+
+    @staticmethod
+    def _odd(size):
+        # unsharp only accepts odd matrix sizes
+        if size % 2 == 0:
+            return size - 1 if size > 1 else 3
+        return size
+
+    def is_identity(self):
+        return abs(self.params["la"]) < IDENTITY_TOLERANCE and abs(self.params["ca"]) < IDENTITY_TOLERANCE
+
+    def merge(self, other):
+        if not isinstance(other, UnsharpFilter):
+            return None
+        return other if other.params["la"] > self.params["la"] else self
+
+    def render(self):
+        p = self.params
+        return f"unsharp={p['lx']}:{p['ly']}:{p['la']:g}:{p['cx']}:{p['cy']}:{p['ca']:g}"
+
+
+NODE_TYPES = {
+    "eq": EqFilter,
+    "colorbalance": ColorBalanceFilter,
+    "curves": CurvesFilter,
+    "lut3d": Lut3dFilter,
+    "unsharp": UnsharpFilter
+}
+
+
+def make_node(name, options):
+    """Typed node for a known filter, or a generic one when its options cannot be modeled"""
+    node_type = NODE_TYPES.get(name, FilterNode)
+    try:
+        return node_type(name, options)
+    except (ValueError, TypeError):
+        return FilterNode(name, options)
+
+
+def parse_graph(filter_string):
+    """Parse a filter chain string into a list of filter nodes"""
+    return [make_node(name, options) for name, options in parse_filter_chain(filter_string)]
+
+
+def _optimize_segment(nodes):
+    """Merge and reorder a run of nodes that contains no generic (barrier) filter
+
+    Color filters do not commute, so a node only merges with the color node right before it.
+    """
+    color = []
+    spatial = []
+    for node in nodes:
+        target_list = spatial if node.kind == "spatial" else color
+        merged = target_list[-1].merge(node) if target_list else None
+        if merged is not None:
+            target_list[-1] = merged
+        else:
+            target_list.append(node)
+    # Cheap per-pixel color ops run before the expensive spatial filter
+    return color + spatial
+
+
+def optimize_graph(nodes):
+    """Merge compatible filters, drop no-ops and move color ops ahead of unsharp"""
+    optimized = []
+    segment = []
+    for node in nodes:
+        if type(node) is FilterNode:
+            # Unknown filters are barriers: nothing merges or moves across them
+            optimized.extend(_optimize_segment(segment))
+            optimized.append(node)
+            segment = []
+        else:
+            segment.append(node)
+    optimized.extend(_optimize_segment(segment))
+    return [node for node in optimized if not node.is_identity()]
+
+
+def render_graph(nodes):
+    """Filter chain string for a list of nodes ("" when empty)"""
+    return ",".join(node.render() for node in nodes)
+
+
+def check_filters_available(nodes):
+    """Raise FilterNotAvailableError if the local ffmpeg build lacks a filter used by nodes"""
+    ffmpeg = get_capabilities()["ffmpeg"]
+    if not ffmpeg["available"] or not ffmpeg["filters"]:
+        # Nothing to check against; ffmpeg itself will report the problem
+        return
+    missing = sorted({node.name for node in nodes if node.name not in ffmpeg["filters"]})
+    if missing:
+        raise FilterNotAvailableError(f"This FFmpeg build lacks filter(s): {', '.join(missing)}")
+
+
+def compile_preset_graph(color_presets, preset_keys):
+    """Optimized filter nodes for a preset combination, memoized per preset tuple"""
+    keys = tuple(key for key in preset_keys if key != "none")
+    cache_key = (keys, tuple(color_presets[key]["filter"] for key in keys))
+    with _compiled_cache_lock:
+        if cache_key in _compiled_cache:
+            return list(_compiled_cache[cache_key])
+
+    nodes = []
+    for key in keys:
+        nodes.extend(parse_graph(color_presets[key]["filter"]))
+    nodes = optimize_graph(nodes)
+    check_filters_available(nodes)
+
+    with _compiled_cache_lock:
+        _compiled_cache[cache_key] = tuple(nodes)
+    return nodes
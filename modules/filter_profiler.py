@@ -0,0 +1,152 @@
+"""
+Filter Profiler
+Per-filter cost of a preset graph: decode-only, instrumented filter-only and full encode passes
+"""
+import re
+import subprocess
+import time
+
+from .capabilities import get_capabilities, has_filter
+from .ffmpeg_processor import ENCODER_PROFILES, FINAL_QUALITY, select_encoder
+from .filter_graph import compile_preset_graph, render_graph
+from .media_probe import count_video_frames
+from .preset_manager import load_color_presets
+
+PROFILE_FORMAT = 1
+# Printed by each instrumented bench=stop instance, once per frame
+BENCH_STOP_RE = re.compile(r"vep_stop(\d+) @ [^\]]*\]\s*t:([\d.]+) avg:([\d.]+)")
+# Printed by ffmpeg -benchmark when the run ends
+BENCHMARK_RE = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+
+
+def instrument_chain(nodes):
+    """Filter chain with every filter wrapped in a named bench start/stop pair"""
+    return ",".join(f"bench@vep_start{index}=start,{node.render()},bench@vep_stop{index}=stop"
+                    for index, node in enumerate(nodes))
+
+
+def build_profile_command(input_path, filter_string=None, encoder=None, frames=None):
+    """FFmpeg pass to a null output: decode only, decode + filters, or decode + filters + encode"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "info", "-benchmark", "-i", input_path,
+           "-map", "0:v:0", "-an", "-sn", "-dn"]
+    if frames:
+        cmd.extend(["-frames:v", str(frames)])
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
+    if encoder:
+        profile = ENCODER_PROFILES[encoder]
+        cmd.extend(profile["args"])
+        cmd.extend([profile["quality_flag"], str(FINAL_QUALITY), "-pix_fmt", "yuv420p"])
+    cmd.extend(["-f", "null", "-"])
+    return cmd
+
+
+def parse_bench_output(text):
+    """(wall seconds, cpu seconds, {filter index: (frames, average seconds per frame)}) from stderr"""
+    filters = {}
+    for index, _, average in BENCH_STOP_RE.findall(text):
+        frames, _ = filters.get(int(index), (0, 0.0))
+        # The running average on the last line covers every frame
+        filters[int(index)] = (frames + 1, float(average))
+    match = BENCHMARK_RE.search(text)
+    if not match:
+        return None, None, filters
+    utime, stime, rtime = (float(value) for value in match.groups())
+    return rtime, utime + stime, filters
+
+
+def run_pass(cmd, repeat=1):
+    """Fastest of repeat runs of one pass: (wall seconds, cpu seconds, per-filter averages)"""
+    best = None
+    for _ in range(max(1, repeat)):
+        start_time = time.time()
+        result = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr[-2000:])
+        wall, cpu, filters = parse_bench_output(result.stderr)
+        run = (wall if wall is not None else time.time() - start_time, cpu, filters)
+        if best is None or run[0] < best[0]:
+            best = run
+    return best
+
+
+def profile_filters(input_path, preset_keys, encoder=None, use_gpu=None, frames=None, repeat=1):
+    """Time decode, each filter of the compiled preset graph and the encoder on one input
+
+    With ffmpeg's bench filter each filter is measured in place (bench=start/stop around it);
+    without it, filter-only passes over growing prefixes of the chain are differenced.
+    Returns a JSON-serializable report with seconds, ms per frame and share of the full pass.
+    """
+    encoder = encoder or select_encoder(use_gpu)
+    nodes = compile_preset_graph(load_color_presets(), preset_keys)
+    method = "bench" if has_filter("bench") else "prefix"
+
+    decode_seconds, decode_cpu, _ = run_pass(build_profile_command(input_path, frames=frames), repeat)
+    filter_seconds, filter_cpu, averages = decode_seconds, decode_cpu, {}
+    costs = []
+    if nodes and method == "bench":
+        filter_seconds, filter_cpu, averages = run_pass(
+            build_profile_command(input_path, instrument_chain(nodes), frames=frames), repeat)
+        costs = [averages.get(index, (0, 0.0)) for index in range(len(nodes))]
+    elif nodes:
+        previous = decode_seconds
+        for index in range(len(nodes)):
+            filter_seconds, filter_cpu, _ = run_pass(
+                build_profile_command(input_path, render_graph(nodes[:index + 1]), frames=frames), repeat)
+            costs.append((None, max(0.0, filter_seconds - previous)))
+            previous = filter_seconds
+    full_seconds, full_cpu, _ = run_pass(
+        build_profile_command(input_path, render_graph(nodes), encoder, frames=frames), repeat)
+
+    frame_count = next((count for count, _ in costs if count), None) or frames or count_video_frames(input_path)
+    components = [{"name": "decode", "kind": "decode", "seconds": decode_seconds}]
+    for node, (_, cost) in zip(nodes, costs):
+        # bench reports seconds per frame, the prefix method seconds per pass
+        seconds = cost * frame_count if method == "bench" else cost
+        components.append({"name": node.name, "kind": "filter", "filter": node.render(), "seconds": seconds})
+    measured = sum(component["seconds"] for component in components)
+    components.append({"name": "other", "kind": "overhead", "seconds": max(0.0, filter_seconds - measured)})
+    components.append({"name": encoder, "kind": "encode", "seconds": max(0.0, full_seconds - filter_seconds)})
+    for component in components:
+        component["ms_per_frame"] = component["seconds"] * 1000 / frame_count if frame_count else None
+        component["share"] = component["seconds"] / full_seconds if full_seconds else None
+
+    return {
+        "format": PROFILE_FORMAT,
+        "created": time.time(),
+        "input": input_path,
+        "presets": list(preset_keys),
+        "encoder": encoder,
+        "method": method,
+        "frames": frame_count,
+        "ffmpeg": get_capabilities()["ffmpeg"]["version"],
+        "passes": {
+            "decode": {"seconds": decode_seconds, "cpu_seconds": decode_cpu},
+            "filters": {"seconds": filter_seconds, "cpu_seconds": filter_cpu},
+            "full": {"seconds": full_seconds, "cpu_seconds": full_cpu}
+        },
+        "total_seconds": full_seconds,
+        "fps": frame_count / full_seconds if frame_count and full_seconds else None,
+        "components": components
+    }
+
+
+def print_profile_report(report):
+    """Table of per-component cost, most expensive filter marked"""
+    print(f"\n🔬 Filter Profile: {'+'.join(report['presets'])} → {report['encoder']} "
+          f"({report['frames']} frames, {report['method']} method)")
+    print("=" * 100)
+    print(f"{'component':<14} {'ms/frame':>9} {'seconds':>9} {'share':>7}  filter")
+    filters = [c for c in report["components"] if c["kind"] == "filter"]
+    slowest = max(filters, key=lambda c: c["seconds"]) if filters else None
+    for c in report["components"]:
+        ms = f"{c['ms_per_frame']:.2f}" if c["ms_per_frame"] is not None else "--"
+        share = f"{c['share'] * 100:.1f}%" if c["share"] is not None else "--"
+        detail = c.get("filter", "")
+        if len(detail) > 52:
+            detail = detail[:49] + "..."
+        marker = " 🔥" if c is slowest else ""
+        print(f"{c['name']:<14} {ms:>9} {c['seconds']:>8.2f}s {share:>7}  {detail}{marker}")
+    print("=" * 100)
+    fps = f"{report['fps']:.1f} fps" if report["fps"] else "-- fps"
+    print(f"Total: {report['total_seconds']:.2f}s ({fps})")
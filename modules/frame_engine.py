@@ -0,0 +1,283 @@
+"""
+Frame Engine
+Applies preset color operations to raw frames in-process with NumPy, between an ffmpeg decoder and encoder
+"""
+import collections
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cache_utils import get_cache_dir
+from .ffmpeg_processor import (
+    ENCODER_PROFILES,
+    FINAL_QUALITY,
+    select_encoder,
+    format_elapsed_time,
+    get_output_duration
+)
+from .filter_graph import split_unquoted
+from .lut_baker import (
+    COLOR_FILTERS,
+    UnsupportedFilterError,
+    evaluate_color_filters,
+    split_preset_filters,
+    _bake_cache_key
+)
+from .media_probe import probe_media
+from .preset_manager import load_color_presets, combine_preset_filters
+from .progress_monitor import run_ffmpeg
+
+# Every 8-bit RGB triple maps straight to its output: 256³ × 3 bytes = 48 MiB
+DENSE_LEVELS = 256
+DEFAULT_BATCH_FRAMES = 4
+BYTES_PER_PIXEL = 3
+
+
+def _require_numpy():
+    if np is None:
+        raise UnsupportedFilterError("NumPy is required for the frame engine (pip install numpy)")
+
+
+def build_dense_table(color_filters):
+    """Evaluate the color filters once for every 8-bit RGB value, indexed by r << 16 | g << 8 | b"""
+    _require_numpy()
+    table = np.empty((DENSE_LEVELS, DENSE_LEVELS, DENSE_LEVELS, 3), dtype=np.uint8)
+    axis = np.arange(DENSE_LEVELS, dtype=np.float64) / (DENSE_LEVELS - 1)
+    g, b = np.meshgrid(axis, axis, indexing="ij")
+    plane = np.empty((DENSE_LEVELS, DENSE_LEVELS, 3), dtype=np.float64)
+    plane[..., 1] = g
+    plane[..., 2] = b
+    # One red plane at a time keeps the float working set at a few MB
+    for red in range(DENSE_LEVELS):
+        plane[..., 0] = axis[red]
+        out = evaluate_color_filters(plane.copy(), color_filters)
+        table[red] = (out * 255.0 + 0.5).astype(np.uint8)
+    return table.reshape(-1, 3)
+
+
+def dense_table_path(color_presets, preset_keys):
+    """Cached dense table for the color part of a preset combination, built on first use"""
+    color_filters, _ = split_preset_filters(color_presets, preset_keys)
+    key = _bake_cache_key(color_filters, DENSE_LEVELS)
+    path = os.path.join(get_cache_dir("luts"), f"dense_{key[:16]}.npy")
+    if os.path.exists(path):
+        return path
+
+    start_time = time.time()
+    table = build_dense_table(color_filters)
+    # Concurrent batch jobs may build the same table at once
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+    np.save(temp_path, table)
+    os.replace(temp_path, path)
+    print(f"🎨 Built {DENSE_LEVELS}³ color table from {len(color_filters)} filter(s) "
+          f"in {format_elapsed_time(time.time() - start_time)}: {path}")
+    return path
+
+
+def spatial_filter_string(color_presets, preset_keys):
+    """The non-color part of the combined filter (e.g. unsharp), left to the encoder's -vf"""
+    combined_filter = combine_preset_filters(color_presets, preset_keys)
+    parts = [part for part in split_unquoted(combined_filter, ",")
+             if part.split("=", 1)[0] not in COLOR_FILTERS] if combined_filter else []
+    return ",".join(parts)
+
+
+class FrameMapper:
+    """Maps packed rgb24 frames through a dense table in place, with preallocated index buffers"""
+
+    def __init__(self, table, pixels):
+        self.table = table
+        self.index = np.empty(pixels, dtype=np.uint32)
+        self.scratch = np.empty(pixels, dtype=np.uint32)
+
+    def map_frame(self, frame):
+        """frame: contiguous (pixels, 3) uint8 view, overwritten with the mapped colors"""
+        index, scratch = self.index, self.scratch
+        np.left_shift(frame[:, 0], 16, out=index, dtype=np.uint32)
+        np.left_shift(frame[:, 1], 8, out=scratch, dtype=np.uint32)
+        np.bitwise_or(index, scratch, out=index)
+        np.bitwise_or(index, frame[:, 2], out=index)
+        np.take(self.table, index, axis=0, out=frame, mode="clip")
+
+    def map_batch(self, frames):
+        """frames: (count, pixels, 3) uint8 view"""
+        for frame in frames:
+            self.map_frame(frame)
+
+
+# Per-process state for pool workers: the shared frame ring and the memory-mapped table
+_worker = {}
+
+
+def _init_worker(shm_name, ring_shape, table_path):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    table = np.load(table_path, mmap_mode="r")
+    _worker["shm"] = shm
+    _worker["ring"] = np.ndarray(ring_shape, dtype=np.uint8, buffer=shm.buf)
+    _worker["mapper"] = FrameMapper(table, ring_shape[2])
+
+
+def _process_slot(slot, count):
+    _worker["mapper"].map_batch(_worker["ring"][slot, :count])
+    return slot
+
+
+def _read_into(stream, view):
+    """Fill view from stream; returns the number of bytes read (short only at end of stream)"""
+    total = 0
+    while total < len(view):
+        read = stream.readinto(view[total:])
+        if not read:
+            break
+        total += read
+    return total
+
+
+def build_decoder_command(input_path):
+    """ffmpeg command decoding the first video stream to packed rgb24 on stdout"""
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", input_path, "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"
+    ]
+
+
+def build_engine_encode_command(input_path, output_path, width, height, fps, encoder, quality,
+                                filter_string=None, itsscale_value=None):
+    """ffmpeg command encoding piped rgb24 frames, with audio copied from the source"""
+    profile = ENCODER_PROFILES[encoder]
+    itsscale = ["-itsscale", str(itsscale_value)] if itsscale_value is not None else []
+    cmd = ["ffmpeg", "-y", "-hide_banner",
+           *itsscale, "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+           "-framerate", f"{fps:.6f}", "-i", "pipe:0",
+           *itsscale, "-i", input_path,
+           "-map", "0:v:0", "-map", "1:a?"]
+    cmd.extend(profile["args"])
+    cmd.extend([profile["quality_flag"], str(quality), "-pix_fmt", "yuv420p"])
+    cmd.extend(profile["output_args"])
+    cmd.extend(["-c:a", "copy"])
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
+    cmd.append(output_path)
+    return cmd
+
+
+def _feed_frames(decoder, sink, table_path, width, height, workers, batch_frames):
+    """Decode → map (in workers over shared memory) → write to sink, keeping frame order"""
+    pixels = width * height
+    frame_bytes = pixels * BYTES_PER_PIXEL
+    # Enough slots for every worker to hold one batch while the next is being read
+    slots = max(2, workers + 2)
+    ring_shape = (slots, batch_frames, pixels, BYTES_PER_PIXEL)
+    shm = shared_memory.SharedMemory(create=True, size=slots * batch_frames * frame_bytes)
+    pool = ring = mapper = None
+    try:
+        ring = np.ndarray(ring_shape, dtype=np.uint8, buffer=shm.buf)
+        if workers > 0:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(shm.name, ring_shape, table_path))
+        else:
+            mapper = FrameMapper(np.load(table_path, mmap_mode="r"), pixels)
+
+        pending = collections.deque()
+        free_slots = collections.deque(range(slots))
+
+        def write_oldest():
+            future, slot, count = pending.popleft()
+            future.result()
+            sink.write(ring[slot, :count].data)
+            free_slots.append(slot)
+
+        while True:
+            if not free_slots:
+                write_oldest()
+            slot = free_slots.popleft()
+            read = _read_into(decoder.stdout, ring[slot].reshape(-1).data)
+            count = read // frame_bytes
+            if count == 0:
+                free_slots.append(slot)
+                break
+            if pool is not None:
+                pending.append((pool.submit(_process_slot, slot, count), slot, count))
+            else:
+                mapper.map_batch(ring[slot, :count])
+                sink.write(ring[slot, :count].data)
+                free_slots.append(slot)
+            if read < batch_frames * frame_bytes:
+                break
+        while pending:
+            write_oldest()
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        # Views into the segment must be gone before it can be closed
+        del ring, mapper
+        shm.close()
+        shm.unlink()
+
+
+def apply_itsscale_with_engine(input_path, itsscale_value, preset_keys, output_path, use_gpu=None, metrics=None,
+                               workers=None, batch_frames=DEFAULT_BATCH_FRAMES, quality=FINAL_QUALITY):
+    """Like apply_itsscale_with_encode, but the color part of the presets runs in NumPy worker processes
+
+    Raises UnsupportedFilterError when the presets cannot be evaluated in-process.
+    """
+    _require_numpy()
+    color_presets = load_color_presets()
+    table_path = dense_table_path(color_presets, preset_keys)
+    spatial_filter = spatial_filter_string(color_presets, preset_keys)
+    workers = (os.cpu_count() or 1) // 2 if workers is None else workers
+
+    video = probe_media(input_path)["video"]
+    if not video or not video["width"]:
+        raise UnsupportedFilterError("frame engine: no decodable video stream")
+    width, height, fps = video["width"], video["height"], video["fps"] or 30.0
+
+    encoder = select_encoder(use_gpu)
+    print(ENCODER_PROFILES[encoder]["message"])
+    print(f"🧮 Frame engine: {width}x{height} rgb24, batches of {batch_frames}, "
+          f"{workers or 'no'} worker process(es)" + (f", encoder -vf {spatial_filter}" if spatial_filter else ""))
+
+    decoder = subprocess.Popen(build_decoder_command(input_path), stdout=subprocess.PIPE)
+    read_fd, write_fd = os.pipe()
+    sink = os.fdopen(write_fd, "wb", buffering=0)
+    feed_error = []
+
+    def feed():
+        try:
+            _feed_frames(decoder, sink, table_path, width, height, workers, batch_frames)
+        except BaseException as e:
+            feed_error.append(e)
+        finally:
+            sink.close()
+            decoder.stdout.close()
+
+    start_time = time.time()
+    print("🚀 Processing started...")
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    cmd = build_engine_encode_command(input_path, output_path, width, height, fps, encoder, quality,
+                                      spatial_filter or None, itsscale_value)
+    try:
+        run_ffmpeg(cmd, "engine", duration=get_output_duration(input_path, itsscale_value), metrics=metrics,
+                   encoder=encoder, input_path=input_path, output_path=output_path,
+                   stdin=os.fdopen(read_fd, "rb"))
+    finally:
+        feeder.join()
+        if decoder.poll() is None:
+            decoder.kill()
+        decoder_code = decoder.wait()
+
+    if feed_error and not isinstance(feed_error[0], BrokenPipeError):
+        raise feed_error[0]
+    if decoder_code != 0:
+        raise subprocess.CalledProcessError(decoder_code, build_decoder_command(input_path))
+    print(f"✅ Processing completed in {format_elapsed_time(time.time() - start_time)}")
@@ -3,7 +3,17 @@ HandBrake Processor
 Handles video compression using HandBrake CLI with Production Standard preset
 """
 import subprocess
+from .artifact_cache import stage_key
+from .capabilities import get_capabilities
+from .cpu_topology import handbrake_thread_args, describe_allocation
 from .system_checker import has_handbrake
+from .progress_monitor import run_handbrake
+from .ffmpeg_processor import get_output_duration
+
+# Compression settings shared with the streaming pipeline
+HANDBRAKE_PRESET = "Production Standard"
+HANDBRAKE_QUALITY = 27
+HANDBRAKE_ENCODER_PRESET = "slower"
 
 def ask_handbrake_preprocessing():
     """Ask user if they want to use HandBrake preprocessing"""
@@ -23,29 +33,48 @@ def ask_handbrake_preprocessing():
         else:
             print("❌ Please enter 'y' for yes or 'n' for no.")
 
-def apply_handbrake_preprocessing(input_path, output_path):
-    """Apply HandBrake preprocessing with Production Standard preset"""
+def build_handbrake_command(input_path, output_path, quality=HANDBRAKE_QUALITY):
+    """HandBrakeCLI command for the compression stage"""
+    return [
+        "HandBrakeCLI",
+        "-i", input_path,
+        "-o", output_path,
+        "--preset", HANDBRAKE_PRESET,
+        "--quality", str(quality),
+        "--encoder-preset", HANDBRAKE_ENCODER_PRESET,
+        "--audio-copy-mask", "aac,ac3,eac3,truehd,dts,dtshd,mp3,flac",
+        "--audio-fallback", "av_aac"
+    ]
+
+def handbrake_stage_key(source_key, quality=HANDBRAKE_QUALITY):
+    """Artifact cache key and parameters for compressing a source (filter stage key or input fingerprint)"""
+    params = {
+        "command": build_handbrake_command("<input>", "<output>", quality),
+        "handbrake": get_capabilities()["handbrake"]["version"]
+    }
+    return stage_key(source_key, "handbrake", params), params
+
+def apply_handbrake_preprocessing(input_path, output_path, metrics=None, quality=HANDBRAKE_QUALITY, cpu=None):
+    """Apply HandBrake preprocessing with Production Standard preset
+
+    cpu is a cpu_topology allocation limiting x264 threads and pinning HandBrakeCLI.
+    """
     if not has_handbrake():
         print("❌ HandBrakeCLI not found! Please install HandBrake and ensure HandBrakeCLI is in your PATH.")
         print("💡 You can download HandBrake from: https://handbrake.fr/downloads.php")
         return False
     
     print("🛠️  Applying HandBrake preprocessing...")
-    print("⚙️  Preset: Production Standard | Quality: RF 27 | Encoder: Slower")
+    print(f"⚙️  Preset: Production Standard | Quality: RF {quality} | Encoder: Slower")
     
-    cmd = [
-        "HandBrakeCLI",
-        "-i", input_path,
-        "-o", output_path,
-        "--preset", "Production Standard",
-        "--quality", "27",
-        "--encoder-preset", "slower",
-        "--audio-copy-mask", "aac,ac3,eac3,truehd,dts,dtshd,mp3,flac",
-        "--audio-fallback", "av_aac"
-    ]
+    cmd = build_handbrake_command(input_path, output_path, quality)
+    if cpu:
+        cmd = handbrake_thread_args(cmd, cpu["threads"])
+        print(f"🧮 CPU budget: {describe_allocation(cpu)}")
     
     try:
-        subprocess.run(cmd, check=True)
+        run_handbrake(cmd, "handbrake", metrics=metrics, input_path=input_path, output_path=output_path,
+                      duration=get_output_duration(input_path), cpus=cpu and cpu["cpus"])
         print("✅ HandBrake preprocessing completed!")
         return True
     except subprocess.CalledProcessError as e:
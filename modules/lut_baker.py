@@ -0,0 +1,267 @@
+"""
+LUT Baker
+Bakes the color part of a preset combination into one composite 3D LUT
+"""
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cache_utils import get_cache_dir
+from .capabilities import has_filter
+from .filter_graph import FILTER_OPTION_ORDER, parse_filter_chain, split_unquoted, escape_filter_path
+from .lut_manager import load_cube, write_cube, identity_lut, apply_lut
+from .preset_manager import combine_preset_filters
+
+DEFAULT_LUT_SIZE = 33
+# Bump when the color math changes so stale baked LUTs are rebuilt
+BAKE_VERSION = 3
+
+COLOR_FILTERS = ("eq", "colorbalance", "curves", "lut3d")
+
+# BT.709 luma weights
+KR, KG, KB = 0.2126, 0.7152, 0.0722
+
+
+class UnsupportedFilterError(ValueError):
+    """Raised when a preset uses a filter or option the baker cannot model"""
+
+
+def _check_options(name, options, supported):
+    unknown = set(options) - set(supported)
+    if unknown:
+        raise UnsupportedFilterError(f"{name}: cannot bake option(s) {', '.join(sorted(unknown))}")
+
+
+def _apply_eq(rgb, options):
+    """ffmpeg eq: contrast/brightness/gamma on luma, saturation on chroma"""
+    _check_options("eq", options, ["contrast", "brightness", "saturation", "gamma", "gamma_weight"])
+    contrast = float(options.get("contrast", 1.0))
+    brightness = float(options.get("brightness", 0.0))
+    saturation = float(options.get("saturation", 1.0))
+    gamma = float(options.get("gamma", 1.0))
+    gamma_weight = float(options.get("gamma_weight", 1.0))
+
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    y = KR * r + KG * g + KB * b
+    cb = (b - y) / (2 * (1 - KB))
+    cr = (r - y) / (2 * (1 - KR))
+
+    v = contrast * (y - 0.5) + 0.5 + brightness
+    v = np.maximum(v, 0.0)
+    v = v * (1 - gamma_weight) + np.power(v, 1.0 / gamma) * gamma_weight
+    y = np.clip(v, 0.0, 1.0)
+    cb = cb * saturation
+    cr = cr * saturation
+
+    r = y + 2 * (1 - KR) * cr
+    b = y + 2 * (1 - KB) * cb
+    g = (y - KR * r - KB * b) / KG
+    return np.stack([r, g, b], axis=-1)
+
+
+def _apply_colorbalance(rgb, options):
+    """ffmpeg colorbalance: shadows/midtones/highlights offsets weighted by lightness"""
+    _check_options("colorbalance", options, FILTER_OPTION_ORDER["colorbalance"][:9] + ["pl"])
+    if float(options.get("pl", 0)):
+        raise UnsupportedFilterError("colorbalance: cannot bake pl (preserve lightness)")
+
+    a, b, scale = 4.0, 0.333, 0.7
+    lightness = (rgb.max(axis=-1) + rgb.min(axis=-1)) / 2
+    shadows = np.clip((b - lightness) * a + 0.5, 0, 1) * scale
+    midtones = (np.clip((lightness - b) * a + 0.5, 0, 1) *
+                np.clip((1.0 - lightness - b) * a + 0.5, 0, 1) * scale)
+    highlights = np.clip((lightness + b - 1) * a + 0.5, 0, 1) * scale
+
+    out = np.empty_like(rgb)
+    for index, channel in enumerate("rgb"):
+        out[..., index] = (rgb[..., index] +
+                           float(options.get(f"{channel}s", 0)) * shadows +
+                           float(options.get(f"{channel}m", 0)) * midtones +
+                           float(options.get(f"{channel}h", 0)) * highlights)
+    return out
+
+
+def _parse_points(text):
+    points = []
+    for token in text.split():
+        x, y = token.split("/")
+        points.append((float(x), float(y)))
+    return sorted(points)
+
+
+def evaluate_curve(points, x):
+    """Evaluate an ffmpeg curves key-point list with a natural cubic spline"""
+    if not points:
+        return x
+    xs = np.array([p[0] for p in points], dtype=np.float64)
+    ys = np.array([p[1] for p in points], dtype=np.float64)
+    n = len(points)
+    if n == 1:
+        return np.full_like(x, ys[0])
+
+    # Second derivatives of a natural spline (zero at both ends)
+    h = np.diff(xs)
+    m = np.zeros(n)
+    if n > 2:
+        system = np.zeros((n - 2, n - 2))
+        rhs = np.zeros(n - 2)
+        for i in range(1, n - 1):
+            row = i - 1
+            system[row, row] = 2 * (h[i - 1] + h[i])
+            if row > 0:
+                system[row, row - 1] = h[i - 1]
+            if row < n - 3:
+                system[row, row + 1] = h[i]
+            rhs[row] = 6 * ((ys[i + 1] - ys[i]) / h[i] - (ys[i] - ys[i - 1]) / h[i - 1])
+        m[1:-1] = np.linalg.solve(system, rhs)
+
+    seg = np.clip(np.searchsorted(xs, x, side="right") - 1, 0, n - 2)
+    x0, x1 = xs[seg], xs[seg + 1]
+    hs = h[seg]
+    y = (m[seg] * (x1 - x) ** 3 / (6 * hs) + m[seg + 1] * (x - x0) ** 3 / (6 * hs) +
+         (ys[seg] / hs - m[seg] * hs / 6) * (x1 - x) +
+         (ys[seg + 1] / hs - m[seg + 1] * hs / 6) * (x - x0))
+
+    # ffmpeg holds the end values outside the key-point range
+    y = np.where(x < xs[0], ys[0], y)
+    y = np.where(x > xs[-1], ys[-1], y)
+    return np.clip(y, 0.0, 1.0)
+
+
+def _apply_curves(rgb, options):
+    """ffmpeg curves: per-channel splines followed by the master curve"""
+    _check_options("curves", options, ["master", "red", "green", "blue", "all", "interp"])
+    if options.get("interp", "natural") != "natural":
+        raise UnsupportedFilterError("curves: only natural spline interpolation can be baked")
+
+    all_points = options.get("all")
+    master = _parse_points(options["master"]) if options.get("master") else []
+    out = np.empty_like(rgb)
+    for index, channel in enumerate(("red", "green", "blue")):
+        text = options.get(channel, all_points)
+        values = evaluate_curve(_parse_points(text), rgb[..., index]) if text else rgb[..., index]
+        out[..., index] = evaluate_curve(master, values) if master else values
+    return out
+
+
+def _apply_lut3d(rgb, options):
+    """ffmpeg lut3d: apply a .cube file from disk (tetrahedral by default, as in ffmpeg)"""
+    _check_options("lut3d", options, ["file", "interp"])
+    path = options.get("file")
+    if not path:
+        raise UnsupportedFilterError("lut3d: no file given")
+    interp = options.get("interp", "tetrahedral")
+    if interp not in ("trilinear", "tetrahedral"):
+        raise UnsupportedFilterError(f"lut3d: cannot bake interp={interp}")
+    return apply_lut(rgb, load_cube(path), interp=interp)
+
+
+def evaluate_color_filters(rgb, filters):
+    """Run a list of (name, options) color filters over an (..., 3) float RGB array in [0, 1]"""
+    if np is None:
+        raise UnsupportedFilterError("NumPy is required to bake LUTs (pip install numpy)")
+
+    table = rgb
+    for index, (name, options) in enumerate(filters):
+        if name == "eq":
+            table = _apply_eq(table, options)
+        elif name == "colorbalance":
+            table = _apply_colorbalance(table, options)
+        elif name == "curves":
+            table = _apply_curves(table, options)
+        elif name == "lut3d":
+            table = _apply_lut3d(table, options)
+        else:
+            raise UnsupportedFilterError(f"{name}: not a color filter")
+        # Consecutive eq filters share one YUV frame; anything else goes through RGB and clips to the legal range
+        if name != "eq" or index + 1 == len(filters) or filters[index + 1][0] != "eq":
+            table = np.clip(table, 0.0, 1.0)
+    return table
+
+
+def bake_color_filters(filters, size=DEFAULT_LUT_SIZE):
+    """Evaluate a list of (name, options) color filters over a size³ RGB grid"""
+    if np is None:
+        raise UnsupportedFilterError("NumPy is required to bake LUTs (pip install numpy)")
+    return evaluate_color_filters(identity_lut(size).astype(np.float64), filters).astype(np.float32)
+
+
+def split_preset_filters(color_presets, preset_keys):
+    """Return (color filters, spatial filters) for the selected presets, in order"""
+    color_filters = []
+    spatial_filters = []
+    for key in preset_keys:
+        if key == "none":
+            continue
+        for name, options in parse_filter_chain(color_presets[key]["filter"]):
+            if name in COLOR_FILTERS:
+                color_filters.append((name, options))
+            else:
+                spatial_filters.append((name, options))
+    return color_filters, spatial_filters
+
+
+def _bake_cache_key(color_filters, size):
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"version": BAKE_VERSION, "size": size, "filters": color_filters},
+                             sort_keys=True).encode("utf-8"))
+    # Source LUT contents are part of the key so an edited .cube invalidates the bake
+    for name, options in color_filters:
+        if name == "lut3d":
+            with open(options["file"], "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def bake_preset_lut(color_presets, preset_keys, size=DEFAULT_LUT_SIZE):
+    """Bake the color part of a preset combination to a cached .cube file and return its path"""
+    color_filters, _ = split_preset_filters(color_presets, preset_keys)
+    key = _bake_cache_key(color_filters, size)
+    lut_path = os.path.join(get_cache_dir("luts"), f"baked_{key[:16]}_{size}.cube")
+    if os.path.exists(lut_path):
+        print(f"♻️  Using cached composite LUT: {lut_path}")
+        return lut_path
+
+    table = bake_color_filters(color_filters, size)
+    # Concurrent batch jobs may bake the same LUT at once
+    temp_path = f"{lut_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write_cube(temp_path, table, title="+".join(k for k in preset_keys if k != "none"))
+    os.replace(temp_path, lut_path)
+    print(f"🎨 Baked {len(color_filters)} color filter(s) into one {size}³ LUT: {lut_path}")
+    return lut_path
+
+
+def resolve_preset_filters(color_presets, preset_keys, size=DEFAULT_LUT_SIZE):
+    """Filter chain for a preset combination, baking the color part into one lut3d when it pays off"""
+    combined_filter = combine_preset_filters(color_presets, preset_keys)
+    if np is None or not preset_keys or preset_keys == ["none"]:
+        return combined_filter
+
+    color_filters, spatial_filters = split_preset_filters(color_presets, preset_keys)
+    has_lut = any(name == "lut3d" for name, _ in color_filters)
+    # A single eq/colorbalance/curves pass is already cheap; bake chains and LUTs
+    if not has_lut and len(color_filters) <= 1:
+        return combined_filter
+    if any(name != "unsharp" for name, _ in spatial_filters):
+        return combined_filter
+    if not has_filter("lut3d"):
+        print("⚠️  This FFmpeg build has no lut3d filter, using filter chain instead")
+        return combined_filter
+
+    try:
+        lut_path = bake_preset_lut(color_presets, preset_keys, size)
+    except (UnsupportedFilterError, OSError, ValueError) as e:
+        print(f"⚠️  Could not bake composite LUT ({e}), using filter chain instead")
+        return combined_filter
+
+    filter_parts = [f"lut3d=file={escape_filter_path(lut_path)}:interp=tetrahedral"]
+    # Keep the strongest unsharp with odd matrix sizes, as combine_preset_filters picks it
+    filter_parts.extend(part for part in split_unquoted(combined_filter, ",")
+                        if part.startswith("unsharp="))
+    return ",".join(filter_parts)
@@ -0,0 +1,338 @@
+"""
+LUT Manager
+Loads, validates, caches and applies .cube LUTs with NumPy
+"""
+import hashlib
+import os
+import struct
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cache_utils import get_cache_dir
+
+MIN_LUT_SIZE = 2
+MAX_LUT_3D_SIZE = 256
+MAX_LUT_1D_SIZE = 65536
+
+# Binary sidecar: fixed 128-byte header followed by float32 table data
+SIDECAR_EXTENSION = ".lutbin"
+SIDECAR_MAGIC = b"VELUTBIN"
+SIDECAR_VERSION = 1
+SIDECAR_HEADER = struct.Struct("<8sIIi6fqq32s")
+SIDECAR_DATA_OFFSET = 128
+
+_lut_cache = {}
+_lut_cache_lock = threading.Lock()
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for LUT processing (pip install numpy)")
+
+
+def parse_cube(path):
+    """Parse a 1D or 3D .cube file into a LUT dict with a contiguous float32 table"""
+    _require_numpy()
+    title = ""
+    kind = None
+    size = None
+    domain_min = [0.0, 0.0, 0.0]
+    domain_max = [1.0, 1.0, 1.0]
+    data_lines = []
+
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            first = line[0]
+            if first.isdigit() or first in "-+.":
+                data_lines.append(line)
+                continue
+
+            keyword, _, value = line.partition(" ")
+            value = value.strip()
+            if keyword == "TITLE":
+                title = value.strip('"')
+            elif keyword in ("LUT_3D_SIZE", "LUT_1D_SIZE"):
+                if kind is not None:
+                    raise ValueError(f"{path}:{line_number}: more than one LUT size declaration")
+                kind = "3d" if keyword == "LUT_3D_SIZE" else "1d"
+                size = int(value)
+            elif keyword == "DOMAIN_MIN":
+                domain_min = [float(v) for v in value.split()]
+            elif keyword == "DOMAIN_MAX":
+                domain_max = [float(v) for v in value.split()]
+            elif keyword in ("LUT_3D_INPUT_RANGE", "LUT_1D_INPUT_RANGE"):
+                low, high = (float(v) for v in value.split())
+                domain_min = [low] * 3
+                domain_max = [high] * 3
+            # Other vendor keywords (LUT_IN_VIDEO_RANGE, ...) do not affect the table
+
+    if kind is None:
+        raise ValueError(f"{path}: missing LUT_3D_SIZE or LUT_1D_SIZE")
+
+    table = np.array(" ".join(data_lines).split(), dtype=np.float32)
+    expected_entries = size ** 3 if kind == "3d" else size
+    if table.size != expected_entries * 3:
+        raise ValueError(f"{path}: expected {expected_entries} RGB entries, found {table.size / 3:g}")
+
+    # Red varies fastest in .cube files, so a C-order reshape gives [b, g, r, channel]
+    shape = (size, size, size, 3) if kind == "3d" else (size, 3)
+    lut = {
+        "path": path,
+        "title": title,
+        "kind": kind,
+        "size": size,
+        "domain_min": np.array(domain_min, dtype=np.float32),
+        "domain_max": np.array(domain_max, dtype=np.float32),
+        "table": np.ascontiguousarray(table.reshape(shape))
+    }
+    validate_lut(lut)
+    return lut
+
+
+def validate_lut(lut):
+    """Check size, domain and table values; raise ValueError on a malformed LUT"""
+    path = lut.get("path", "LUT")
+    max_size = MAX_LUT_3D_SIZE if lut["kind"] == "3d" else MAX_LUT_1D_SIZE
+    if not MIN_LUT_SIZE <= lut["size"] <= max_size:
+        raise ValueError(f"{path}: size {lut['size']} outside {MIN_LUT_SIZE}..{max_size}")
+    if lut["domain_min"].shape != (3,) or lut["domain_max"].shape != (3,):
+        raise ValueError(f"{path}: DOMAIN_MIN/DOMAIN_MAX need three values")
+    if not np.all(lut["domain_max"] > lut["domain_min"]):
+        raise ValueError(f"{path}: DOMAIN_MAX must be greater than DOMAIN_MIN")
+    if not np.all(np.isfinite(lut["table"])):
+        raise ValueError(f"{path}: table contains NaN or infinite values")
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _sidecar_candidates(path):
+    """Sidecar next to the .cube file, or in the cache when that directory is read-only"""
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return [path + SIDECAR_EXTENSION,
+            os.path.join(get_cache_dir("luts"), f"{name}{SIDECAR_EXTENSION}")]
+
+
+def _read_sidecar(path, source_stat):
+    """Memory-map a valid sidecar for path, or return None when missing or stale"""
+    for sidecar_path in _sidecar_candidates(path):
+        if not os.path.exists(sidecar_path):
+            continue
+        try:
+            with open(sidecar_path, "rb") as f:
+                header = SIDECAR_HEADER.unpack(f.read(SIDECAR_HEADER.size))
+        except (OSError, struct.error):
+            continue
+        magic, version, kind_code, size = header[:4]
+        domain = header[4:10]
+        mtime_ns, source_size, source_hash = header[10:]
+        if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION:
+            continue
+        if source_size != source_stat.st_size:
+            continue
+        if mtime_ns != source_stat.st_mtime_ns:
+            # Touched but possibly unchanged (checkout, copy): fall back to the content hash
+            if _file_sha256(path) != source_hash:
+                continue
+
+        kind = "3d" if kind_code == 3 else "1d"
+        shape = (size, size, size, 3) if kind == "3d" else (size, 3)
+        table = np.memmap(sidecar_path, dtype=np.float32, mode="r",
+                          offset=SIDECAR_DATA_OFFSET, shape=shape)
+        return {
+            "path": path,
+            "title": "",
+            "kind": kind,
+            "size": size,
+            "domain_min": np.array(domain[:3], dtype=np.float32),
+            "domain_max": np.array(domain[3:], dtype=np.float32),
+            "table": table
+        }
+    return None
+
+
+def _write_sidecar(path, source_stat, lut):
+    """Write the binary sidecar; failures only cost the next load a text parse"""
+    header = SIDECAR_HEADER.pack(
+        SIDECAR_MAGIC, SIDECAR_VERSION, 3 if lut["kind"] == "3d" else 1, lut["size"],
+        *lut["domain_min"].tolist(), *lut["domain_max"].tolist(),
+        source_stat.st_mtime_ns, source_stat.st_size, _file_sha256(path))
+    payload = header.ljust(SIDECAR_DATA_OFFSET, b"\0") + lut["table"].astype("<f4").tobytes()
+
+    for sidecar_path in _sidecar_candidates(path):
+        temp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(payload)
+            os.replace(temp_path, sidecar_path)
+            return sidecar_path
+        except OSError:
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+    return None
+
+
+def load_cube(path, use_sidecar=True):
+    """Load a .cube LUT, memoized in-process and backed by a memory-mapped binary sidecar"""
+    _require_numpy()
+    key = os.path.abspath(path)
+    source_stat = os.stat(key)
+    signature = (source_stat.st_mtime_ns, source_stat.st_size)
+
+    with _lut_cache_lock:
+        cached = _lut_cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    lut = _read_sidecar(key, source_stat) if use_sidecar else None
+    if lut is None:
+        lut = parse_cube(key)
+        if use_sidecar:
+            _write_sidecar(key, source_stat, lut)
+
+    with _lut_cache_lock:
+        _lut_cache[key] = (signature, lut)
+    return lut
+
+
+def clear_lut_cache():
+    """Forget memoized LUTs (sidecars on disk are kept)"""
+    with _lut_cache_lock:
+        _lut_cache.clear()
+
+
+def write_cube(path, table, title=None):
+    """Write a [b, g, r, channel] table as a 3D .cube file"""
+    size = table.shape[0]
+    with open(path, "w") as f:
+        if title:
+            f.write(f'TITLE "{title}"\n')
+        f.write(f"LUT_3D_SIZE {size}\n")
+        np.savetxt(f, table.reshape(-1, 3), fmt="%.6f")
+
+
+def identity_lut(size):
+    """Identity table sampling the unit RGB cube on a size³ grid"""
+    _require_numpy()
+    axis = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    b, g, r = np.meshgrid(axis, axis, axis, indexing="ij")
+    return np.stack([r, g, b], axis=-1)
+
+
+def _lattice_coordinates(rgb, size):
+    pos = np.clip(rgb, 0.0, 1.0) * (size - 1)
+    lower = np.minimum(pos.astype(np.int32), size - 2)
+    return lower, pos - lower
+
+
+def apply_lut_trilinear(rgb, table):
+    """Apply a [b, g, r] table to float RGB values in [0, 1] with trilinear interpolation"""
+    lower, frac = _lattice_coordinates(rgb, table.shape[0])
+    r0, g0, b0 = lower[..., 0], lower[..., 1], lower[..., 2]
+    fr, fg, fb = frac[..., 0:1], frac[..., 1:2], frac[..., 2:3]
+
+    c000 = table[b0, g0, r0]
+    c001 = table[b0, g0, r0 + 1]
+    c010 = table[b0, g0 + 1, r0]
+    c011 = table[b0, g0 + 1, r0 + 1]
+    c100 = table[b0 + 1, g0, r0]
+    c101 = table[b0 + 1, g0, r0 + 1]
+    c110 = table[b0 + 1, g0 + 1, r0]
+    c111 = table[b0 + 1, g0 + 1, r0 + 1]
+
+    c00 = c000 + (c001 - c000) * fr
+    c01 = c010 + (c011 - c010) * fr
+    c10 = c100 + (c101 - c100) * fr
+    c11 = c110 + (c111 - c110) * fr
+    c0 = c00 + (c01 - c00) * fg
+    c1 = c10 + (c11 - c10) * fg
+    return c0 + (c1 - c0) * fb
+
+
+def apply_lut_tetrahedral(rgb, table):
+    """Apply a [b, g, r] table to float RGB values in [0, 1] with tetrahedral interpolation"""
+    lower, frac = _lattice_coordinates(rgb, table.shape[0])
+
+    # The enclosing tetrahedron walks from the base corner along the axes in
+    # order of decreasing fractional offset
+    order = np.argsort(-frac, axis=-1)
+    sorted_frac = np.take_along_axis(frac, order, axis=-1)
+    steps = np.eye(3, dtype=np.int32)[order]
+    first = lower + steps[..., 0, :]
+    second = first + steps[..., 1, :]
+
+    c000 = table[lower[..., 2], lower[..., 1], lower[..., 0]]
+    c1 = table[first[..., 2], first[..., 1], first[..., 0]]
+    c2 = table[second[..., 2], second[..., 1], second[..., 0]]
+    c111 = table[lower[..., 2] + 1, lower[..., 1] + 1, lower[..., 0] + 1]
+
+    f_max = sorted_frac[..., 0:1]
+    f_mid = sorted_frac[..., 1:2]
+    f_min = sorted_frac[..., 2:3]
+    return (1 - f_max) * c000 + (f_max - f_mid) * c1 + (f_mid - f_min) * c2 + f_min * c111
+
+
+def apply_lut_1d(rgb, table):
+    """Apply a per-channel 1D table to float RGB values in [0, 1] with linear interpolation"""
+    axis = np.linspace(0.0, 1.0, table.shape[0], dtype=np.float32)
+    out = np.empty(rgb.shape, dtype=np.float32)
+    for channel in range(3):
+        out[..., channel] = np.interp(rgb[..., channel], axis, table[:, channel])
+    return out
+
+
+def apply_lut(pixels, lut, interp="tetrahedral"):
+    """Apply a loaded LUT to an (..., 3) RGB array; uint8 input gives uint8 output"""
+    is_uint8 = pixels.dtype == np.uint8
+    rgb = pixels.astype(np.float32) / 255.0 if is_uint8 else pixels.astype(np.float32, copy=False)
+
+    # Map the LUT input domain onto the unit cube
+    rgb = (rgb - lut["domain_min"]) / (lut["domain_max"] - lut["domain_min"])
+
+    if lut["kind"] == "1d":
+        out = apply_lut_1d(rgb, lut["table"])
+    elif interp == "trilinear":
+        out = apply_lut_trilinear(rgb, lut["table"])
+    elif interp == "tetrahedral":
+        out = apply_lut_tetrahedral(rgb, lut["table"])
+    else:
+        raise ValueError(f"Unknown LUT interpolation: {interp}")
+
+    if is_uint8:
+        return (np.clip(out, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+    return out
+
+
+def describe_lut(lut):
+    """Summary statistics for inspecting a LUT without ffmpeg"""
+    table = np.asarray(lut["table"])
+    if lut["kind"] == "3d":
+        deviation = np.abs(table - identity_lut(lut["size"]))
+    else:
+        deviation = np.abs(table - np.linspace(0.0, 1.0, lut["size"], dtype=np.float32)[:, None])
+    return {
+        "path": lut["path"],
+        "kind": lut["kind"],
+        "size": lut["size"],
+        "domain_min": lut["domain_min"].tolist(),
+        "domain_max": lut["domain_max"].tolist(),
+        "output_min": float(table.min()),
+        "output_max": float(table.max()),
+        "mean_shift": float(deviation.mean()),
+        "max_shift": float(deviation.max())
+    }
@@ -0,0 +1,269 @@
+"""
+Media Catalog
+Probes a media library concurrently and keeps the metadata in an SQLite index
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+from .cache_utils import get_cache_dir
+from .media_probe import VIDEO_EXTENSIONS, PACKET_PROBE_ARGS, summarize_probe, parse_packets
+
+CATALOG_ENV = "VIDEO_ENHANCER_CATALOG"
+CATALOG_FORMAT = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    probed_at REAL NOT NULL,
+    format TEXT,
+    duration REAL,
+    video_codec TEXT,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    pix_fmt TEXT,
+    bit_rate INTEGER,
+    audio_layout TEXT,
+    keyframes TEXT,
+    info TEXT NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS media_codec ON media (video_codec);
+CREATE INDEX IF NOT EXISTS media_height ON media (height);
+"""
+
+
+def default_catalog_path():
+    """Catalog database location, overridable with $VIDEO_ENHANCER_CATALOG"""
+    return os.environ.get(CATALOG_ENV) or os.path.join(get_cache_dir("catalog"), "catalog.sqlite")
+
+
+def connect(db_path=None):
+    """Open (and create if needed) the catalog database"""
+    conn = sqlite3.connect(db_path or default_catalog_path())
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    conn.execute("PRAGMA user_version = %d" % CATALOG_FORMAT)
+    return conn
+
+
+def find_media_files(roots):
+    """Every video file under the given files/directories, as absolute paths"""
+    files = []
+    for root in roots:
+        if os.path.isfile(root):
+            files.append(os.path.abspath(root))
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            for name in filenames:
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    files.append(os.path.abspath(os.path.join(dirpath, name)))
+    return sorted(set(files))
+
+
+async def _run_ffprobe(args):
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", *args,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", "replace").strip() or f"ffprobe exited with {proc.returncode}")
+    return stdout.decode("utf-8", "replace")
+
+
+async def probe_file_async(path, semaphore, keyframes=False):
+    """Probe one file under the semaphore; returns a row dict (with 'error' set on failure)"""
+    async with semaphore:
+        row = {"path": path, "size": 0, "mtime_ns": 0, "probed_at": time.time()}
+        try:
+            # A live library loses files between the walk and the probe; that is this row's error, not the scan's
+            stat = os.stat(path)
+            row.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            output = await _run_ffprobe(["-show_format", "-show_streams", "-of", "json", path])
+            info = summarize_probe(json.loads(output), path)
+            key_times = None
+            if keyframes:
+                # Packet flags give keyframe positions without decoding
+                output = await _run_ffprobe([*PACKET_PROBE_ARGS, path])
+                key_times = [pts for pts, is_key in parse_packets(output) if is_key]
+            row.update(_row_fields(info), keyframes=json.dumps(key_times) if key_times is not None else None,
+                       error=None)
+        except (RuntimeError, ValueError, OSError) as e:
+            row.update(_row_fields(None), keyframes=None, error=str(e))
+        return row
+
+
+def _row_fields(info):
+    video = (info or {}).get("video") or {}
+    audio = (info or {}).get("audio") or []
+    return {
+        "format": (info or {}).get("format"),
+        "duration": (info or {}).get("duration"),
+        "video_codec": video.get("codec"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": video.get("fps"),
+        "pix_fmt": video.get("pix_fmt"),
+        "bit_rate": video.get("bit_rate") or (info or {}).get("bit_rate"),
+        "audio_layout": json.dumps([f"{a['codec']}:{a['channel_layout'] or a['channels']}" for a in audio]),
+        "info": json.dumps(info)
+    }
+
+
+def _store_row(conn, row):
+    columns = ", ".join(row)
+    placeholders = ", ".join(f":{key}" for key in row)
+    conn.execute(f"INSERT OR REPLACE INTO media ({columns}) VALUES ({placeholders})", row)
+
+
+def _needs_probe(existing, path, keyframes):
+    if existing is None:
+        return True
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # Gone or unreadable since the walk: the probe records the error
+        return True
+    if existing["size"] != stat.st_size or existing["mtime_ns"] != stat.st_mtime_ns:
+        return True
+    return keyframes and existing["keyframes"] is None and existing["error"] is None
+
+
+async def _scan_async(conn, paths, jobs, keyframes, on_result):
+    semaphore = asyncio.Semaphore(jobs)
+    tasks = [asyncio.ensure_future(probe_file_async(path, semaphore, keyframes)) for path in paths]
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        row = await task
+        _store_row(conn, row)
+        if done % 50 == 0:
+            conn.commit()
+        on_result(done, len(tasks), row)
+    conn.commit()
+
+
+def scan_library(roots, db_path=None, jobs=None, keyframes=False, prune=True):
+    """Probe new or changed files under roots into the catalog; returns scan counts"""
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 2)
+    start_time = time.time()
+    paths = find_media_files(roots)
+    conn = connect(db_path)
+    try:
+        existing = {row["path"]: row for row in conn.execute(
+            "SELECT path, size, mtime_ns, keyframes, error FROM media")}
+        to_probe = [path for path in paths if _needs_probe(existing.get(path), path, keyframes)]
+
+        removed = 0
+        if prune:
+            # Forget catalogued files under the scanned directories that no longer exist
+            prefixes = tuple(os.path.join(os.path.abspath(root), "") for root in roots if os.path.isdir(root))
+            present = set(paths)
+            stale = [path for path in existing if path.startswith(prefixes) and path not in present]
+            conn.executemany("DELETE FROM media WHERE path = ?", [(path,) for path in stale])
+            removed = len(stale)
+
+        print(f"📚 Catalog: {len(paths)} file(s) found, {len(to_probe)} to probe "
+              f"({len(paths) - len(to_probe)} unchanged), {jobs} concurrent probe(s)")
+        failures = []
+
+        def on_result(done, total, row):
+            if row["error"]:
+                failures.append(row)
+            if done == total or done % 25 == 0:
+                print(f"   🔎 {done}/{total} probed")
+
+        if to_probe:
+            asyncio.run(_scan_async(conn, to_probe, jobs, keyframes, on_result))
+        conn.commit()
+    finally:
+        conn.close()
+
+    for row in failures:
+        print(f"   ⚠️  {row['path']}: {row['error']}")
+    return {"found": len(paths), "probed": len(to_probe), "failed": len(failures), "removed": removed,
+            "seconds": time.time() - start_time}
+
+
+def lookup_catalog(path, db_path=None):
+    """Stored probe summary for path if the catalog has it for the file's current size and mtime"""
+    db_path = db_path or default_catalog_path()
+    if not os.path.exists(db_path):
+        return None
+    try:
+        stat = os.stat(path)
+        conn = sqlite3.connect(db_path)
+        try:
+            row = conn.execute("SELECT size, mtime_ns, info, keyframes FROM media WHERE path = ? AND error IS NULL",
+                               (os.path.abspath(path),)).fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return None
+    if not row or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+        return None
+    info = json.loads(row[2])
+    info["keyframes"] = json.loads(row[3]) if row[3] else None
+    return info
+
+
+def _like_substring(text):
+    """LIKE pattern matching text literally anywhere, so '%' and '_' in paths are not wildcards"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def query_catalog(db_path=None, codec=None, min_height=None, max_height=None, min_duration=None,
+                  max_duration=None, path_contains=None, errors=False):
+    """Catalogued rows matching the given filters"""
+    clauses = ["error IS NOT NULL" if errors else "error IS NULL"]
+    params = []
+    for clause, value in (("video_codec = ?", codec), ("height >= ?", min_height), ("height <= ?", max_height),
+                          ("duration >= ?", min_duration), ("duration <= ?", max_duration),
+                          ("path LIKE ? ESCAPE '\\'", _like_substring(path_contains) if path_contains else None)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    conn = connect(db_path)
+    try:
+        return [dict(row) for row in conn.execute(
+            f"SELECT * FROM media WHERE {' AND '.join(clauses)} ORDER BY path", params)]
+    finally:
+        conn.close()
+
+
+def print_rows(rows):
+    """Compact table of catalog rows with totals"""
+    total_duration = sum(row["duration"] or 0 for row in rows)
+    total_size = sum(row["size"] or 0 for row in rows)
+    for row in rows:
+        resolution = f"{row['width']}x{row['height']}" if row["width"] else "-"
+        fps = f"{row['fps']:.2f}" if row["fps"] else "-"
+        bit_rate = f"{row['bit_rate'] // 1000} kb/s" if row["bit_rate"] else "-"
+        duration = f"{row['duration']:.1f}s" if row["duration"] else "-"
+        print(f"{row['video_codec'] or row['error'] or '-':<8} {resolution:>10} {fps:>7} {bit_rate:>12} "
+              f"{duration:>9}  {row['path']}")
+    print(f"📚 {len(rows)} file(s), {total_duration / 3600:.2f} h, {total_size / 1024 ** 3:.2f} GB")
+
+
+def print_entry(path, db_path=None):
+    """Full stored metadata for one file"""
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM media WHERE path = ?", (os.path.abspath(path),)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        print(f"❌ Not in catalog: {path}")
+        return False
+    entry = dict(row)
+    entry["info"] = json.loads(entry["info"])
+    entry["audio_layout"] = json.loads(entry["audio_layout"] or "[]")
+    keyframes = json.loads(entry["keyframes"]) if entry["keyframes"] else None
+    entry["keyframes"] = f"{len(keyframes)} keyframe(s)" if keyframes is not None else "not indexed"
+    print(json.dumps(entry, indent=2))
+    return True
@@ -0,0 +1,148 @@
+"""
+Media Probe
+Reads stream metadata, keyframe positions and frame counts with ffprobe
+"""
+import json
+import os
+import subprocess
+import threading
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".m4v", ".webm", ".ts", ".mts")
+
+_probe_cache = {}
+_probe_cache_lock = threading.Lock()
+
+
+def _parse_frame_rate(text):
+    """Convert an ffprobe rational like '30000/1001' to float"""
+    if not text or text in ("0/0", "N/A"):
+        return None
+    if "/" in text:
+        num, den = text.split("/", 1)
+        return float(num) / float(den) if float(den) else None
+    return float(text)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_probe(data, path):
+    """Flatten ffprobe -show_format -show_streams JSON into the fields the app uses"""
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    video_streams = [s for s in streams if s.get("codec_type") == "video"
+                     and not s.get("disposition", {}).get("attached_pic")]
+    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+
+    video = None
+    if video_streams:
+        v = video_streams[0]
+        video = {
+            "codec": v.get("codec_name"),
+            "profile": v.get("profile"),
+            "width": _to_int(v.get("width")),
+            "height": _to_int(v.get("height")),
+            "pix_fmt": v.get("pix_fmt"),
+            "fps": _parse_frame_rate(v.get("avg_frame_rate")) or _parse_frame_rate(v.get("r_frame_rate")),
+            "bit_rate": _to_int(v.get("bit_rate")),
+            "nb_frames": _to_int(v.get("nb_frames")),
+            "duration": _to_float(v.get("duration"))
+        }
+
+    audio = [{
+        "codec": a.get("codec_name"),
+        "channels": _to_int(a.get("channels")),
+        "channel_layout": a.get("channel_layout"),
+        "sample_rate": _to_int(a.get("sample_rate")),
+        "bit_rate": _to_int(a.get("bit_rate"))
+    } for a in audio_streams]
+
+    return {
+        "path": path,
+        "format": fmt.get("format_name"),
+        "duration": _to_float(fmt.get("duration")) or (video or {}).get("duration"),
+        "start_time": _to_float(fmt.get("start_time")) or 0.0,
+        "size": _to_int(fmt.get("size")) or os.path.getsize(path),
+        "bit_rate": _to_int(fmt.get("bit_rate")),
+        "video": video,
+        "audio": audio
+    }
+
+
+def probe_media(path):
+    """Probe container and stream metadata, memoized per path, mtime and size"""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _probe_cache_lock:
+        cached = _probe_cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    # A catalogued file with the same size and mtime needs no ffprobe run
+    from .media_catalog import lookup_catalog
+    info = lookup_catalog(path)
+    if info is None:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+            capture_output=True, text=True, check=True)
+        info = summarize_probe(json.loads(result.stdout), path)
+
+    with _probe_cache_lock:
+        _probe_cache[key] = (signature, info)
+    return info
+
+
+PACKET_PROBE_ARGS = ["-select_streams", "v:0", "-show_entries", "packet=pts_time,dts_time,flags", "-of", "csv=p=0"]
+
+
+def parse_packets(text):
+    """(pts_time, is_keyframe) pairs from ffprobe packet CSV output, in presentation order"""
+    packets = []
+    for line in text.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 3:
+            continue
+        pts = _to_float(parts[0])
+        if pts is None:
+            pts = _to_float(parts[1])
+        if pts is None:
+            continue
+        packets.append((pts, "K" in parts[2]))
+    packets.sort()
+    return packets
+
+
+def get_video_packets(path):
+    """(pts_time, is_keyframe) for every packet of the first video stream, in presentation order"""
+    result = subprocess.run(["ffprobe", "-v", "error", *PACKET_PROBE_ARGS, path],
+                            capture_output=True, text=True, check=True)
+    return parse_packets(result.stdout)
+
+
+def get_keyframe_times(path):
+    """Presentation times of the video keyframes, read from packet flags without decoding"""
+    keyframes = probe_media(path).get("keyframes")
+    if keyframes is not None:
+        return keyframes
+    return [pts for pts, is_key in get_video_packets(path) if is_key]
+
+
+def count_video_frames(path):
+    """Number of video packets (frames) in the first video stream"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+         "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True)
+    return int(result.stdout.strip().split(",")[0])
@@ -0,0 +1,298 @@
+"""
+MP4 Timing
+Applies itsscale by rewriting the timing fields of an MP4's moov box, leaving mdat untouched
+"""
+import os
+import shutil
+import struct
+import sys
+from array import array
+from fractions import Fraction
+from math import gcd
+
+# Top-level boxes that mean the timing lives outside moov (fragmented MP4)
+FRAGMENT_BOXES = {b"moof", b"mvex", b"sidx", b"styp"}
+# Tracks whose sample descriptions carry their own timing
+UNSUPPORTED_HANDLERS = {b"tmcd"}
+MAX_DENOMINATOR = 1000
+
+FICLONE = 0x40049409  # Linux ioctl: share extents with the source (btrfs, XFS, ...)
+
+
+class UnsupportedLayoutError(ValueError):
+    """The file cannot be retimed by patching moov in place"""
+
+
+def iter_boxes(data, start, end):
+    """Yield (type, box_start, payload_start, box_end) for each box in data[start:end]"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                raise UnsupportedLayoutError("Truncated box header")
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise UnsupportedLayoutError(f"Invalid size for '{box_type.decode('latin-1')}' box")
+        yield box_type, pos, pos + header, pos + size
+        pos += size
+
+
+def find_top_level_boxes(path):
+    """{type: (offset, size)} of the top-level boxes, reading only their headers"""
+    boxes = {}
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+            elif size == 0:
+                size = file_size - pos
+            if size < 8 or pos + size > file_size:
+                raise UnsupportedLayoutError("Corrupt or truncated top-level box")
+            boxes.setdefault(box_type, (pos, size))
+            pos += size
+    return boxes
+
+
+def _scale_factor(itsscale_value):
+    """itsscale as an exact fraction p/q"""
+    factor = Fraction(str(float(itsscale_value))).limit_denominator(MAX_DENOMINATOR)
+    if factor <= 0:
+        raise UnsupportedLayoutError(f"Invalid itsscale value: {itsscale_value}")
+    return factor
+
+
+def _rescale(timescale, factor):
+    """New timescale and the multiplier for values counted in it, keeping both integral"""
+    # Real time = value / timescale; scaling it by p/q only needs timescale * q / p when that divides
+    numerator = timescale * factor.denominator
+    divisor = gcd(numerator, factor.numerator)
+    return numerator // divisor, factor.numerator // divisor
+
+
+def _write_uint(data, offset, value, size, name):
+    fmt = ">I" if size == 4 else ">Q"
+    if value >= (1 << (8 * size)):
+        raise UnsupportedLayoutError(f"{name} overflows after rescaling")
+    struct.pack_into(fmt, data, offset, value)
+
+
+def _scale_uint(data, offset, size, multiplier, name):
+    fmt = ">I" if size == 4 else ">Q"
+    value = struct.unpack_from(fmt, data, offset)[0]
+    # All-ones durations mean "unknown" and stay that way
+    if multiplier != 1 and value != (1 << (8 * size)) - 1:
+        _write_uint(data, offset, value * multiplier, size, name)
+
+
+def _patch_header_timescale(data, payload, factor, name):
+    """Patch an mvhd/mdhd timescale and duration; returns the multiplier for its time values"""
+    version = data[payload]
+    field_size = 8 if version == 1 else 4
+    timescale_offset = payload + 4 + 2 * field_size
+    timescale = struct.unpack_from(">I", data, timescale_offset)[0]
+    if timescale == 0:
+        raise UnsupportedLayoutError(f"{name} has a zero timescale")
+    new_timescale, multiplier = _rescale(timescale, factor)
+    _write_uint(data, timescale_offset, new_timescale, 4, f"{name} timescale")
+    _scale_uint(data, timescale_offset + 4, field_size, multiplier, f"{name} duration")
+    return multiplier
+
+
+def _scale_table(data, offset, count, stride, columns, multiplier, signed, name):
+    """Multiply 32-bit columns of a big-endian table in place"""
+    if multiplier == 1 or count == 0:
+        return
+    raw = data[offset:offset + count * stride]
+    if len(raw) != count * stride:
+        raise UnsupportedLayoutError(f"Truncated {name} table")
+    values = array("i" if signed else "I")
+    values.frombytes(raw)
+    if values.itemsize != 4:
+        raise UnsupportedLayoutError("Platform lacks a 32-bit array type")
+    if sys.byteorder == "little":
+        values.byteswap()
+    per_row = stride // 4
+    limit_low, limit_high = (-(1 << 31), (1 << 31) - 1) if signed else (0, (1 << 32) - 1)
+    for column in columns:
+        for i in range(column, len(values), per_row):
+            scaled = values[i] * multiplier
+            if not limit_low <= scaled <= limit_high:
+                raise UnsupportedLayoutError(f"{name} entry overflows after rescaling")
+            values[i] = scaled
+    if sys.byteorder == "little":
+        values.byteswap()
+    data[offset:offset + count * stride] = values.tobytes()
+
+
+def _patch_elst(data, payload, movie_multiplier, media_multiplier):
+    version = data[payload]
+    count = struct.unpack_from(">I", data, payload + 4)[0]
+    field_size = 8 if version == 1 else 4
+    entry_size = 2 * field_size + 4
+    pos = payload + 8
+    if pos + count * entry_size > len(data):
+        raise UnsupportedLayoutError("Truncated elst table")
+    signed_fmt = ">q" if version == 1 else ">i"
+    for _ in range(count):
+        _scale_uint(data, pos, field_size, movie_multiplier, "Edit duration")
+        media_time = struct.unpack_from(signed_fmt, data, pos + field_size)[0]
+        if media_time > 0:
+            # -1 marks an empty edit and must stay -1
+            _write_uint(data, pos + field_size, media_time * media_multiplier, field_size, "Edit media time")
+        pos += entry_size
+
+
+def _patch_track(data, payload, end, factor, movie_multiplier):
+    """Patch tkhd, elst, mdhd, stts, ctts and cslg of one trak"""
+    boxes = {}
+    for box_type, box_start, box_payload, box_end in iter_boxes(data, payload, end):
+        boxes.setdefault(box_type, (box_payload, box_end))
+
+    if b"tkhd" not in boxes or b"mdia" not in boxes:
+        raise UnsupportedLayoutError("Track without tkhd/mdia")
+    tkhd = boxes[b"tkhd"][0]
+    field_size = 8 if data[tkhd] == 1 else 4
+    # tkhd duration follows creation/modification times, track_ID and a reserved word
+    _scale_uint(data, tkhd + 4 + 2 * field_size + 8, field_size, movie_multiplier, "Track duration")
+
+    mdia_payload, mdia_end = boxes[b"mdia"]
+    mdia = {t: (p, e) for t, _, p, e in iter_boxes(data, mdia_payload, mdia_end)}
+    if b"mdhd" not in mdia or b"minf" not in mdia:
+        raise UnsupportedLayoutError("Track without mdhd/minf")
+    if b"hdlr" in mdia:
+        handler = bytes(data[mdia[b"hdlr"][0] + 8:mdia[b"hdlr"][0] + 12])
+        if handler in UNSUPPORTED_HANDLERS:
+            raise UnsupportedLayoutError(f"Unsupported '{handler.decode('latin-1')}' track")
+    media_multiplier = _patch_header_timescale(data, mdia[b"mdhd"][0], factor, "Media")
+
+    if b"edts" in boxes:
+        for box_type, _, elst_payload, _ in iter_boxes(data, *boxes[b"edts"]):
+            if box_type == b"elst":
+                _patch_elst(data, elst_payload, movie_multiplier, media_multiplier)
+
+    minf = {t: (p, e) for t, _, p, e in iter_boxes(data, *mdia[b"minf"])}
+    if b"stbl" not in minf:
+        raise UnsupportedLayoutError("Track without stbl")
+    for box_type, _, stbl_payload, stbl_end in iter_boxes(data, *minf[b"stbl"]):
+        if box_type == b"stts":
+            count = struct.unpack_from(">I", data, stbl_payload + 4)[0]
+            _scale_table(data, stbl_payload + 8, count, 8, (1,), media_multiplier, False, "stts")
+        elif box_type == b"ctts":
+            count = struct.unpack_from(">I", data, stbl_payload + 4)[0]
+            _scale_table(data, stbl_payload + 8, count, 8, (1,), media_multiplier,
+                         data[stbl_payload] == 1, "ctts")
+        elif box_type == b"cslg":
+            if data[stbl_payload] != 0:
+                raise UnsupportedLayoutError("Unsupported cslg version")
+            # Composition shift and least/greatest delta, start and end time: five signed fields
+            _scale_table(data, stbl_payload + 4, 1, 20, range(5), media_multiplier, True, "cslg")
+
+
+def retime_moov(moov, itsscale_value):
+    """Return a patched copy of a complete moov box (same size) with every timestamp scaled"""
+    factor = _scale_factor(itsscale_value)
+    data = bytearray(moov)
+    children = list(iter_boxes(data, 8, len(data)))
+    if any(box_type == b"mvex" for box_type, _, _, _ in children):
+        raise UnsupportedLayoutError("Fragmented MP4 (mvex)")
+
+    mvhd = [payload for box_type, _, payload, _ in children if box_type == b"mvhd"]
+    if not mvhd:
+        raise UnsupportedLayoutError("moov without mvhd")
+    movie_multiplier = _patch_header_timescale(data, mvhd[0], factor, "Movie")
+
+    tracks = [(payload, end) for box_type, _, payload, end in children if box_type == b"trak"]
+    if not tracks:
+        raise UnsupportedLayoutError("moov without tracks")
+    for payload, end in tracks:
+        _patch_track(data, payload, end, factor, movie_multiplier)
+    return bytes(data)
+
+
+def clone_file(source_path, destination_path):
+    """Copy a file sharing extents where the filesystem allows, else copy in-kernel"""
+    with open(source_path, "rb") as src, open(destination_path, "wb") as dst:
+        if sys.platform.startswith("linux"):
+            try:
+                import fcntl
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return "reflink"
+            except OSError:
+                pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), min(remaining, 1 << 30))
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return "copy_file_range"
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+            except OSError:
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst, 16 * 1024 * 1024)
+        return "copy"
+
+
+def _read_retimed_moov(input_path, itsscale_value):
+    """(offset, original, patched) of the input's moov box"""
+    boxes = find_top_level_boxes(input_path)
+    fragmented = FRAGMENT_BOXES.intersection(boxes)
+    if fragmented:
+        raise UnsupportedLayoutError(f"Fragmented MP4 ({b', '.join(sorted(fragmented)).decode('latin-1')})")
+    if b"moov" not in boxes or b"mdat" not in boxes:
+        raise UnsupportedLayoutError("Not a progressive MP4/MOV file")
+
+    moov_offset, moov_size = boxes[b"moov"]
+    with open(input_path, "rb") as f:
+        f.seek(moov_offset)
+        moov = f.read(moov_size)
+    return moov_offset, moov, retime_moov(moov, itsscale_value)
+
+
+def rewrite_itsscale(input_path, output_path, itsscale_value, move_input=False):
+    """Write output_path as input_path with timing scaled by itsscale_value; raises UnsupportedLayoutError"""
+    try:
+        moov_offset, moov, patched = _read_retimed_moov(input_path, itsscale_value)
+    except UnsupportedLayoutError:
+        raise
+    except (struct.error, IndexError, ValueError) as e:
+        # A box whose fields run past its end: malformed input, not a bug in the caller
+        raise UnsupportedLayoutError(f"Malformed MP4 ({e})") from e
+
+    if move_input:
+        os.replace(input_path, output_path)
+        method = "rename"
+    else:
+        method = clone_file(input_path, output_path)
+    try:
+        with open(output_path, "r+b") as f:
+            f.seek(moov_offset)
+            f.write(patched)
+    except BaseException:
+        if move_input:
+            # Put the original header back so the input is left as it was
+            with open(output_path, "r+b") as f:
+                f.seek(moov_offset)
+                f.write(moov)
+            os.replace(output_path, input_path)
+        elif os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return method
@@ -0,0 +1,142 @@
+"""
+Planner
+Turns the chosen options and the probed source into the smallest set of processing steps
+"""
+from .ffmpeg_processor import select_encoder, format_elapsed_time
+from .media_probe import probe_media
+from .preset_manager import load_color_presets
+from .lut_baker import resolve_preset_filters
+
+# Codecs that can be stream-copied into the .mp4 outputs without re-encoding
+MP4_VIDEO_CODECS = ("h264", "hevc", "av1", "mpeg4")
+MP4_AUDIO_CODECS = ("aac", "mp3", "ac3", "eac3", "alac", "opus", "flac")
+# The encoders always emit yuv420p; other pixel formats still need an encode
+OUTPUT_PIX_FMTS = ("yuv420p", "yuvj420p")
+
+# HandBrake RF 27 "slower" output lands around this many bits per pixel per frame
+TARGET_BITS_PER_PIXEL = 0.08
+TARGET_VIDEO_CODECS = ("h264", "hevc")
+
+# Rough 1080p throughput used for estimates, scaled by pixel count
+ESTIMATED_FPS_1080P = {
+    "h264_nvenc": 300.0,
+    "libx264": 60.0,
+    "handbrake": 15.0
+}
+REMUX_BYTES_PER_SECOND = 400 * 1024 * 1024
+PIXELS_1080P = 1920 * 1080
+
+
+def target_video_bitrate(video):
+    """Video bitrate (bits/s) the HandBrake stage would roughly produce for this source"""
+    return video["width"] * video["height"] * (video["fps"] or 30.0) * TARGET_BITS_PER_PIXEL
+
+
+def meets_compression_target(info):
+    """True when the source is already an efficiently coded stream at or below the target bitrate"""
+    video = info["video"]
+    if not video or video["codec"] not in TARGET_VIDEO_CODECS or not video["width"]:
+        return False
+    bit_rate = video["bit_rate"] or info["bit_rate"]
+    return bool(bit_rate) and bit_rate <= target_video_bitrate(video)
+
+
+def needs_pixel_change(info, filter_string):
+    """Whether the output pixels must differ from the source (filters or a format conversion)"""
+    video = info["video"]
+    if filter_string or not video:
+        return True
+    return video["codec"] not in MP4_VIDEO_CODECS or video["pix_fmt"] not in OUTPUT_PIX_FMTS
+
+
+def _copyable_audio(info):
+    return all(stream["codec"] in MP4_AUDIO_CODECS for stream in info["audio"])
+
+
+def _frame_count(info):
+    video = info["video"] or {}
+    if video.get("nb_frames"):
+        return video["nb_frames"]
+    return int((info["duration"] or 0) * (video.get("fps") or 30.0))
+
+
+def _encode_seconds(info, tool):
+    video = info["video"] or {}
+    pixels = (video.get("width") or 1920) * (video.get("height") or 1080)
+    fps = ESTIMATED_FPS_1080P[tool] * PIXELS_1080P / pixels
+    return _frame_count(info) / fps
+
+
+def _remux_seconds(info, zero_copy):
+    # The MP4 timing rewrite only touches the header; a real remux reads and writes everything
+    return 0.1 if zero_copy else (info["size"] or 0) / REMUX_BYTES_PER_SECOND
+
+
+def plan_job(input_path, preset_keys, use_handbrake, stream=False, use_gpu=None):
+    """Cheapest strategy for one job, with its steps and estimated seconds
+
+    Strategies: "remux" (itsscale only), "encode" (filters + itsscale in one encode),
+    "compress" (HandBrake on the source, then itsscale), "filter_compress" (three stages)
+    and "stream" (the piped HandBrake-equivalent pipeline).
+    """
+    info = probe_media(input_path)
+    filter_string = resolve_preset_filters(load_color_presets(), preset_keys)
+    encoder = select_encoder(use_gpu)
+    zero_copy = info["format"] and "mp4" in info["format"]
+    pixel_change = needs_pixel_change(info, filter_string) or not _copyable_audio(info)
+    meets_target = meets_compression_target(info)
+    reasons = []
+
+    # Only a stream copy keeps the source bitrate; any re-encode (filters, format change) needs compressing
+    if use_handbrake and meets_target and not pixel_change:
+        reasons.append("source already meets the compression target, skipping HandBrake")
+        use_handbrake = False
+
+    if use_handbrake and stream and filter_string:
+        strategy = "stream"
+        steps = [("stream", "filters → x264 RF 27 → itsscale in one piped pass", _encode_seconds(info, "handbrake"))]
+    elif use_handbrake and not filter_string:
+        strategy = "compress"
+        reasons.append("no color filters, compressing the source directly")
+        steps = [("handbrake", "HandBrake compression of the source", _encode_seconds(info, "handbrake")),
+                 ("itsscale", "itsscale on the compressed file", _remux_seconds(info, True))]
+    elif use_handbrake:
+        strategy = "filter_compress"
+        steps = [("filters", f"filter encode ({encoder})", _encode_seconds(info, encoder)),
+                 ("handbrake", "HandBrake compression", _encode_seconds(info, "handbrake")),
+                 ("itsscale", "itsscale on the compressed file", _remux_seconds(info, True))]
+    elif not pixel_change:
+        strategy = "remux"
+        reasons.append("no pixel change needed, stream copy only")
+        steps = [("itsscale", "itsscale remux" + (" (MP4 timing rewrite)" if zero_copy else ""),
+                  _remux_seconds(info, zero_copy))]
+    else:
+        strategy = "encode"
+        steps = [("encode", f"filters + itsscale in one encode ({encoder})", _encode_seconds(info, encoder))]
+
+    return {
+        "input": input_path,
+        "strategy": strategy,
+        "use_handbrake": use_handbrake,
+        "filter": filter_string,
+        "encoder": encoder,
+        "steps": [{"stage": stage, "description": description, "estimated_seconds": seconds}
+                  for stage, description, seconds in steps],
+        "estimated_seconds": sum(seconds for _, _, seconds in steps),
+        "reasons": reasons,
+        "source": info
+    }
+
+
+def print_plan(plan):
+    """Show the planned steps and their estimated cost"""
+    video = plan["source"]["video"] or {}
+    bit_rate = video.get("bit_rate") or plan["source"]["bit_rate"]
+    print(f"\n🧭 Plan for {plan['input']}: {plan['strategy']}")
+    print(f"   Source: {video.get('codec')} {video.get('width')}x{video.get('height')} "
+          f"{video.get('pix_fmt')}, {bit_rate // 1000 if bit_rate else '?'} kb/s")
+    for reason in plan["reasons"]:
+        print(f"   💡 {reason}")
+    for index, step in enumerate(plan["steps"], 1):
+        print(f"   {index}. {step['description']}  (~{format_elapsed_time(step['estimated_seconds'])})")
+    print(f"   ⏱️  Estimated total: ~{format_elapsed_time(plan['estimated_seconds'])}")
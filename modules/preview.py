@@ -0,0 +1,153 @@
+"""
+Preview
+Renders short sampled comparison clips of candidate presets instead of full-length encodes
+"""
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .capabilities import has_filter
+from .ffmpeg_processor import format_elapsed_time
+from .lut_baker import resolve_preset_filters, escape_filter_path
+from .media_probe import probe_media
+from .preset_manager import load_color_presets
+from .progress_monitor import run_ffmpeg
+from .segment_encoder import write_concat_list
+
+DEFAULT_SAMPLES = 4
+DEFAULT_SAMPLE_SECONDS = 3.0
+DEFAULT_TILE_WIDTH = 640
+MAX_PARALLEL_SAMPLES = 4
+
+
+def sample_timestamps(duration, count, sample_seconds):
+    """Start times of count evenly spaced samples, keeping clear of the very start and end"""
+    if not duration or duration <= sample_seconds:
+        return [0.0]
+    usable = duration - sample_seconds
+    count = max(1, min(count, int(duration // sample_seconds)))
+    return [usable * (i + 1) / (count + 1) for i in range(count)]
+
+
+def candidate_label(color_presets, preset_keys):
+    """Human-readable name of a preset or combination"""
+    names = [color_presets[key]["name"] for key in preset_keys if key != "none"]
+    return " + ".join(names) if names else color_presets.get("none", {}).get("name", "Original")
+
+
+def grid_layout(count):
+    """xstack layout placing count equal-sized tiles in a near-square grid"""
+    columns = math.ceil(math.sqrt(count))
+    cells = []
+    for i in range(count):
+        column, row = i % columns, i // columns
+        x = "+".join(["w0"] * column) or "0"
+        y = "+".join(["h0"] * row) or "0"
+        cells.append(f"{x}_{y}")
+    return "|".join(cells)
+
+
+def build_sample_command(input_path, start, sample_seconds, tile_filters, label_files, output_path):
+    """One decode of a short sample, split into a labeled tile per candidate and stacked into a grid"""
+    count = len(tile_filters)
+    graph = [f"[0:v]split={count}" + "".join(f"[s{i}]" for i in range(count))] if count > 1 else []
+    for i, tile_filter in enumerate(tile_filters):
+        source = f"[s{i}]" if count > 1 else "[0:v]"
+        chain = tile_filter
+        if label_files:
+            chain += (f",drawtext=textfile={escape_filter_path(label_files[i])}"
+                      f":x=12:y=12:fontsize=h/20:fontcolor=white:box=1:boxcolor=black@0.6:boxborderw=6")
+        graph.append(f"{source}{chain}[t{i}]")
+    if count > 1:
+        tiles = "".join(f"[t{i}]" for i in range(count))
+        graph.append(f"{tiles}xstack=inputs={count}:layout={grid_layout(count)}:fill=black[out]")
+    else:
+        graph[-1] = graph[-1][:-len("[t0]")] + "[out]"
+
+    return [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        # Input seeking: only the sample's own GOPs are decoded
+        "-ss", f"{start:.3f}", "-t", f"{sample_seconds:.3f}",
+        "-i", input_path,
+        "-filter_complex", ";".join(graph),
+        "-map", "[out]", "-an",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p",
+        output_path
+    ]
+
+
+def build_contact_sheet_command(sample_paths, sample_seconds, output_path):
+    """Middle frame of every sample grid, stacked vertically into one image"""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"]
+    for path in sample_paths:
+        cmd.extend(["-ss", f"{sample_seconds / 2:.3f}", "-i", path])
+    if len(sample_paths) > 1:
+        inputs = "".join(f"[{i}:v]" for i in range(len(sample_paths)))
+        cmd.extend(["-filter_complex", f"{inputs}vstack=inputs={len(sample_paths)}[out]", "-map", "[out]"])
+    cmd.extend(["-frames:v", "1", "-update", "1", output_path])
+    return cmd
+
+
+def render_preview(input_path, candidates, output_path=None, samples=DEFAULT_SAMPLES,
+                   sample_seconds=DEFAULT_SAMPLE_SECONDS, tile_width=DEFAULT_TILE_WIDTH):
+    """Render a labeled grid comparison clip and contact sheet for the candidate preset lists
+
+    Returns {"video": path, "contact_sheet": path}.
+    """
+    color_presets = load_color_presets()
+    if output_path is None:
+        output_path = f"{os.path.splitext(os.path.basename(input_path))[0]}_preview.mp4"
+    sheet_path = f"{os.path.splitext(output_path)[0]}_sheet.png"
+
+    duration = probe_media(input_path)["duration"]
+    starts = sample_timestamps(duration, samples, sample_seconds)
+    labels = [candidate_label(color_presets, keys) for keys in candidates]
+    tile_filters = []
+    for keys in candidates:
+        combined_filter = resolve_preset_filters(color_presets, keys)
+        scale = f"scale={tile_width}:-2"
+        tile_filters.append(f"{combined_filter},{scale}" if combined_filter else scale)
+
+    print(f"🔍 Preview: {len(candidates)} candidate(s) × {len(starts)} sample(s) of {sample_seconds:g}s")
+    for label in labels:
+        print(f"   • {label}")
+
+    work_dir = tempfile.mkdtemp(prefix=".preview_", dir=os.path.dirname(os.path.abspath(output_path)))
+    start_time = time.time()
+    try:
+        label_files = []
+        if has_filter("drawtext"):
+            for i, label in enumerate(labels):
+                label_files.append(os.path.join(work_dir, f"label_{i}.txt"))
+                with open(label_files[-1], "w", encoding="utf-8") as f:
+                    f.write(label)
+
+        sample_paths = [os.path.join(work_dir, f"sample_{i:02d}.mp4") for i in range(len(starts))]
+
+        def render(index):
+            cmd = build_sample_command(input_path, starts[index], sample_seconds, tile_filters,
+                                       label_files, sample_paths[index])
+            run_ffmpeg(cmd, f"preview {index + 1}", live=False)
+
+        with ThreadPoolExecutor(max_workers=min(len(starts), MAX_PARALLEL_SAMPLES)) as pool:
+            list(pool.map(render, range(len(starts))))
+
+        # Samples share encoder settings, so they join without re-encoding
+        list_path = os.path.join(work_dir, "samples.txt")
+        write_concat_list(sample_paths, list_path)
+        run_ffmpeg(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                    "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path],
+                   "preview concat", live=False)
+        run_ffmpeg(build_contact_sheet_command(sample_paths, sample_seconds, sheet_path),
+                   "contact sheet", live=False)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"✅ Preview rendered in {format_elapsed_time(time.time() - start_time)}")
+    print(f"🎞️  Comparison clip: {output_path}")
+    print(f"🖼️  Contact sheet: {sheet_path}")
+    return {"video": output_path, "contact_sheet": sheet_path}
+
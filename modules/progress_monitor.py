@@ -0,0 +1,328 @@
+"""
+Progress Monitor
+Runs ffmpeg/HandBrakeCLI with live fps, speed and ETA, and records stage metrics
+"""
+import collections
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from .cpu_topology import pin_process
+
+# Live single-line progress only makes sense on an interactive terminal
+_live_progress = sys.stdout.isatty()
+
+HANDBRAKE_PROGRESS_RE = re.compile(
+    r"Encoding: task \d+ of \d+, ([\d.]+) %"
+    r"(?: \(([\d.]+) fps, avg ([\d.]+) fps, ETA (\d+)h(\d+)m(\d+)s\))?")
+
+
+# Children started by run_ffmpeg/run_handbrake, so a cancelled pipeline can stop them
+_active_processes = set()
+_active_processes_lock = threading.Lock()
+
+
+def _start_process(cmd, **kwargs):
+    proc = subprocess.Popen(cmd, **kwargs)
+    with _active_processes_lock:
+        _active_processes.add(proc)
+    return proc
+
+
+def _forget_process(proc):
+    with _active_processes_lock:
+        _active_processes.discard(proc)
+
+
+def terminate_active_processes():
+    """Terminate every running ffmpeg/HandBrakeCLI child; their run_* calls then raise"""
+    with _active_processes_lock:
+        processes = list(_active_processes)
+    for proc in processes:
+        if proc.returncode is not None:
+            continue
+        if not hasattr(os, "wait4"):
+            proc.terminate()
+            continue
+        # Popen.terminate polls, which would reap the child before wait_with_usage's wait4 gets to it
+        try:
+            os.kill(proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    return len(processes)
+
+
+def set_live_progress(enabled):
+    """Enable or disable the live progress line (batch runs turn it off)"""
+    global _live_progress
+    _live_progress = enabled
+
+
+def format_eta(seconds):
+    """Compact ETA like 1h02m or 3m07s"""
+    if seconds is None or seconds < 0:
+        return "--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{(seconds % 3600) // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def _print_live(stage, percent, fps, speed, eta):
+    parts = [f"{percent:5.1f}%" if percent is not None else "  ..."]
+    parts.append(f"{fps:6.1f} fps" if fps else "    -- fps")
+    if speed:
+        parts.append(f"{speed:5.2f}x")
+    parts.append(f"ETA {format_eta(eta)}")
+    sys.stdout.write(f"\r⏳ {stage}: " + " | ".join(parts) + "   ")
+    sys.stdout.flush()
+
+
+def _end_live():
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
+def wait_with_usage(proc):
+    """Wait for a child process and return (returncode, cpu_seconds, peak_rss_kb)"""
+    if not hasattr(os, "wait4"):
+        # Windows: no per-child resource usage
+        return proc.wait(), None, None
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # Already reaped elsewhere (e.g. a poll() during cancellation): the exit code is all that is left
+        return proc.wait(), None, None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    peak_rss_kb = usage.ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss_kb //= 1024  # macOS reports bytes
+    return proc.returncode, usage.ru_utime + usage.ru_stime, peak_rss_kb
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path) if path and os.path.exists(path) else 0
+    except OSError:
+        return 0
+
+
+class JobMetrics:
+    """Collects stage records for one job and renders the JSON record"""
+
+    def __init__(self, input_path):
+        self.input_path = input_path
+        self.started_at = time.time()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, record):
+        with self._lock:
+            self.stages.append(record)
+
+    def to_record(self, output_path=None, status="ok", error=None):
+        """Machine-readable summary for the whole job"""
+        fps_values = [s["avg_fps"] for s in self.stages if s.get("avg_fps")]
+        min_values = [s["min_fps"] for s in self.stages if s.get("min_fps")]
+        return {
+            "input": self.input_path,
+            "output": output_path,
+            "status": status,
+            "error": error,
+            "started_at": self.started_at,
+            "total_seconds": time.time() - self.started_at,
+            "bytes_in": _file_size(self.input_path),
+            "bytes_out": _file_size(output_path),
+            "encoders": sorted({s["encoder"] for s in self.stages if s.get("encoder")}),
+            "avg_fps": sum(fps_values) / len(fps_values) if fps_values else None,
+            "min_fps": min(min_values) if min_values else None,
+            "stages": list(self.stages)
+        }
+
+
+def _stage_record(stage, tool, encoder, input_path, output_path, start_time, frames, fps_samples, speed,
+                  returncode, cpu_seconds=None, peak_rss_kb=None):
+    elapsed = time.time() - start_time
+    return {
+        "stage": stage,
+        "tool": tool,
+        "encoder": encoder,
+        "input": input_path,
+        "output": output_path,
+        "seconds": elapsed,
+        "frames": frames,
+        "avg_fps": frames / elapsed if frames and elapsed > 0 else None,
+        "min_fps": min(fps_samples) if fps_samples else None,
+        "speed": speed,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_kb": peak_rss_kb,
+        "bytes_in": _file_size(input_path),
+        "bytes_out": _file_size(output_path),
+        "returncode": returncode
+    }
+
+
+def record_stage(metrics, stage, tool, input_path, output_path, start_time, encoder="copy"):
+    """Record a stage that ran in-process rather than as a child process"""
+    record = _stage_record(stage, tool, encoder, input_path, output_path, start_time, None, [], None, 0)
+    if metrics is not None:
+        metrics.add_stage(record)
+    return record
+
+
+def run_ffmpeg(cmd, stage, duration=None, metrics=None, encoder=None, input_path=None,
+               output_path=None, stdin=None, live=None, cpus=None):
+    """Run an ffmpeg command, reading -progress output for live status; raises CalledProcessError
+
+    cpus pins the process to those CPUs (see cpu_topology).
+    """
+    live = _live_progress if live is None else live
+    full_cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + list(cmd[1:])
+    start_time = time.time()
+    proc = _start_process(full_cmd, stdin=stdin, stdout=subprocess.PIPE, text=True)
+    pin_process(proc.pid, cpus)
+    if stdin is not None and hasattr(stdin, "close"):
+        # The child holds its own copy; closing ours lets the upstream process see EOF/SIGPIPE
+        stdin.close()
+
+    frames = 0
+    speed = None
+    fps_samples = []
+    block = {}
+    try:
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            if not key:
+                continue
+            block[key] = value
+            if key != "progress":
+                continue
+
+            frames = int(block.get("frame", frames) or frames)
+            fps = float(block.get("fps", 0) or 0)
+            if fps > 0 and frames > 0:
+                fps_samples.append(fps)
+            speed_text = block.get("speed", "").rstrip("x").strip()
+            speed = float(speed_text) if speed_text and speed_text != "N/A" else speed
+            out_time_us = block.get("out_time_us") or block.get("out_time_ms")
+            out_seconds = int(out_time_us) / 1e6 if out_time_us and out_time_us != "N/A" else None
+
+            if live:
+                percent = eta = None
+                if duration and out_seconds is not None:
+                    percent = min(100.0, out_seconds / duration * 100)
+                    elapsed = time.time() - start_time
+                    if out_seconds > 0:
+                        eta = (duration - out_seconds) * elapsed / out_seconds
+                _print_live(stage, percent, fps, speed, eta)
+            block = {}
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        _forget_process(proc)
+        if live:
+            _end_live()
+        raise
+
+    returncode, cpu_seconds, peak_rss_kb = wait_with_usage(proc)
+    _forget_process(proc)
+    if live:
+        _end_live()
+
+    record = _stage_record(stage, "ffmpeg", encoder, input_path, output_path,
+                           start_time, frames, fps_samples, speed, returncode, cpu_seconds, peak_rss_kb)
+    if metrics is not None:
+        metrics.add_stage(record)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, full_cmd)
+    return record
+
+
+def run_handbrake(cmd, stage, metrics=None, input_path=None, output_path=None, live=None, duration=None, cpus=None):
+    """Run HandBrakeCLI, parsing its progress output; raises CalledProcessError"""
+    live = _live_progress if live is None else live
+    start_time = time.time()
+    # HandBrake's log goes to stderr; keep only the tail for error reports
+    log_tail = collections.deque(maxlen=40)
+    proc = _start_process(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    pin_process(proc.pid, cpus)
+
+    def drain_stderr():
+        for raw in proc.stderr:
+            log_tail.append(raw.decode("utf-8", "replace").rstrip())
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    fps_samples = []
+    avg_fps = None
+    buffer = b""
+    try:
+        while True:
+            chunk = proc.stdout.read1(4096) if hasattr(proc.stdout, "read1") else proc.stdout.read(4096)
+            if not chunk:
+                break
+            buffer += chunk
+            # Progress lines are terminated with carriage returns
+            *lines, buffer = re.split(rb"[\r\n]", buffer)
+            for raw in lines:
+                match = HANDBRAKE_PROGRESS_RE.search(raw.decode("utf-8", "replace"))
+                if not match:
+                    continue
+                percent = float(match.group(1))
+                fps = float(match.group(2)) if match.group(2) else None
+                if fps:
+                    fps_samples.append(fps)
+                    avg_fps = float(match.group(3))
+                eta = None
+                if match.group(4):
+                    eta = int(match.group(4)) * 3600 + int(match.group(5)) * 60 + int(match.group(6))
+                if live:
+                    elapsed = time.time() - start_time
+                    speed = (duration * percent / 100) / elapsed if duration and elapsed > 0 else None
+                    _print_live(stage, percent, fps, speed, eta)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        _forget_process(proc)
+        if live:
+            _end_live()
+        raise
+
+    returncode, cpu_seconds, peak_rss_kb = wait_with_usage(proc)
+    _forget_process(proc)
+    stderr_thread.join(timeout=5)
+    if live:
+        _end_live()
+
+    elapsed = time.time() - start_time
+    frames = int(avg_fps * elapsed) if avg_fps else None
+    record = _stage_record(stage, "HandBrakeCLI", "x264", input_path, output_path,
+                           start_time, frames, fps_samples, None, returncode, cpu_seconds, peak_rss_kb)
+    if metrics is not None:
+        metrics.add_stage(record)
+    if returncode != 0:
+        for line in log_tail:
+            print(f"   {line}")
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return record
+
+
+def print_job_metrics(record):
+    """Short per-stage table for the end of a run"""
+    print("📈 Stage metrics:")
+    for stage in record["stages"]:
+        fps = f"{stage['avg_fps']:.1f} fps" if stage.get("avg_fps") else "-- fps"
+        print(f"   {stage['stage']:<12} {stage['seconds']:8.1f}s  {fps:>11}  "
+              f"{stage.get('encoder') or '-'}")
+
+
+def append_metrics_record(path, record):
+    """Append one job record as a JSON line"""
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
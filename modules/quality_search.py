@@ -0,0 +1,218 @@
+"""
+Quality Search
+Finds the largest rate factor (CRF/CQ/RF) that still meets a VMAF/SSIM/PSNR target on short sampled segments
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .artifact_cache import input_fingerprint, stage_key
+from .cache_utils import get_cache_dir
+from .capabilities import get_capabilities, has_filter
+from .ffmpeg_processor import ENCODER_PROFILES, MAX_NVENC_SESSIONS, select_encoder, format_elapsed_time
+from .handbrake_processor import HANDBRAKE_ENCODER_PRESET
+from .lut_baker import resolve_preset_filters
+from .media_probe import probe_media
+from .preset_manager import load_color_presets
+from .preview import sample_timestamps
+
+QUALITY_METRICS = ("vmaf", "ssim", "psnr")
+DEFAULT_METRIC = "vmaf"
+DEFAULT_SAMPLES = 4
+DEFAULT_SAMPLE_SECONDS = 4.0
+MAX_PARALLEL_TRIALS = 4
+SEARCH_VERSION = 1
+
+# Rate factor search range per encoder; larger values mean smaller files and lower quality
+QUALITY_RANGES = {"libx264": (14, 34), "h264_nvenc": (14, 38), "handbrake": (14, 34)}
+
+# HandBrake trials use x264 with the compression stage's encoder preset, like the streaming pipeline
+HANDBRAKE_TRIAL_ARGS = ["-c:v", "libx264", "-preset", HANDBRAKE_ENCODER_PRESET, "-profile:v", "high"]
+
+METRIC_PATTERNS = {
+    "vmaf": re.compile(r"VMAF score[:=]\s*([\d.]+)"),
+    "ssim": re.compile(r"SSIM .*All:([\d.]+)"),
+    "psnr": re.compile(r"PSNR .*average:([\d.]+|inf)")
+}
+# Identical frames report PSNR as inf
+MAX_PSNR = 100.0
+
+
+def trial_profile(encoder):
+    """Video encoder arguments, quality flag and display label for trial encodes"""
+    if encoder == "handbrake":
+        return HANDBRAKE_TRIAL_ARGS, "-crf", "RF"
+    profile = ENCODER_PROFILES[encoder]
+    return profile["args"], profile["quality_flag"], profile["quality_flag"].lstrip("-").upper()
+
+
+def resolve_metric(metric):
+    """The requested metric, or SSIM when this ffmpeg build has no libvmaf"""
+    if metric == "vmaf" and not has_filter("libvmaf"):
+        print("⚠️  This FFmpeg build has no libvmaf filter, targeting SSIM instead")
+        return "ssim"
+    return metric
+
+
+def build_reference_command(input_path, start, seconds, filter_string, output_path):
+    """Lossless encode of one filtered sample: what every trial encode is measured against"""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-nostdin",
+           "-ss", f"{start:.3f}", "-i", input_path, "-t", f"{seconds:.3f}",
+           "-map", "0:v:0", "-an", "-sn", "-dn"]
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
+    cmd.extend(["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0", "-pix_fmt", "yuv420p", output_path])
+    return cmd
+
+
+def build_trial_command(reference_path, output_path, encoder, value):
+    """Encode a reference sample at one rate factor"""
+    args, quality_flag, _ = trial_profile(encoder)
+    return ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-nostdin", "-i", reference_path,
+            *args, quality_flag, str(value), "-pix_fmt", "yuv420p", "-an", output_path]
+
+
+def build_metric_command(distorted_path, reference_path, metric):
+    """Compare a trial encode with its reference; the score is printed on stderr"""
+    compare = "libvmaf" if metric == "vmaf" else metric
+    graph = (f"[0:v]setpts=PTS-STARTPTS[distorted];[1:v]setpts=PTS-STARTPTS[reference];"
+             f"[distorted][reference]{compare}")
+    return ["ffmpeg", "-hide_banner", "-nostdin", "-i", distorted_path, "-i", reference_path,
+            "-lavfi", graph, "-f", "null", "-"]
+
+
+def parse_metric(metric, text):
+    """Score from ffmpeg's metric summary line"""
+    matches = METRIC_PATTERNS[metric].findall(text)
+    if not matches:
+        raise ValueError(f"no {metric.upper()} score in ffmpeg output")
+    return MAX_PSNR if matches[-1] == "inf" else float(matches[-1])
+
+
+def _sample_dir(input_path, filter_string, times, seconds):
+    params = {"filter": filter_string, "times": [round(t, 3) for t in times], "seconds": seconds,
+              "ffmpeg": get_capabilities()["ffmpeg"]["version"]}
+    key = stage_key(input_fingerprint(input_path), "quality_samples", params)
+    path = os.path.join(get_cache_dir("quality"), key[:24])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _scores_path(sample_dir, encoder, metric):
+    args, quality_flag, _ = trial_profile(encoder)
+    key = json.dumps([args, quality_flag, metric, SEARCH_VERSION])
+    return os.path.join(sample_dir, f"scores_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.json")
+
+
+def _write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def _reference_sample(input_path, start, seconds, filter_string, sample_dir, index):
+    """Cached lossless reference for one sample"""
+    path = os.path.join(sample_dir, f"reference_{index}.mkv")
+    if not os.path.exists(path):
+        temp_path = os.path.join(sample_dir, f"reference_{index}.{os.getpid()}.tmp.mkv")
+        subprocess.run(build_reference_command(input_path, start, seconds, filter_string, temp_path),
+                       capture_output=True, check=True)
+        os.replace(temp_path, path)
+    return path
+
+
+def _score_trial(reference_path, encoder, value, metric):
+    """Encode one sample at value and measure it; returns (score, encoded bytes)"""
+    trial_path = f"{os.path.splitext(reference_path)[0]}.trial_{value}.{os.getpid()}.mp4"
+    try:
+        subprocess.run(build_trial_command(reference_path, trial_path, encoder, value),
+                       capture_output=True, check=True)
+        result = subprocess.run(build_metric_command(trial_path, reference_path, metric),
+                                capture_output=True, check=True)
+        return parse_metric(metric, result.stderr.decode("utf-8", "replace")), os.path.getsize(trial_path)
+    finally:
+        if os.path.exists(trial_path):
+            os.remove(trial_path)
+
+
+def search_quality(input_path, preset_keys, target, metric=DEFAULT_METRIC, encoder=None, use_gpu=None,
+                   samples=DEFAULT_SAMPLES, sample_seconds=DEFAULT_SAMPLE_SECONDS, use_cache=True,
+                   max_parallel=None):
+    """Binary-search the largest rate factor whose mean sample score meets target
+
+    encoder is an ENCODER_PROFILES name or "handbrake" (defaults to select_encoder(use_gpu)).
+    max_parallel caps concurrent sample encodes; a caller holding one scheduler slot passes 1.
+    References and per-value scores are cached, so a repeated search runs no encodes.
+    Returns the chosen value with its score and every trial; when even the best quality
+    in range misses the target, the lowest value is chosen and "met" is False.
+    """
+    encoder = encoder or select_encoder(use_gpu)
+    metric = resolve_metric(metric)
+    _, _, label = trial_profile(encoder)
+    filter_string = resolve_preset_filters(load_color_presets(), preset_keys) or None
+    times = sample_timestamps(probe_media(input_path)["duration"], samples, sample_seconds)
+    sample_dir = _sample_dir(input_path, filter_string, times, sample_seconds)
+    scores_path = _scores_path(sample_dir, encoder, metric)
+    trials = {}
+    if use_cache and os.path.exists(scores_path):
+        with open(scores_path, "r") as f:
+            trials = json.load(f)
+
+    low, high = QUALITY_RANGES[encoder]
+    print(f"🎯 Target {metric.upper()} {target:g}: searching {label} {low}-{high} on "
+          f"{len(times)} × {sample_seconds:g}s sample(s)")
+    start_time = time.time()
+    # Consumer NVENC session limits apply to trial encodes too
+    workers = min(len(times), max_parallel or (MAX_NVENC_SESSIONS if encoder == "h264_nvenc" else MAX_PARALLEL_TRIALS))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        references = list(pool.map(
+            lambda item: _reference_sample(input_path, item[1], sample_seconds, filter_string, sample_dir, item[0]),
+            enumerate(times)))
+
+        def evaluate(value):
+            cached = str(value) in trials
+            if not cached:
+                results = list(pool.map(lambda path: _score_trial(path, encoder, value, metric), references))
+                trials[str(value)] = {"score": sum(score for score, _ in results) / len(results),
+                                      "scores": [score for score, _ in results],
+                                      "bytes": sum(size for _, size in results)}
+                _write_json(scores_path, trials)
+            trial = trials[str(value)]
+            print(f"   {label} {value} → {metric.upper()} {trial['score']:.3f} "
+                  f"({trial['bytes'] / 1024:.0f} KB){' (cached)' if cached else ''}")
+            return trial["score"]
+
+        best = None
+        while low <= high:
+            value = (low + high) // 2
+            if evaluate(value) >= target:
+                best, low = value, value + 1
+            else:
+                high = value - 1
+
+    met = best is not None
+    # A search that never met the target has evaluated the bottom of the range last
+    value = best if met else QUALITY_RANGES[encoder][0]
+    result = {
+        "encoder": encoder,
+        "metric": metric,
+        "target": target,
+        "label": label,
+        "value": value,
+        "score": trials[str(value)]["score"],
+        "met": met,
+        "trials": {int(key): trial["score"] for key, trial in trials.items()},
+        "seconds": time.time() - start_time
+    }
+    if met:
+        print(f"✅ {label} {value} meets {metric.upper()} {target:g} ({result['score']:.3f}), "
+              f"found in {format_elapsed_time(result['seconds'])}")
+    else:
+        print(f"⚠️  {metric.upper()} {target:g} not reached in range; using {label} {value} "
+              f"({result['score']:.3f})")
+    return result
@@ -0,0 +1,230 @@
+"""
+Scratch Space
+Places throwaway intermediates on a configurable scratch volume, checks free space first and always cleans up
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from .media_probe import probe_media
+
+SCRATCH_ENV = "VIDEO_ENHANCER_SCRATCH"
+BUDGET_ENV = "VIDEO_ENHANCER_SCRATCH_BUDGET_GB"
+SCRATCH_PREFIX = "video-enhancer-"
+# Space left free on the scratch volume for everything else
+FREE_SPACE_MARGIN = 512 * 1024 ** 2
+# Size estimates err on the large side
+ESTIMATE_SAFETY = 1.25
+
+# Intermediate codecs for files that are read once by HandBrake and deleted.
+# Lossless formats cost little CPU but need far more space; x264_crf18 is the compact fallback.
+INTERMEDIATE_FORMATS = {
+    "x264_lossless": {
+        "args": ["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0"],
+        "extension": ".mkv",
+        "bits_per_pixel": 6.0
+    },
+    "ffv1": {
+        "args": ["-c:v", "ffv1", "-level", "3", "-slices", "16", "-threads", "0"],
+        "extension": ".mkv",
+        "bits_per_pixel": 7.0
+    },
+    "x264_crf18": {
+        "args": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18"],
+        "extension": ".mp4",
+        "bits_per_pixel": 0.4
+    }
+}
+INTERMEDIATE_PREFERENCE = ["x264_lossless", "x264_crf18"]
+
+
+# Space reserved by every open ScratchSpace in this process, per volume → {scratch directory: bytes},
+# so concurrent batch jobs do not each count the same free space
+_reservations = {}
+_reservations_lock = threading.Lock()
+
+
+class ScratchSpaceError(RuntimeError):
+    """Not enough free space on the scratch volume for an intermediate"""
+
+
+def scratch_root(root=None):
+    """Scratch volume: the given directory, $VIDEO_ENHANCER_SCRATCH or the system temp directory"""
+    return root or os.environ.get(SCRATCH_ENV) or tempfile.gettempdir()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def sweep_stale_scratch(root=None):
+    """Remove scratch directories left behind by processes that no longer exist (crashes, kills)"""
+    root = scratch_root(root)
+    removed = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(SCRATCH_PREFIX):
+            continue
+        pid = name[len(SCRATCH_PREFIX):].split("-", 1)[0]
+        if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def budget_bytes():
+    """Optional cap on scratch usage per job from $VIDEO_ENHANCER_SCRATCH_BUDGET_GB"""
+    try:
+        return int(float(os.environ[BUDGET_ENV]) * 1024 ** 3)
+    except (KeyError, ValueError):
+        return None
+
+
+def _directory_bytes(directory):
+    total = 0
+    try:
+        for entry in os.scandir(directory):
+            if entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        pass
+    return total
+
+
+def _outstanding_bytes(volume):
+    """Reserved space not yet written; written bytes already show up in the volume's free space"""
+    return sum(max(0, reserved - _directory_bytes(directory))
+               for directory, reserved in _reservations.get(volume, {}).items())
+
+
+def estimate_intermediate_bytes(input_path, intermediate):
+    """Expected size of the source re-encoded as intermediate, or None if it cannot be probed"""
+    try:
+        info = probe_media(input_path)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+    video = info["video"]
+    if not video or not video["width"] or not info["duration"]:
+        return None
+    frames = info["duration"] * (video["fps"] or 30.0)
+    bits_per_pixel = INTERMEDIATE_FORMATS[intermediate]["bits_per_pixel"]
+    video_bytes = video["width"] * video["height"] * frames * bits_per_pixel / 8
+    # Audio is copied as-is; the source size bounds it
+    return int((video_bytes + os.path.getsize(input_path) * 0.1) * ESTIMATE_SAFETY)
+
+
+class ScratchSpace:
+    """A job's private directory on the scratch volume; it and every tracked file are removed on exit"""
+
+    def __init__(self, name, root=None):
+        self.name = name
+        self.root = scratch_root(root)
+        self.directory = None
+        self.tracked = []
+        self.reserved = 0
+        self.volume = None
+
+    def __enter__(self):
+        return self.open()
+
+    def open(self):
+        """Create the scratch directory (after sweeping stale ones); pair with cleanup()"""
+        os.makedirs(self.root, exist_ok=True)
+        sweep_stale_scratch(self.root)
+        self.directory = tempfile.mkdtemp(prefix=f"{SCRATCH_PREFIX}{os.getpid()}-", dir=self.root)
+        self.volume = os.stat(self.directory).st_dev
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Runs on success, errors and Ctrl-C alike
+        self.cleanup()
+        return False
+
+    def cleanup(self):
+        """Delete tracked files and the scratch directory, and release its reserved space"""
+        try:
+            for path in self.tracked:
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self.tracked = []
+            if self.directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+        finally:
+            with _reservations_lock:
+                _reservations.get(self.volume, {}).pop(self.directory, None)
+            self.reserved = 0
+            self.directory = None
+
+    def path(self, filename):
+        """Path for a new file inside the scratch directory"""
+        return os.path.join(self.directory, filename)
+
+    def track(self, path):
+        """Also remove a file outside the scratch directory on exit (e.g. next to the output)"""
+        self.tracked.append(path)
+        return path
+
+    def _available_bytes(self):
+        available = shutil.disk_usage(self.directory).free - FREE_SPACE_MARGIN - _outstanding_bytes(self.volume)
+        budget = budget_bytes()
+        if budget is not None:
+            available = min(available, budget - self.reserved)
+        return max(0, available)
+
+    def available_bytes(self):
+        """Free space on the scratch volume minus the margin and other open reservations, within the budget"""
+        with _reservations_lock:
+            return self._available_bytes()
+
+    def reserve(self, required_bytes):
+        """Claim space for an intermediate; False if it does not fit"""
+        with _reservations_lock:
+            # Checked and recorded under one lock so concurrent jobs cannot both claim the same space
+            if required_bytes is not None and required_bytes > self._available_bytes():
+                return False
+            self.reserved += required_bytes or 0
+            _reservations.setdefault(self.volume, {})[self.directory] = self.reserved
+        return True
+
+    def intermediate_path(self, input_path, stem, preferred=None):
+        """Pick the fastest intermediate codec that fits and return (path, codec name)
+
+        Raises ScratchSpaceError when no candidate fits in the remaining space.
+        """
+        candidates = [preferred] if preferred else INTERMEDIATE_PREFERENCE
+        estimates = {}
+        for intermediate in candidates:
+            estimates[intermediate] = estimate_intermediate_bytes(input_path, intermediate)
+            if self.reserve(estimates[intermediate]):
+                size = f", ~{estimates[intermediate] / 1024 ** 3:.1f} GB" if estimates[intermediate] else ""
+                print(f"💾 Scratch: {intermediate} intermediate in {self.directory}{size}")
+                return self.path(stem + INTERMEDIATE_FORMATS[intermediate]["extension"]), intermediate
+        needed = ", ".join(f"{name} ~{size / 1024 ** 3:.1f} GB" for name, size in estimates.items() if size)
+        raise ScratchSpaceError(f"Not enough scratch space in {self.root} ({needed}; "
+                                f"{self.available_bytes() / 1024 ** 3:.1f} GB available). "
+                                f"Set --scratch-dir or ${SCRATCH_ENV} to a larger volume.")
+
+
+def build_intermediate_command(input_path, output_path, intermediate, filter_string=None):
+    """FFmpeg command writing the filtered source as a throwaway intermediate (audio copied)"""
+    cmd = ["ffmpeg", "-y", "-i", input_path, "-map", "0:v:0", "-map", "0:a?"]
+    cmd.extend(INTERMEDIATE_FORMATS[intermediate]["args"])
+    cmd.extend(["-pix_fmt", "yuv420p", "-c:a", "copy"])
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
+    cmd.append(output_path)
+    return cmd
@@ -0,0 +1,249 @@
+"""
+Segment Encoder
+Splits a source at keyframes and encodes the segments in parallel
+"""
+import bisect
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .ffmpeg_processor import (
+    MAX_NVENC_SESSIONS,
+    ENCODER_PROFILES,
+    FINAL_QUALITY,
+    select_encoder,
+    format_elapsed_time
+)
+from .artifact_cache import input_fingerprint, stage_key
+from .lut_baker import resolve_preset_filters
+from .media_probe import probe_media, get_video_packets, count_video_frames
+from .preset_manager import load_color_presets
+from .progress_monitor import run_ffmpeg
+
+# x264 scales well up to a handful of threads per segment; beyond that more segments win
+THREADS_PER_SEGMENT = 4
+SEGMENTS_PER_WORKER = 2
+# Resumable encodes checkpoint after every segment, so at most this much work is lost
+RESUME_SEGMENT_SECONDS = 60
+JOURNAL_VERSION = 1
+
+
+def default_worker_count(encoder):
+    """Parallel segment encodes for this machine and encoder"""
+    if encoder == "h264_nvenc":
+        return MAX_NVENC_SESSIONS
+    return max(1, (os.cpu_count() or 1) // THREADS_PER_SEGMENT)
+
+
+def plan_segments(packets, segment_count):
+    """Split packet list at keyframes into up to segment_count ranges of similar frame counts"""
+    total = len(packets)
+    key_indices = [i for i, (_, is_key) in enumerate(packets) if is_key and i > 0]
+    boundaries = [0]
+    for n in range(1, segment_count):
+        if not key_indices:
+            break
+        target = total * n // segment_count
+        # Snap the even split point to the nearest keyframe
+        pos = bisect.bisect_left(key_indices, target)
+        nearby = key_indices[max(0, pos - 1):pos + 1]
+        best = min(nearby, key=lambda i: abs(i - target))
+        if best > boundaries[-1]:
+            boundaries.append(best)
+    boundaries.append(total)
+
+    return [{
+        "index": index,
+        "start_frame": start,
+        "frames": end - start,
+        "start_time": packets[start][0]
+    } for index, (start, end) in enumerate(zip(boundaries, boundaries[1:])) if end > start]
+
+
+def build_segment_command(input_path, segment, seek_time, filter_string, encoder, quality, threads, output_path):
+    """FFmpeg command encoding exactly one segment's frames, video only"""
+    profile = ENCODER_PROFILES[encoder]
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{seek_time:.6f}",
+        "-i", input_path,
+        "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-frames:v", str(segment["frames"])
+    ]
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
+    cmd.extend(profile["args"])
+    cmd.extend([profile["quality_flag"], str(quality), "-pix_fmt", "yuv420p"])
+    if encoder == "libx264":
+        cmd.extend(["-threads", str(threads)])
+    cmd.append(output_path)
+    return cmd
+
+
+def write_concat_list(segment_paths, list_path):
+    """Write a concat demuxer list file"""
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def build_concat_command(list_path, input_path, itsscale_value, output_path):
+    """Stitch encoded segments and mux the source audio, applying itsscale to both"""
+    return [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-itsscale", str(itsscale_value),
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-itsscale", str(itsscale_value),
+        "-i", input_path,
+        "-map", "0:v:0", "-map", "1:a?",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        output_path
+    ]
+
+
+def resume_directory(input_path, output_path, params):
+    """Work directory of a resumable encode, derived from the source content and encode settings"""
+    key = stage_key(input_fingerprint(input_path), "segmented_encode", params)
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), f".resume_{key[:16]}")
+
+
+def load_journal(journal_path, work_dir):
+    """Completed segments from the checkpoint journal, keeping only those whose files still verify"""
+    try:
+        with open(journal_path, "r") as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if journal.get("version") != JOURNAL_VERSION:
+        return {}
+    completed = {}
+    for index, entry in journal.get("segments", {}).items():
+        path = os.path.join(work_dir, entry["file"])
+        try:
+            # Packet counting reads the container, not the pictures, so this stays cheap
+            if os.path.getsize(path) == entry["bytes"] and count_video_frames(path) == entry["frames"]:
+                completed[int(index)] = entry
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            continue
+    return completed
+
+
+def save_journal(journal_path, segments):
+    """Atomically rewrite the checkpoint journal"""
+    temp_path = f"{journal_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"version": JOURNAL_VERSION, "segments": {str(index): entry for index, entry in segments.items()}},
+                  f, indent=2)
+    os.replace(temp_path, journal_path)
+
+
+def apply_segmented_encode(input_path, itsscale_value, preset_keys, output_path,
+                           segments=None, workers=None, use_gpu=None, quality=FINAL_QUALITY, metrics=None,
+                           resume=False):
+    """Encode keyframe-aligned segments in parallel, then concat and verify the frame count
+
+    With resume, segments live in a work directory next to the output with a journal of the
+    verified ones; running the same encode again after a crash only encodes what is missing.
+    """
+    encoder = select_encoder(use_gpu)
+    workers = workers or default_worker_count(encoder)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    color_presets = load_color_presets()
+    combined_filter = resolve_preset_filters(color_presets, preset_keys)
+
+    info = probe_media(input_path)
+    packets = get_video_packets(input_path)
+    if not packets:
+        raise RuntimeError(f"No video frames found in {input_path}")
+    fps = (info["video"] or {}).get("fps") or 25.0
+    if not segments:
+        # A resumable plan must not depend on the worker count, or a restart could not reuse it
+        segments = (max(1, math.ceil(len(packets) / fps / RESUME_SEGMENT_SECONDS)) if resume
+                    else workers * SEGMENTS_PER_WORKER)
+    plan = plan_segments(packets, segments)
+
+    print(f"🧩 Segment-parallel encode: {len(plan)} segment(s), {workers} worker(s), {encoder}")
+    if combined_filter:
+        print(f"🔧 Combined Filter: {combined_filter}")
+
+    completed = {}
+    if resume:
+        params = {"filter": combined_filter, "encoder": encoder, "args": ENCODER_PROFILES[encoder]["args"],
+                  "quality": quality, "plan": [(s["start_frame"], s["frames"]) for s in plan]}
+        work_dir = resume_directory(input_path, output_path, params)
+        os.makedirs(work_dir, exist_ok=True)
+        journal_path = os.path.join(work_dir, "journal.json")
+        completed = load_journal(journal_path, work_dir)
+        if completed:
+            done_frames = sum(entry["frames"] for entry in completed.values())
+            print(f"♻️  Resuming: {len(completed)}/{len(plan)} segment(s) already encoded and verified "
+                  f"({done_frames * 100 // len(packets)}% of frames)")
+        else:
+            print(f"📒 Checkpoint journal: {journal_path}")
+    else:
+        work_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+    journal_lock = threading.Lock()
+    remaining = [segment for segment in plan if segment["index"] not in completed]
+
+    start_time = time.time()
+    print("🚀 Processing started...")
+    try:
+        segment_paths = [os.path.join(work_dir, f"segment_{s['index']:04d}.mp4") for s in plan]
+
+        def encode(segment):
+            index = segment["index"]
+            # Seek half a frame early so rounding never skips the keyframe itself
+            seek_time = max(0.0, segment["start_time"] - info["start_time"] - 0.5 / fps)
+            # A resumable segment only gets its final name once complete, so a kill never leaves a partial one
+            target_path = f"{segment_paths[index]}.{os.getpid()}.tmp.mp4" if resume else segment_paths[index]
+            cmd = build_segment_command(input_path, segment, seek_time, combined_filter,
+                                        encoder, quality, threads, target_path)
+            # Several segments run at once, so no live progress line per segment
+            run_ffmpeg(cmd, f"segment {index + 1}", metrics=metrics, encoder=encoder,
+                       input_path=input_path, output_path=target_path, live=False)
+            if resume:
+                frames = count_video_frames(target_path)
+                if frames != segment["frames"]:
+                    os.remove(target_path)
+                    raise RuntimeError(f"Segment {index + 1} has {frames} frames, expected {segment['frames']}")
+                os.replace(target_path, segment_paths[index])
+                with journal_lock:
+                    completed[index] = {"file": os.path.basename(segment_paths[index]), "frames": frames,
+                                        "bytes": os.path.getsize(segment_paths[index])}
+                    save_journal(journal_path, completed)
+            return index
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done, index in enumerate(pool.map(encode, remaining), len(plan) - len(remaining) + 1):
+                print(f"   ✅ Segment {index + 1}/{len(plan)} encoded ({done} done)")
+
+        list_path = os.path.join(work_dir, "segments.txt")
+        write_concat_list(segment_paths, list_path)
+        run_ffmpeg(build_concat_command(list_path, input_path, itsscale_value, output_path), "concat",
+                   metrics=metrics, encoder="copy", input_path=input_path, output_path=output_path)
+    except BaseException:
+        if resume:
+            print(f"📒 {len(completed)}/{len(plan)} segment(s) checkpointed; run the same command again to resume")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    # Finished segments are only dropped once the output exists
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    output_frames = count_video_frames(output_path)
+    if output_frames != len(packets):
+        raise RuntimeError(f"Frame count mismatch: source has {len(packets)} frames, "
+                           f"output has {output_frames}")
+
+    elapsed_time = time.time() - start_time
+    print(f"✅ Segmented processing completed in {format_elapsed_time(elapsed_time)} "
+          f"({output_frames} frames verified)")
@@ -0,0 +1,127 @@
+"""
+Stage Pipeline
+Runs items through a chain of blocking stages with bounded queues, so different items occupy different stages at once
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .progress_monitor import terminate_active_processes
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline stage: a blocking function run on items by a fixed number of concurrent workers"""
+
+    def __init__(self, name, run, workers=1, queue_size=1):
+        self.name = name
+        self.run = run
+        self.workers = max(1, workers)
+        # Items waiting in front of the stage; keeps finished intermediates from piling up on disk
+        self.queue_size = max(1, queue_size)
+
+
+class _PipelineState:
+    def __init__(self, items, finish, fail_fast):
+        self.pending = list(items)
+        self.finished = []
+        self.finish = finish
+        self.fail_fast = fail_fast
+        self.cancelled = False
+        self.busy_seconds = {}
+
+    def complete(self, item, status, error=None, stage=None):
+        item["status"] = status
+        item["error"] = error
+        item["failed_stage"] = stage
+        self.pending.remove(item)
+        self.finished.append(item)
+        if self.finish:
+            self.finish(item)
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            terminate_active_processes()
+
+
+async def _feed(items, queue, workers, state):
+    for item in items:
+        if state.cancelled:
+            break
+        await queue.put(item)
+    for _ in range(workers):
+        await queue.put(_DONE)
+
+
+async def _worker(stage, inbox, outbox, executor, state):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await inbox.get()
+        if item is _DONE:
+            return
+        if state.cancelled:
+            state.complete(item, "cancelled", stage=stage.name)
+            continue
+
+        start_time = time.time()
+        try:
+            await loop.run_in_executor(executor, stage.run, item)
+        except Exception as e:
+            if state.cancelled:
+                state.complete(item, "cancelled", stage=stage.name)
+            else:
+                print(f"❌ {stage.name} failed for {item.get('name', '?')}: {e}")
+                state.complete(item, "failed", str(e), stage.name)
+                if state.fail_fast:
+                    state.cancel()
+            continue
+        finally:
+            state.busy_seconds[stage.name] = state.busy_seconds.get(stage.name, 0.0) + time.time() - start_time
+
+        if outbox is None:
+            state.complete(item, "ok")
+        else:
+            await outbox.put(item)
+
+
+async def _run_stage(stage, inbox, outbox, next_workers, executor, state):
+    await asyncio.gather(*(_worker(stage, inbox, outbox, executor, state) for _ in range(stage.workers)))
+    if outbox is not None:
+        for _ in range(next_workers):
+            await outbox.put(_DONE)
+
+
+async def _run(items, stages, executor, state):
+    queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in stages]
+    tasks = [_feed(items, queues[0], stages[0].workers, state)]
+    for index, stage in enumerate(stages):
+        last = index == len(stages) - 1
+        tasks.append(_run_stage(stage, queues[index], None if last else queues[index + 1],
+                                0 if last else stages[index + 1].workers, executor, state))
+    await asyncio.gather(*tasks)
+
+
+def run_pipeline(items, stages, finish=None, fail_fast=False):
+    """Push every item dict through the stages in order; returns (items in completion order, busy seconds per stage)
+
+    Each stage's run(item) mutates the item and raises to fail it; a failed item skips the
+    remaining stages. finish(item) is called once per item as soon as it leaves the pipeline,
+    with item["status"] set to "ok", "failed" or "cancelled". Ctrl-C (or the first failure
+    with fail_fast) terminates the running tools and cancels everything not yet finished.
+    """
+    items = list(items)
+    state = _PipelineState(items, finish, fail_fast)
+    executor = ThreadPoolExecutor(max_workers=sum(stage.workers for stage in stages))
+    try:
+        asyncio.run(_run(items, stages, executor, state))
+    except KeyboardInterrupt:
+        print("\n🛑 Cancelling pipeline...")
+        state.cancel()
+    finally:
+        # In-flight stages return promptly once their tools are terminated
+        executor.shutdown(wait=True)
+        for item in list(state.pending):
+            state.complete(item, "cancelled")
+    return state.finished, state.busy_seconds
@@ -0,0 +1,101 @@
+"""
+Stream Processor
+Runs the filter → compression → itsscale workflow as one streaming pass
+"""
+import os
+import subprocess
+import time
+from .ffmpeg_processor import format_elapsed_time, get_output_duration
+from .handbrake_processor import HANDBRAKE_QUALITY, HANDBRAKE_ENCODER_PRESET
+from .preset_manager import load_color_presets
+from .lut_baker import resolve_preset_filters
+from .progress_monitor import run_ffmpeg
+
+# Intermediate codecs for the pipe between the filter and compression stages.
+# rawvideo costs no CPU but moves the most bytes; the others trade CPU for bandwidth.
+INTERMEDIATE_CODECS = {
+    "rawvideo": ["-c:v", "rawvideo"],
+    "ffv1": ["-c:v", "ffv1", "-level", "3", "-slices", "16", "-threads", "0"],
+    "x264_lossless": ["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0"]
+}
+
+def build_filter_stage_command(input_path, filter_string, intermediate="rawvideo"):
+    """FFmpeg command that decodes, filters and writes the intermediate to stdout"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", input_path,
+        "-map", "0:v:0",
+        "-an", "-sn", "-dn"
+    ]
+    if filter_string:
+        cmd.extend(["-vf", filter_string])
+    cmd.extend(INTERMEDIATE_CODECS[intermediate])
+    cmd.extend(["-pix_fmt", "yuv420p", "-f", "nut", "pipe:1"])
+    return cmd
+
+def build_compression_stage_command(input_path, itsscale_value, output_path, quality=HANDBRAKE_QUALITY):
+    """FFmpeg command that compresses the piped video and muxes audio with itsscale applied"""
+    return [
+        "ffmpeg", "-y", "-hide_banner",
+        # Video comes from the pipe, audio straight from the source; both get the same itsscale
+        "-itsscale", str(itsscale_value),
+        "-f", "nut", "-i", "pipe:0",
+        "-itsscale", str(itsscale_value),
+        "-i", input_path,
+        "-map", "0:v:0",
+        "-map", "1:a?",
+        "-c:v", "libx264",
+        "-preset", HANDBRAKE_ENCODER_PRESET,
+        "-crf", str(quality),
+        "-profile:v", "high",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "copy",
+        "-movflags", "+faststart",
+        output_path
+    ]
+
+def _remove_partial_output(output_path):
+    if os.path.exists(output_path):
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+
+def apply_streaming_pipeline(input_path, preset_keys, itsscale_value, output_path, intermediate="rawvideo",
+                             metrics=None, quality=HANDBRAKE_QUALITY):
+    """Filter, compress and apply itsscale in one pass with no intermediate files on disk"""
+    color_presets = load_color_presets()
+    combined_filter = resolve_preset_filters(color_presets, preset_keys)
+
+    filter_cmd = build_filter_stage_command(input_path, combined_filter, intermediate)
+    compress_cmd = build_compression_stage_command(input_path, itsscale_value, output_path, quality)
+
+    print(f"🌊 Streaming mode: filters → {intermediate} pipe → x264 {HANDBRAKE_ENCODER_PRESET} "
+          f"RF {quality} → itsscale {itsscale_value}x")
+    if combined_filter:
+        print(f"🔧 Filter: {combined_filter}")
+
+    start_time = time.time()
+    print("🚀 Processing started...")
+
+    filter_proc = subprocess.Popen(filter_cmd, stdout=subprocess.PIPE)
+    try:
+        # The compression stage owns the progress output; the filter stage runs quietly
+        run_ffmpeg(compress_cmd, "stream", duration=get_output_duration(input_path, itsscale_value),
+                   metrics=metrics, encoder="libx264", input_path=input_path, output_path=output_path,
+                   stdin=filter_proc.stdout)
+    except BaseException:
+        # A failed compression stage also kills the filter stage with a broken pipe
+        filter_proc.kill()
+        filter_proc.wait()
+        _remove_partial_output(output_path)
+        raise
+
+    filter_code = filter_proc.wait()
+    if filter_code != 0:
+        _remove_partial_output(output_path)
+        raise subprocess.CalledProcessError(filter_code, filter_cmd)
+
+    elapsed_time = time.time() - start_time
+    actual_time = format_elapsed_time(elapsed_time)
+    print(f"✅ Streaming processing completed in {actual_time}")
@@ -2,9 +2,14 @@
 System Requirements Checker
 Validates all dependencies and system components before application startup
 """
+import glob
+import importlib.util
 import os
-import subprocess
+import shutil
 import sys
+from .capabilities import get_capabilities, nvidia_gpu_available, handbrake_available
+
+MIN_PYTHON = (3, 9)
 
 def check_system_requirements():
     """Check all system requirements before starting the application"""
@@ -16,59 +21,61 @@ def check_system_requirements():
     
     # 1. Check Python version
     python_version = sys.version_info
-    if python_version.major >= 3 and python_version.minor >= 6:
+    # 3.9: os.waitstatus_to_exitcode and Executor.shutdown(cancel_futures=)
+    if python_version >= MIN_PYTHON:
         print("✅ Python version: OK (Python {}.{}.{})".format(python_version.major, python_version.minor, python_version.micro))
     else:
-        print("❌ Python version: FAILED (Need Python 3.6+)")
-        issues.append("Upgrade to Python 3.6 or higher")
+        print("❌ Python version: FAILED (Need Python {}.{}+)".format(*MIN_PYTHON))
+        issues.append("Upgrade to Python {}.{} or higher".format(*MIN_PYTHON))
         all_good = False
     
+    # 2-4. Probe FFmpeg, NVIDIA GPU and HandBrake once (cached between runs)
+    capabilities = get_capabilities()
+    
     # 2. Check FFmpeg
-    try:
-        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            # Extract version from output
-            version_line = result.stdout.split('\n')[0]
-            print(f"✅ FFmpeg: OK ({version_line.split()[2]})")
-        else:
-            print("❌ FFmpeg: FAILED (Command error)")
-            issues.append("Install FFmpeg from https://ffmpeg.org/download.html")
-            all_good = False
-    except (FileNotFoundError, subprocess.TimeoutExpired):
+    ffmpeg = capabilities["ffmpeg"]
+    if ffmpeg["available"]:
+        print(f"✅ FFmpeg: OK ({ffmpeg['version']})")
+        missing = [name for name in ("libx264", "lut3d") if name not in ffmpeg["encoders"] + ffmpeg["filters"]]
+        if missing:
+            print(f"⚠️  FFmpeg build lacks: {', '.join(missing)}")
+    elif shutil.which("ffmpeg"):
+        print("❌ FFmpeg: FAILED (Command error)")
+        issues.append("Install FFmpeg from https://ffmpeg.org/download.html")
+        all_good = False
+    else:
         print("❌ FFmpeg: NOT FOUND")
         issues.append("Install FFmpeg and add it to your system PATH")
         all_good = False
     
     # 3. Check NVIDIA GPU (optional)
-    try:
-        result = subprocess.run(["nvidia-smi"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5)
-        if result.returncode == 0:
+    if capabilities["nvidia"]["available"]:
+        if "h264_nvenc" in ffmpeg["encoders"]:
             print("✅ NVIDIA GPU: Detected (Hardware acceleration available)")
         else:
-            print("ℹ️  NVIDIA GPU: Not detected (Will use CPU encoding)")
-    except (FileNotFoundError, subprocess.TimeoutExpired):
+            print("⚠️  NVIDIA GPU: Detected, but this FFmpeg build has no h264_nvenc (Will use CPU encoding)")
+    elif shutil.which("nvidia-smi"):
+        print("ℹ️  NVIDIA GPU: Not detected (Will use CPU encoding)")
+    else:
         print("ℹ️  NVIDIA GPU: Not available (Will use CPU encoding)")
     
     # 4. Check HandBrake CLI (optional)
-    try:
-        result = subprocess.run(["HandBrakeCLI", "--version"], capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            # Extract version from output
-            version_line = result.stdout.split('\n')[0]
-            print(f"✅ HandBrake CLI: OK ({version_line.split()[0]} {version_line.split()[1]})")
-        else:
-            print("⚠️  HandBrake CLI: FAILED (Command error)")
-            print("   Note: HandBrake compression will not be available")
-    except (FileNotFoundError, subprocess.TimeoutExpired):
+    handbrake = capabilities["handbrake"]
+    if handbrake["available"]:
+        print(f"✅ HandBrake CLI: OK ({handbrake['version']})")
+    elif shutil.which("HandBrakeCLI"):
+        print("⚠️  HandBrake CLI: FAILED (Command error)")
+        print("   Note: HandBrake compression will not be available")
+    else:
         print("⚠️  HandBrake CLI: NOT FOUND")
         print("   Note: You can still use the app without compression")
         print("   Download from: https://handbrake.fr/downloads.php")
     
     # 5. Check Python dependencies
-    try:
-        import playsound
+    # Located without importing it; playsound is only loaded when the completion sound plays
+    if importlib.util.find_spec("playsound") is not None:
         print("✅ Python dependencies: OK (playsound available)")
-    except ImportError:
+    else:
         print("❌ Python dependencies: MISSING (playsound)")
         issues.append("Install playsound: pip install playsound")
         all_good = False
@@ -83,6 +90,9 @@ def check_system_requirements():
             issues.append(f"Ensure {file_path} exists in the application directory")
             all_good = False
     
+    # 7. Validate LUT files (also primes their binary sidecars for fast loading)
+    check_lut_files()
+    
     print("\n" + "=" * 40)
     
     if all_good:
@@ -95,18 +105,31 @@ def check_system_requirements():
         print("\n💡 Fix these issues and restart the application.")
         return False
 
+def check_lut_files(lut_dir="luts"):
+    """Parse and validate every .cube file; broken LUTs only disable their presets"""
+    lut_paths = sorted(glob.glob(os.path.join(lut_dir, "*.cube")))
+    if not lut_paths:
+        return True
+    if importlib.util.find_spec("numpy") is None:
+        print("ℹ️  LUT validation: skipped (install numpy to enable)")
+        return True
+    from .lut_manager import load_cube
+
+    all_valid = True
+    for path in lut_paths:
+        try:
+            lut = load_cube(path)
+            print(f"✅ LUT: {path} ({lut['size']}³)")
+        except (OSError, ValueError) as e:
+            print(f"⚠️  LUT: {path} INVALID ({e})")
+            print("   Note: presets using this LUT will fail")
+            all_valid = False
+    return all_valid
+
 def has_nvidia_gpu():
     """Check if NVIDIA GPU is available for hardware acceleration"""
-    try:
-        result = subprocess.run(["nvidia-smi"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return result.returncode == 0
-    except FileNotFoundError:
-        return False
+    return nvidia_gpu_available()
 
 def has_handbrake():
     """Check if HandBrakeCLI is available"""
-    try:
-        result = subprocess.run(["HandBrakeCLI", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return result.returncode == 0
-    except FileNotFoundError:
-        return False
+    return handbrake_available()
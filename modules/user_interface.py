@@ -37,6 +37,17 @@ def generate_output_filename(base_name, color_presets, use_handbrake):
     compression_suffix = "_compressed" if use_handbrake else ""
     return f"{base_name}_final{preset_suffix}{compression_suffix}.mp4"
 
+def generate_variant_filenames(base_name, variants, use_handbrake=False):
+    """Output filenames for several preset combinations, numbered where they would collide"""
+    names = [generate_output_filename(base_name, preset_keys, use_handbrake) for preset_keys in variants]
+    filenames = []
+    for index, name in enumerate(names, 1):
+        if names.count(name) > 1:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}_{index}{ext}"
+        filenames.append(name)
+    return filenames
+
 def show_file_size_comparison(original_path, final_path):
     """Display file size comparison if both files exist"""
     if os.path.exists(original_path) and os.path.exists(final_path):
@@ -0,0 +1,478 @@
+"""
+Work Queue
+Coordinator and workers sharing a directory: jobs are leased with heartbeats, expired leases are retried
+"""
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+from .batch_processor import ResourceScheduler, default_resource_limits, run_job
+from .capabilities import get_capabilities, handbrake_available
+from .ffmpeg_processor import FINAL_QUALITY, select_encoder, format_elapsed_time
+from .lut_baker import resolve_preset_filters
+from .media_probe import probe_media, get_video_packets, count_video_frames
+from .preset_manager import load_color_presets
+from .progress_monitor import run_ffmpeg, terminate_active_processes
+from .user_interface import generate_output_filename
+from .segment_encoder import (
+    plan_segments,
+    build_segment_command,
+    write_concat_list,
+    build_concat_command
+)
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_SECONDS = 2.0
+QUEUE_DIRS = ("jobs", "leases", "done", "expired", "failures", "workers", "segments")
+STOP_FILE = "stop"
+
+
+def queue_path(queue_dir, kind, name=""):
+    """Path of a queue subdirectory or a record inside it"""
+    return os.path.join(queue_dir, kind, name) if name else os.path.join(queue_dir, kind)
+
+
+def init_queue(queue_dir):
+    """Create the shared directory layout"""
+    for kind in QUEUE_DIRS:
+        os.makedirs(queue_path(queue_dir, kind), exist_ok=True)
+
+
+def _write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _records(queue_dir, kind):
+    return sorted(name[:-5] for name in os.listdir(queue_path(queue_dir, kind))
+                  if name.endswith(".json") and ".tmp" not in name)
+
+
+# --- Coordinator side -------------------------------------------------------------------------
+
+def submit_file_task(queue_dir, task_id, job, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Queue one whole-file batch job; HandBrake jobs only go to workers that have HandBrakeCLI"""
+    task = {
+        "id": task_id,
+        "kind": "file",
+        "job": job,
+        "requires": ["handbrake"] if job.get("handbrake") else [],
+        "size": os.path.getsize(job["input"]),
+        "max_attempts": max_attempts,
+        "created": time.time()
+    }
+    _write_json(queue_path(queue_dir, "jobs", f"{task_id}.json"), task)
+    return task
+
+
+def submit_segment_group(queue_dir, group_id, job, segments, encoder="libx264", quality=FINAL_QUALITY,
+                         max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Split one file at keyframes and queue a task per segment; returns the group record
+
+    Every segment of a group uses the same encoder so the pieces concatenate cleanly;
+    only workers that have it take them.
+    """
+    input_path = job["input"]
+    info = probe_media(input_path)
+    packets = get_video_packets(input_path)
+    if not packets:
+        raise RuntimeError(f"No video frames found in {input_path}")
+    fps = (info["video"] or {}).get("fps") or 25.0
+    plan = plan_segments(packets, segments)
+    base = job.get("base") or os.path.splitext(os.path.basename(input_path))[0]
+    job = dict(job, output=job.get("output") or os.path.join(
+        job["output_dir"], generate_output_filename(base, job["presets"], False)))
+    segment_dir = queue_path(queue_dir, "segments", group_id)
+    os.makedirs(segment_dir, exist_ok=True)
+
+    task_ids = []
+    for segment in plan:
+        task_id = f"{group_id}.s{segment['index']:04d}"
+        # Seek half a frame early so rounding never skips the keyframe itself
+        segment["seek_time"] = max(0.0, segment["start_time"] - info["start_time"] - 0.5 / fps)
+        _write_json(queue_path(queue_dir, "jobs", f"{task_id}.json"), {
+            "id": task_id,
+            "kind": "segment",
+            "group": group_id,
+            "input": input_path,
+            "presets": job["presets"],
+            "segment": segment,
+            "encoder": encoder,
+            "quality": quality,
+            "output": os.path.join(segment_dir, f"segment_{segment['index']:04d}.mp4"),
+            # NVENC segments need a host with a GPU, not just an ffmpeg build that lists the encoder
+            "requires": ["nvenc"] if encoder == "h264_nvenc" else [encoder],
+            "size": segment["frames"],
+            "max_attempts": max_attempts,
+            "created": time.time()
+        })
+        task_ids.append(task_id)
+    return {"id": group_id, "job": job, "tasks": task_ids, "frames": len(packets), "encoder": encoder}
+
+
+def _attempts(queue_dir, task_id):
+    prefix = f"{task_id}."
+    return sum(1 for kind in ("expired", "failures")
+               for name in os.listdir(queue_path(queue_dir, kind)) if name.startswith(prefix))
+
+
+def _give_up_if_exhausted(queue_dir, task, error):
+    """Record a final failure once a task has used all its attempts; True if it did"""
+    attempts = _attempts(queue_dir, task["id"])
+    if attempts < task.get("max_attempts", DEFAULT_MAX_ATTEMPTS):
+        return False
+    _write_json(queue_path(queue_dir, "done", f"{task['id']}.json"), {
+        "id": task["id"], "status": "failed", "error": f"{error} (after {attempts} attempt(s))",
+        "worker": None, "finished": time.time()
+    })
+    return True
+
+
+def _same_file(path, fd):
+    """True if path still names the file open as fd"""
+    stat, own = os.stat(path), os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (own.st_dev, own.st_ino)
+
+
+def reap_expired_leases(queue_dir, now=None):
+    """Move leases whose heartbeat stopped to expired/, so their tasks can be claimed again
+
+    A lease is renewed by touching its file, so its age is the time since the last heartbeat.
+    """
+    now = now or time.time()
+    reaped = []
+    for task_id in _records(queue_dir, "leases"):
+        path = queue_path(queue_dir, "leases", f"{task_id}.json")
+        try:
+            renewed = os.path.getmtime(path)
+        except OSError:
+            continue
+        # Unreadable while its claimer is still writing it, or gone: judged by age alone
+        lease = _read_json(path) or {"token": "unknown", "worker": "?"}
+        if now - renewed < lease.get("lease_seconds", DEFAULT_LEASE_SECONDS):
+            continue
+        expired_path = queue_path(queue_dir, "expired", f"{task_id}.{lease['token']}.json")
+        try:
+            # The rename is atomic, so only one reaper wins
+            os.rename(path, expired_path)
+        except OSError:
+            continue
+        try:
+            if os.path.getmtime(expired_path) != renewed:
+                # A heartbeat landed between the check and the rename: the worker is alive, put it back
+                os.link(expired_path, path)
+                os.remove(expired_path)
+                continue
+        except OSError:
+            # Already claimed again (or no hard links here): the old holder sees its lease is gone
+            pass
+        reaped.append((task_id, lease["worker"]))
+        task = _read_json(queue_path(queue_dir, "jobs", f"{task_id}.json"))
+        if task:
+            _give_up_if_exhausted(queue_dir, task, f"Lease lost on {lease['worker']}")
+    return reaped
+
+
+def _merge_segment_group(queue_dir, group):
+    """Concat a finished group's segments with the source audio and verify the frame count"""
+    job = group["job"]
+    tasks = [_read_json(queue_path(queue_dir, "jobs", f"{task_id}.json")) for task_id in group["tasks"]]
+    segment_dir = queue_path(queue_dir, "segments", group["id"])
+    list_path = os.path.join(segment_dir, "segments.txt")
+    write_concat_list([task["output"] for task in tasks], list_path)
+    output_path = job["output"]
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    run_ffmpeg(build_concat_command(list_path, job["input"], job["itsscale"], output_path), "concat",
+               encoder="copy", input_path=job["input"], output_path=output_path, live=False)
+    output_frames = count_video_frames(output_path)
+    if output_frames != group["frames"]:
+        raise RuntimeError(f"Frame count mismatch: source has {group['frames']} frames, output has {output_frames}")
+    # Also drops partial segments left by workers that died mid-encode
+    shutil.rmtree(segment_dir, ignore_errors=True)
+
+
+def _group_status(queue_dir, group, done):
+    results = [done.get(task_id) for task_id in group["tasks"]]
+    if any(result and result["status"] != "ok" for result in results):
+        return "failed", next(result["error"] for result in results if result and result["status"] != "ok")
+    return ("ready", None) if all(results) else ("running", None)
+
+
+def coordinate(queue_dir, file_tasks, groups, poll=DEFAULT_POLL_SECONDS, stop_workers=False):
+    """Reap expired leases, merge finished segment groups and wait until every task is settled
+
+    Returns a result per submitted file (whole-file tasks and merged groups).
+    """
+    pending = set(file_tasks) | {group["id"] for group in groups}
+    results = {}
+    start_time = time.time()
+    last_report = None
+    while pending:
+        for task_id, worker in reap_expired_leases(queue_dir):
+            print(f"⏰ Lease on {task_id} expired ({worker}); it will be retried")
+        done = {task_id: _read_json(queue_path(queue_dir, "done", f"{task_id}.json"))
+                for task_id in _records(queue_dir, "done")}
+        for task_id in list(pending):
+            if task_id in file_tasks and task_id in done:
+                results[task_id] = done[task_id]
+                pending.discard(task_id)
+        for group in groups:
+            if group["id"] not in pending:
+                continue
+            status, error = _group_status(queue_dir, group, done)
+            if status == "running":
+                continue
+            result = {"id": group["id"], "input": group["job"]["input"], "output": None, "status": "failed",
+                      "error": error, "worker": "coordinator", "segments": len(group["tasks"])}
+            if status == "ready":
+                try:
+                    _merge_segment_group(queue_dir, group)
+                    result.update(output=group["job"]["output"], status="ok", error=None)
+                except (OSError, RuntimeError) as e:
+                    result["error"] = str(e)
+            _write_json(queue_path(queue_dir, "done", f"{group['id']}.json"), result)
+            results[group["id"]] = result
+            pending.discard(group["id"])
+
+        report = (len(results), len(_records(queue_dir, "leases")))
+        if report != last_report:
+            print(f"🛰️  {len(results)}/{len(results) + len(pending)} file(s) settled, "
+                  f"{report[1]} task(s) leased, {format_elapsed_time(time.time() - start_time)}")
+            last_report = report
+        if pending:
+            time.sleep(poll)
+
+    if stop_workers:
+        _write_json(os.path.join(queue_dir, STOP_FILE), {"stopped": time.time()})
+    return [results[task_id] for task_id in list(file_tasks) + [group["id"] for group in groups]]
+
+
+# --- Worker side ------------------------------------------------------------------------------
+
+def worker_capabilities():
+    """What this host can take: its encoders, NVENC and HandBrakeCLI, from its own capability probe"""
+    capabilities = ["libx264"] if "libx264" in get_capabilities()["ffmpeg"]["encoders"] else []
+    # An ffmpeg build with h264_nvenc is not enough; select_encoder also checks for a working GPU
+    if select_encoder() == "h264_nvenc":
+        capabilities.extend(["h264_nvenc", "nvenc"])
+    if handbrake_available():
+        capabilities.append("handbrake")
+    return capabilities
+
+
+class Lease:
+    """A claimed task; a background thread renews it until released or lost
+
+    The lease file is written once and renewed by touching it through the descriptor that created it,
+    so a heartbeat can neither bring back a reaped lease nor touch another worker's newer claim.
+    """
+
+    def __init__(self, queue_dir, task_id, worker_id, lease_seconds):
+        self.path = queue_path(queue_dir, "leases", f"{task_id}.json")
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.token = uuid.uuid4().hex[:12]
+        self.lost = False
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _record(self):
+        return {"task": self.task_id, "worker": self.worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+                "token": self.token, "lease_seconds": self.lease_seconds, "acquired": time.time()}
+
+    def acquire(self, heartbeat=True):
+        """Create the lease file exclusively; False if another worker holds the task"""
+        try:
+            self._fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.write(self._fd, json.dumps(self._record()).encode())
+        if heartbeat:
+            self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._thread.start()
+        return True
+
+    def renew(self):
+        """Restart the lease's expiry; False once it has been reaped"""
+        try:
+            if not _same_file(self.path, self._fd):
+                return False
+            # If the reaper moves the file right now, this touches the moved file and the reaper puts it back
+            os.utime(self._fd if os.utime in os.supports_fd else self.path)
+            return True
+        except OSError:
+            return False
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.renew():
+                # Reaped after a stall: someone else may be running the task now
+                self.lost = True
+                print(f"⚠️  Lease on {self.task_id} lost, abandoning it")
+                terminate_active_processes()
+                return
+
+    def release(self):
+        """Stop renewing and remove the lease (if it is still ours)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._fd is None:
+            return
+        try:
+            if _same_file(self.path, self._fd):
+                os.remove(self.path)
+        except OSError:
+            pass
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _claimable(queue_dir, capabilities, prefer_large):
+    """Unfinished, unleased tasks this worker can run, in the order it should take them"""
+    done = set(_records(queue_dir, "done"))
+    leased = set(_records(queue_dir, "leases"))
+    tasks = []
+    for task_id in _records(queue_dir, "jobs"):
+        if task_id in done or task_id in leased:
+            continue
+        task = _read_json(queue_path(queue_dir, "jobs", f"{task_id}.json"))
+        if task and all(requirement in capabilities for requirement in task["requires"]):
+            tasks.append(task)
+    # NVENC hosts take the biggest pieces first, CPU hosts start with the small ones
+    return sorted(tasks, key=lambda task: (-task["size"] if prefer_large else task["size"], task["created"]))
+
+
+def _run_segment_task(task):
+    segment = task["segment"]
+    filter_string = resolve_preset_filters(load_color_presets(), task["presets"])
+    temp_path = f"{task['output']}.{os.getpid()}.tmp.mp4"
+    cmd = build_segment_command(task["input"], segment, segment["seek_time"], filter_string, task["encoder"],
+                                task["quality"], os.cpu_count() or 1, temp_path)
+    try:
+        run_ffmpeg(cmd, f"segment {segment['index'] + 1}", encoder=task["encoder"], input_path=task["input"],
+                   output_path=temp_path, live=False)
+        os.replace(temp_path, task["output"])
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {"status": "ok", "output": task["output"], "error": None}
+
+
+def _run_file_task(task, scheduler):
+    result = run_job(task["job"], scheduler)
+    result.pop("metrics", None)
+    return result
+
+
+def run_worker(queue_dir, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS, poll=DEFAULT_POLL_SECONDS,
+               exit_when_idle=False):
+    """Claim and run tasks one at a time until the coordinator's stop file appears
+
+    Start one worker per concurrent encode a host should run (e.g. one per NVENC session).
+    """
+    init_queue(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    capabilities = worker_capabilities()
+    prefer_large = "nvenc" in capabilities
+    scheduler = ResourceScheduler(default_resource_limits())
+    worker_path = queue_path(queue_dir, "workers", f"{worker_id}.json")
+    stats = {"completed": 0, "failed": 0, "lost": 0}
+    print(f"👷 Worker {worker_id}: {', '.join(capabilities) or 'no encoders'} | queue {queue_dir}")
+
+    def report(state, task_id=None):
+        _write_json(worker_path, {"worker": worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+                                  "capabilities": capabilities, "state": state, "task": task_id,
+                                  "seen": time.time(), **stats})
+
+    started = time.time()
+    # Only a stop written after this worker started counts; earlier runs leave theirs behind
+    while (_read_json(os.path.join(queue_dir, STOP_FILE)) or {"stopped": 0})["stopped"] < started:
+        report("idle")
+        reap_expired_leases(queue_dir)
+        lease = task = None
+        for candidate in _claimable(queue_dir, capabilities, prefer_large):
+            lease = Lease(queue_dir, candidate["id"], worker_id, lease_seconds)
+            if lease.acquire():
+                task = candidate
+                break
+        if task is None:
+            if exit_when_idle and not _records(queue_dir, "leases"):
+                break
+            time.sleep(poll)
+            continue
+
+        report("busy", task["id"])
+        print(f"▶️  {worker_id}: {task['id']}")
+        start_time = time.time()
+        try:
+            result = _run_segment_task(task) if task["kind"] == "segment" else _run_file_task(task, scheduler)
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        if lease.lost:
+            lease.release()
+            stats["lost"] += 1
+            continue
+
+        result.update(id=task["id"], worker=worker_id, elapsed=time.time() - start_time, finished=time.time())
+        if result["status"] == "ok":
+            _write_json(queue_path(queue_dir, "done", f"{task['id']}.json"), result)
+            stats["completed"] += 1
+            print(f"✅ {worker_id}: {task['id']} in {format_elapsed_time(result['elapsed'])}")
+        else:
+            _write_json(queue_path(queue_dir, "failures", f"{task['id']}.{lease.token}.json"), result)
+            stats["failed"] += 1
+            retried = not _give_up_if_exhausted(queue_dir, task, result["error"])
+            print(f"❌ {worker_id}: {task['id']} failed ({result['error']})" + ("; will be retried" if retried else ""))
+        lease.release()
+
+    report("stopped")
+    print(f"👷 Worker {worker_id} stopped: {stats['completed']} done, {stats['failed']} failed, {stats['lost']} lost")
+    return stats
+
+
+# --- Status -----------------------------------------------------------------------------------
+
+def queue_status(queue_dir):
+    """Counts of queued, leased, finished and failed tasks plus the last report of every worker"""
+    done = [_read_json(queue_path(queue_dir, "done", f"{task_id}.json")) for task_id in _records(queue_dir, "done")]
+    return {
+        "tasks": len(_records(queue_dir, "jobs")),
+        "leased": len(_records(queue_dir, "leases")),
+        "done": sum(1 for result in done if result and result["status"] == "ok"),
+        "failed": sum(1 for result in done if result and result["status"] != "ok"),
+        "expired": len(_records(queue_dir, "expired")),
+        "workers": [_read_json(queue_path(queue_dir, "workers", f"{name}.json"))
+                    for name in _records(queue_dir, "workers")]
+    }
+
+
+def print_queue_status(status):
+    """Queue counters and a line per worker"""
+    print(f"🛰️  Tasks: {status['tasks']} | leased {status['leased']} | done {status['done']} | "
+          f"failed {status['failed']} | expired leases {status['expired']}")
+    now = time.time()
+    for worker in status["workers"]:
+        if not worker:
+            continue
+        task = f" on {worker['task']}" if worker.get("task") else ""
+        print(f"   👷 {worker['worker']:<28} {worker['state']}{task} | {', '.join(worker['capabilities'])} | "
+              f"{worker['completed']} done, {worker['failed']} failed | seen {now - worker['seen']:.0f}s ago")
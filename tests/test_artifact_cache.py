@@ -0,0 +1,64 @@
+"""
+Artifact cache: eviction and clearing must not remove files a running job or writer still needs
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from modules import artifact_cache
+from modules.cache_utils import CACHE_ROOT_ENV
+
+
+class ArtifactPinTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp(prefix="artifact_test_")
+        patcher = mock.patch.dict(os.environ, {CACHE_ROOT_ENV: self.cache_root, artifact_cache.BUDGET_ENV: "0"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def produce(self, path):
+        with open(path, "wb") as f:
+            f.write(b"\0" * 1000)
+
+    def test_pinned_artifact_survives_later_stores(self):
+        first = artifact_cache.cached_stage("a" * 64, "filters", self.produce, pin=True)
+        # With a zero budget every store evicts whatever is not protected
+        artifact_cache.cached_stage("b" * 64, "filters", self.produce)
+        artifact_cache.cached_stage("c" * 64, "filters", self.produce)
+        self.assertTrue(os.path.exists(first))
+
+        artifact_cache.release_artifact("a" * 64)
+        artifact_cache.cached_stage("d" * 64, "filters", self.produce)
+        self.assertFalse(os.path.exists(first))
+
+    def test_lookup_pin_is_released_on_miss(self):
+        self.assertIsNone(artifact_cache.lookup_artifact("e" * 64, pin=True))
+        self.assertNotIn("e" * 64, artifact_cache._pins)
+
+    def test_clear_keeps_temp_files_of_running_writers(self):
+        artifact_cache.cached_stage("f" * 64, "filters", self.produce)
+        cache_dir = artifact_cache._artifact_dir()
+        finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                  capture_output=True, text=True).stdout.strip()
+        live = os.path.join(cache_dir, f"{'g' * 64}.{os.getpid()}.1.tmp.mp4")
+        dead = os.path.join(cache_dir, f"{'h' * 64}.{finished}.1.tmp.mp4")
+        for path in (live, dead):
+            self.produce(path)
+
+        removed, _ = artifact_cache.clear_artifacts()
+        self.assertEqual(removed, 1)
+        self.assertTrue(os.path.exists(live))
+        self.assertFalse(os.path.exists(dead))
+        self.assertEqual(artifact_cache.list_artifacts(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""
+Batch processor: jobs sharing an output directory never share output or intermediate names
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from modules.batch_processor import build_jobs, _final_output_path, _new_job_context
+
+
+class JobNamingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="batch_test_")
+        self.output_dir = os.path.join(self.root, "out")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def jobs(self, *inputs):
+        entries = [{"input": os.path.join(self.root, path)} for path in inputs]
+        return build_jobs(entries, ["low_brightness"], 2.0, False, self.output_dir)
+
+    def test_unique_basenames_keep_their_names(self):
+        jobs = self.jobs("a/clip.mp4", "b/other.mp4")
+        self.assertEqual([job["base"] for job in jobs], ["clip", "other"])
+
+    def test_same_basename_from_different_directories_gets_distinct_outputs(self):
+        jobs = self.jobs("a/clip.mp4", "b/clip.mp4", "c/Clip.mov")
+        bases = [job["base"] for job in jobs]
+        self.assertEqual(len(set(base.lower() for base in bases)), 3)
+        self.assertTrue(all(base.lower().startswith("clip_") for base in bases))
+        outputs = {_final_output_path(_new_job_context(job), compressed) for job in jobs for compressed in (False, True)}
+        self.assertEqual(len(outputs), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
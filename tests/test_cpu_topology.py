@@ -0,0 +1,47 @@
+"""
+CPU topology: per-process CPU sets keep SMT siblings and NUMA nodes together, and are shared only when
+there are more processes than cores
+"""
+import unittest
+
+from modules.cpu_topology import CpuAllocator, partition_cpus
+
+# Two NUMA nodes with two SMT cores each
+TOPOLOGY = {"nodes": [[[0, 4], [1, 5]], [[2, 6], [3, 7]]], "cpus": 8, "source": "sysfs"}
+
+
+class PartitionTest(unittest.TestCase):
+
+    def test_sets_are_disjoint_up_to_the_core_count(self):
+        for parts in (1, 2, 3, 4):
+            sets = partition_cpus(TOPOLOGY, parts)
+            cpus = [cpu for allocation in sets for cpu in allocation["cpus"]]
+            self.assertEqual(len(sets), parts)
+            self.assertEqual(len(cpus), len(set(cpus)))
+
+    def test_sets_stay_on_one_node_and_keep_siblings(self):
+        for allocation in partition_cpus(TOPOLOGY, 4):
+            self.assertEqual(len(allocation["nodes"]), 1)
+            self.assertEqual(allocation["cpus"][1] - allocation["cpus"][0], 4)
+
+    def test_more_parts_than_cores_share_sets_round_robin(self):
+        sets = partition_cpus(TOPOLOGY, 6)
+        distinct = {id(allocation) for allocation in sets}
+        self.assertEqual(len(sets), 6)
+        self.assertEqual(len(distinct), 4)
+        self.assertIs(sets[4], sets[0])
+        self.assertIs(sets[5], sets[1])
+        # Sharing never raises a process's thread budget past its set
+        self.assertTrue(all(allocation["threads"] == 2 for allocation in sets))
+
+    def test_allocator_hands_out_every_part_without_blocking(self):
+        allocator = CpuAllocator(6, topology=TOPOLOGY)
+        held = [allocator.acquire() for _ in range(6)]
+        self.assertEqual(allocator.free, [])
+        for allocation in held:
+            allocator.release(allocation)
+        self.assertEqual(len(allocator.free), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
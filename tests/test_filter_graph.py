@@ -0,0 +1,48 @@
+"""
+Filter graph: the optimized chain must render like the filters it replaces
+"""
+import itertools
+import unittest
+
+from modules.filter_graph import EqFilter, compile_preset_graph, parse_filter_chain, parse_graph, optimize_graph, render_graph
+from modules.lut_baker import evaluate_color_filters, split_preset_filters, np
+from modules.preset_manager import load_color_presets
+
+
+class EqMergeTest(unittest.TestCase):
+
+    def test_brightness_is_scaled_by_second_contrast(self):
+        merged = EqFilter("eq", {"contrast": "1.1", "brightness": "0.05"}).merge(
+            EqFilter("eq", {"contrast": "1.2", "brightness": "-0.04"}))
+        self.assertAlmostEqual(merged.params["contrast"], 1.32)
+        self.assertAlmostEqual(merged.params["brightness"], 1.2 * 0.05 - 0.04)
+
+    def test_no_merge_after_clipping_or_gamma(self):
+        clipping = EqFilter("eq", {"contrast": "1.15", "brightness": "0.25"})
+        self.assertIsNone(clipping.merge(EqFilter("eq", {"contrast": "1.04", "brightness": "0.07"})))
+        gamma = EqFilter("eq", {"gamma": "1.2"})
+        self.assertIsNone(gamma.merge(EqFilter("eq", {"contrast": "1.1"})))
+
+    def test_color_filters_do_not_merge_across_curves(self):
+        nodes = optimize_graph(parse_graph("eq=contrast=1.1,curves=all='0/0 0.5/0.6 1/1',eq=contrast=1.1"))
+        self.assertEqual([node.name for node in nodes], ["eq", "curves", "eq"])
+
+
+@unittest.skipIf(np is None, "NumPy is required to evaluate color filters")
+class CompiledGraphEquivalenceTest(unittest.TestCase):
+
+    def test_preset_combinations_match_in_order_evaluation(self):
+        presets = load_color_presets()
+        keys = [key for key in presets if key != "none" and not key.startswith("sharpness")]
+        grid = np.stack(np.meshgrid(*[np.linspace(0, 1, 9)] * 3, indexing="ij"), -1).reshape(-1, 3)
+        for combo in itertools.permutations(keys, 2):
+            color, _ = split_preset_filters(presets, combo)
+            compiled = [f for f in parse_filter_chain(render_graph(compile_preset_graph(presets, combo)))
+                        if f[0] != "unsharp"]
+            difference = np.abs(evaluate_color_filters(grid, color) - evaluate_color_filters(grid, compiled)).max()
+            # Merged values are rendered with three decimals: well under one 8-bit step
+            self.assertLess(difference * 255, 0.5, "+".join(combo))
+
+
+if __name__ == "__main__":
+    unittest.main()
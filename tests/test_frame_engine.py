@@ -0,0 +1,65 @@
+"""
+Frame engine: concurrent jobs building the same dense color table must not collide on the temp file
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from modules import frame_engine
+from modules.cache_utils import CACHE_ROOT_ENV
+from modules.preset_manager import load_color_presets
+
+
+@unittest.skipIf(frame_engine.np is None, "NumPy is required for the frame engine")
+class ConcurrentDenseTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp(prefix="engine_test_")
+        patcher = mock.patch.dict(os.environ, {CACHE_ROOT_ENV: self.cache_root})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def test_threads_building_the_same_table_all_succeed(self):
+        threads = 4
+        barrier = threading.Barrier(threads)
+
+        def small_table(color_filters):
+            # Every thread is past the cache check before any of them saves; the real table is 48 MiB
+            barrier.wait()
+            return frame_engine.np.zeros((8, 3), dtype=frame_engine.np.uint8)
+
+        replace = os.replace
+
+        def replace_together(source, target):
+            # ...and every thread has saved its file before any of them renames it
+            barrier.wait()
+            replace(source, target)
+
+        results, errors = [], []
+
+        def build():
+            try:
+                results.append(frame_engine.dense_table_path(load_color_presets(), ["low_brightness"]))
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(frame_engine, "build_dense_table", side_effect=small_table), \
+                mock.patch.object(frame_engine.os, "replace", side_effect=replace_together):
+            workers = [threading.Thread(target=build) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(results)), 1)
+        self.assertTrue(os.path.exists(results[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+LUT baker: concurrent jobs baking the same composite LUT must not collide on the temp file
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from modules import lut_baker
+from modules.cache_utils import CACHE_ROOT_ENV
+from modules.preset_manager import load_color_presets
+
+
+@unittest.skipIf(lut_baker.np is None, "NumPy is required to bake LUTs")
+class ConcurrentBakeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp(prefix="lut_test_")
+        patcher = mock.patch.dict(os.environ, {CACHE_ROOT_ENV: self.cache_root})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def test_threads_baking_the_same_lut_all_succeed(self):
+        threads = 4
+        barrier = threading.Barrier(threads)
+        write_cube = lut_baker.write_cube
+
+        def write_together(*args, **kwargs):
+            # Every thread is past the cache check before any of them writes
+            barrier.wait()
+            write_cube(*args, **kwargs)
+
+        results, errors = [], []
+
+        def bake():
+            try:
+                results.append(lut_baker.bake_preset_lut(load_color_presets(), ["low_brightness", "medium_brightness"],
+                                                         size=9))
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(lut_baker, "write_cube", side_effect=write_together):
+            workers = [threading.Thread(target=bake) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(results)), 1)
+        self.assertTrue(os.path.exists(results[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Media catalog: vanished files become row errors instead of aborting a scan; path filters match literally
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from modules import media_catalog
+
+
+class VanishedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.library = tempfile.mkdtemp(prefix="catalog_test_")
+        self.path = os.path.join(self.library, "gone.mp4")
+
+    def tearDown(self):
+        shutil.rmtree(self.library, ignore_errors=True)
+
+    def test_probe_records_missing_file_as_error(self):
+        row = asyncio.run(media_catalog.probe_file_async(self.path, asyncio.Semaphore(1)))
+        self.assertEqual(row["path"], self.path)
+        self.assertIsNotNone(row["error"])
+
+    def test_missing_catalogued_file_is_reprobed(self):
+        existing = {"size": 10, "mtime_ns": 1, "keyframes": None, "error": None}
+        self.assertTrue(media_catalog._needs_probe(existing, self.path, False))
+
+
+class PathFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.library = tempfile.mkdtemp(prefix="catalog_test_")
+        self.db_path = os.path.join(self.library, "catalog.sqlite")
+        conn = media_catalog.connect(self.db_path)
+        for path in ("/lib/100%_done/a.mp4", "/lib/1000_done/b.mp4", "/lib/100x done/c.mp4", "/lib/back\\slash/d.mp4"):
+            media_catalog._store_row(conn, {"path": path, "size": 1, "mtime_ns": 1, "probed_at": 0.0,
+                                            **media_catalog._row_fields({}), "keyframes": None, "error": None})
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.library, ignore_errors=True)
+
+    def paths(self, path_contains):
+        return [row["path"] for row in media_catalog.query_catalog(self.db_path, path_contains=path_contains)]
+
+    def test_wildcard_characters_match_literally(self):
+        self.assertEqual(self.paths("100%_"), ["/lib/100%_done/a.mp4"])
+        self.assertEqual(self.paths("0_d"), ["/lib/1000_done/b.mp4"])
+        self.assertEqual(self.paths("k\\s"), ["/lib/back\\slash/d.mp4"])
+
+    def test_plain_substring_still_matches(self):
+        self.assertEqual(len(self.paths("done")), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
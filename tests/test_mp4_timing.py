@@ -0,0 +1,55 @@
+"""
+MP4 timing: malformed or truncated files must fall back to the FFmpeg remux instead of crashing the job
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from modules import ffmpeg_processor, mp4_timing
+
+
+def box(box_type, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+class MalformedInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="mp4_test_")
+        self.input_path = os.path.join(self.work_dir, "clip.mp4")
+        self.output_path = os.path.join(self.work_dir, "out.mp4")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def write(self, data):
+        with open(self.input_path, "wb") as f:
+            f.write(data)
+
+    def test_truncated_mvhd_is_unsupported_layout(self):
+        # The mvhd box ends right after version/flags, before its timescale field
+        self.write(box(b"ftyp", b"isom\0\0\0\0") + box(b"moov", box(b"mvhd", b"\0\0\0\0")) + box(b"mdat", b"\0" * 16))
+        with self.assertRaises(mp4_timing.UnsupportedLayoutError):
+            mp4_timing.rewrite_itsscale(self.input_path, self.output_path, 2.0)
+        self.assertFalse(os.path.exists(self.output_path))
+
+    def test_truncated_large_size_header_is_unsupported_layout(self):
+        # A 64-bit size header cut off after the first 12 of its 16 bytes
+        self.write(box(b"ftyp", b"isom\0\0\0\0") + struct.pack(">I4sI", 1, b"mdat", 0))
+        with self.assertRaises(mp4_timing.UnsupportedLayoutError):
+            mp4_timing.rewrite_itsscale(self.input_path, self.output_path, 2.0)
+
+    def test_itsscale_falls_back_to_ffmpeg(self):
+        self.write(box(b"ftyp", b"isom\0\0\0\0") + box(b"moov", box(b"mvhd", b"\0\0\0\0")) + box(b"mdat", b"\0" * 16))
+        with mock.patch.object(ffmpeg_processor, "run_ffmpeg") as run_ffmpeg, \
+                mock.patch.object(ffmpeg_processor, "get_output_duration", return_value=1.0):
+            ffmpeg_processor.apply_itsscale_only(self.input_path, 2.0, self.output_path)
+        cmd = run_ffmpeg.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-itsscale") + 1], "2.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
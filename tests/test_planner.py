@@ -0,0 +1,39 @@
+"""
+Planner: HandBrake is only skipped when the output is a stream copy of a compact source
+"""
+import unittest
+from unittest import mock
+
+from modules import planner
+
+
+def compact_source():
+    # 1080p30 H.264 at 2 Mb/s: below the ~5 Mb/s compression target
+    return {"format": "mov,mp4,m4a,3gp,3g2,mj2", "duration": 10.0, "size": 2500000, "bit_rate": 2000000,
+            "video": {"codec": "h264", "width": 1920, "height": 1080, "fps": 30.0, "pix_fmt": "yuv420p",
+                      "bit_rate": 2000000, "nb_frames": 300},
+            "audio": [{"codec": "aac"}]}
+
+
+class PlanJobTest(unittest.TestCase):
+
+    def plan(self, filter_string):
+        with mock.patch.object(planner, "probe_media", return_value=compact_source()), \
+                mock.patch.object(planner, "resolve_preset_filters", return_value=filter_string), \
+                mock.patch.object(planner, "load_color_presets", return_value={}), \
+                mock.patch.object(planner, "select_encoder", return_value="libx264"):
+            return planner.plan_job("clip.mp4", ["preset"], use_handbrake=True)
+
+    def test_compact_source_without_filters_skips_handbrake(self):
+        plan = self.plan("")
+        self.assertEqual(plan["strategy"], "remux")
+        self.assertFalse(plan["use_handbrake"])
+
+    def test_filtered_job_keeps_handbrake_despite_compact_source(self):
+        plan = self.plan("eq=contrast=1.100")
+        self.assertEqual(plan["strategy"], "filter_compress")
+        self.assertTrue(plan["use_handbrake"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Scratch space: concurrent jobs on one volume share a reservation ledger instead of each seeing all free space
+"""
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from modules import scratch_space
+from modules.scratch_space import FREE_SPACE_MARGIN, ScratchSpace
+
+MB = 1024 ** 2
+Usage = collections.namedtuple("Usage", "total used free")
+
+
+class ReservationLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="scratch_test_")
+        # 10 MB usable on the scratch volume
+        patcher = mock.patch.object(scratch_space.shutil, "disk_usage",
+                                    return_value=Usage(0, 0, FREE_SPACE_MARGIN + 10 * MB))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def space(self, name):
+        space = ScratchSpace(name, root=self.root).open()
+        self.addCleanup(space.cleanup)
+        return space
+
+    def test_second_job_sees_the_first_jobs_reservation(self):
+        first, second = self.space("a"), self.space("b")
+        self.assertTrue(first.reserve(6 * MB))
+        self.assertEqual(second.available_bytes(), 4 * MB)
+        self.assertFalse(second.reserve(6 * MB))
+
+        first.cleanup()
+        self.assertTrue(second.reserve(6 * MB))
+
+    def test_written_bytes_are_not_counted_twice(self):
+        first, second = self.space("a"), self.space("b")
+        self.assertTrue(first.reserve(6 * MB))
+        # The mocked free space stays put; only the unwritten remainder of the reservation is held back
+        with open(first.path("filtered.mkv"), "wb") as f:
+            f.write(b"\0" * (2 * MB))
+        self.assertEqual(second.available_bytes(), 6 * MB)
+
+    def test_cleanup_releases_even_if_deleting_fails(self):
+        first, second = self.space("a"), self.space("b")
+        self.assertTrue(first.reserve(6 * MB))
+        with mock.patch.object(scratch_space.shutil, "rmtree", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                first.cleanup()
+        self.assertEqual(second.available_bytes(), 10 * MB)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+"""
+Startup time: the CLI's lightweight commands must start within the startup budget
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from modules.benchmark import DEFAULT_STARTUP_BUDGET, STARTUP_COMMANDS, measure_startup
+from modules.cache_utils import CACHE_ROOT_ENV
+
+
+class StartupBudgetTest(unittest.TestCase):
+
+    def test_commands_start_within_budget(self):
+        cache_root = tempfile.mkdtemp(prefix="startup_test_")
+        self.addCleanup(shutil.rmtree, cache_root, True)
+        # Child processes inherit the environment, so their caches stay out of the working tree
+        with mock.patch.dict(os.environ, {CACHE_ROOT_ENV: cache_root}):
+            report = measure_startup(STARTUP_COMMANDS, repeat=3, budget=DEFAULT_STARTUP_BUDGET)
+        for result in report["results"]:
+            self.assertEqual(result["returncode"], 0, result["command"])
+            self.assertLessEqual(result["seconds"], DEFAULT_STARTUP_BUDGET,
+                                 f"main.py {result['command']} took {result['seconds'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    unittest.main()
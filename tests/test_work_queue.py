@@ -0,0 +1,139 @@
+"""
+Work queue: capability routing of farm tasks, lease expiry, reclaiming and the attempt limit
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from modules import ffmpeg_processor, work_queue
+
+
+def fake_capabilities(encoders, gpu):
+    return {"ffmpeg": {"encoders": encoders, "filters": [], "available": True, "version": "test"},
+            "nvidia": {"available": gpu, "gpus": []},
+            "handbrake": {"available": False, "version": None}}
+
+
+class WorkQueueRoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue_dir = tempfile.mkdtemp(prefix="farm_test_")
+        work_queue.init_queue(self.queue_dir)
+        self.input_path = os.path.join(self.queue_dir, "clip.mp4")
+        with open(self.input_path, "wb") as f:
+            f.write(b"\0" * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.queue_dir, ignore_errors=True)
+
+    def worker(self, encoders, gpu):
+        """Capabilities of a simulated worker host"""
+        registry = fake_capabilities(encoders, gpu)
+        with mock.patch.object(work_queue, "get_capabilities", return_value=registry), \
+                mock.patch.object(ffmpeg_processor, "get_capabilities", return_value=registry), \
+                mock.patch.object(work_queue, "handbrake_available", return_value=False):
+            return work_queue.worker_capabilities()
+
+    def submit(self, group_id, encoder):
+        job = {"input": self.input_path, "presets": ["none"], "itsscale": 2.0, "output_dir": self.queue_dir}
+        info = {"start_time": 0.0, "video": {"fps": 30.0}}
+        # Two seconds at 30 fps with a keyframe every second: two segments
+        packets = [(i / 30, i % 30 == 0) for i in range(60)]
+        with mock.patch.object(work_queue, "probe_media", return_value=info), \
+                mock.patch.object(work_queue, "get_video_packets", return_value=packets):
+            return work_queue.submit_segment_group(self.queue_dir, group_id, job, 2, encoder=encoder)
+
+    def claimable(self, capabilities):
+        return [task["id"] for task in work_queue._claimable(self.queue_dir, capabilities, False)]
+
+    def test_cpu_only_host_with_nvenc_build_does_not_advertise_nvenc(self):
+        capabilities = self.worker(["libx264", "h264_nvenc"], gpu=False)
+        self.assertEqual(capabilities, ["libx264"])
+
+    def test_gpu_host_advertises_nvenc(self):
+        capabilities = self.worker(["libx264", "h264_nvenc"], gpu=True)
+        self.assertIn("nvenc", capabilities)
+        self.assertIn("h264_nvenc", capabilities)
+
+    def test_nvenc_segments_skip_cpu_only_worker(self):
+        nvenc_group = self.submit("nv", "h264_nvenc")
+        cpu_group = self.submit("cpu", "libx264")
+        cpu_worker = self.worker(["libx264", "h264_nvenc"], gpu=False)
+        gpu_worker = self.worker(["libx264", "h264_nvenc"], gpu=True)
+
+        self.assertEqual(sorted(self.claimable(cpu_worker)), sorted(cpu_group["tasks"]))
+        self.assertEqual(sorted(self.claimable(gpu_worker)), sorted(cpu_group["tasks"] + nvenc_group["tasks"]))
+
+
+class LeaseLifecycleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue_dir = tempfile.mkdtemp(prefix="farm_test_")
+        work_queue.init_queue(self.queue_dir)
+        input_path = os.path.join(self.queue_dir, "clip.mp4")
+        with open(input_path, "wb") as f:
+            f.write(b"\0" * 100)
+        self.task = work_queue.submit_file_task(self.queue_dir, "clip", {"input": input_path}, max_attempts=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.queue_dir, ignore_errors=True)
+
+    def claim(self, worker_id):
+        # Heartbeats are driven by hand so the tests decide when a lease goes stale
+        lease = work_queue.Lease(self.queue_dir, "clip", worker_id, lease_seconds=60)
+        self.assertTrue(lease.acquire(heartbeat=False))
+        self.addCleanup(lease.release)
+        return lease
+
+    def expire(self):
+        return work_queue.reap_expired_leases(self.queue_dir, now=time.time() + 120)
+
+    def test_live_lease_is_not_reaped_and_blocks_other_claims(self):
+        self.claim("a")
+        self.assertEqual(work_queue.reap_expired_leases(self.queue_dir), [])
+        self.assertFalse(work_queue.Lease(self.queue_dir, "clip", "b", 60).acquire(heartbeat=False))
+        self.assertEqual(work_queue._claimable(self.queue_dir, ["libx264"], False), [])
+
+    def test_expired_lease_is_reclaimed_and_old_holder_cannot_renew(self):
+        old = self.claim("a")
+        self.assertEqual(self.expire(), [("clip", "a")])
+        self.assertFalse(old.renew())
+        self.assertEqual([task["id"] for task in work_queue._claimable(self.queue_dir, ["libx264"], False)], ["clip"])
+
+        new = self.claim("b")
+        renewed = os.path.getmtime(new.path)
+        self.assertFalse(old.renew())
+        old.release()
+        # The stale holder neither touched nor removed the new claim
+        self.assertTrue(os.path.exists(new.path))
+        self.assertEqual(os.path.getmtime(new.path), renewed)
+        self.assertTrue(new.renew())
+
+    def test_renewal_racing_the_reaper_keeps_the_lease(self):
+        lease = self.claim("a")
+        rename = os.rename
+
+        def renew_during_reap(source, target):
+            rename(source, target)
+            os.utime(target, (time.time() + 5, time.time() + 5))
+
+        with mock.patch.object(work_queue.os, "rename", side_effect=renew_during_reap):
+            self.assertEqual(self.expire(), [])
+        self.assertTrue(lease.renew())
+        self.assertEqual(os.listdir(work_queue.queue_path(self.queue_dir, "expired")), [])
+
+    def test_task_fails_after_max_attempts(self):
+        for worker_id in ("a", "b"):
+            self.claim(worker_id)
+            self.expire()
+        done = work_queue._read_json(work_queue.queue_path(self.queue_dir, "done", "clip.json"))
+        self.assertEqual(done["status"], "failed")
+        self.assertIn("after 2 attempt(s)", done["error"])
+        self.assertEqual(work_queue._claimable(self.queue_dir, ["libx264"], False), [])
+
+
+if __name__ == "__main__":
+    unittest.main()